@@ -0,0 +1,396 @@
+"""Archive froide : messages anciens sortis de `messages`, en segments compressés par room.
+
+Seules les dernières heures d'une room sont lues souvent ; le reste de l'historique conservé
+(jusqu'à GLOBAL_MESSAGE_TTL_MIN) gonflait l'arbre B de `messages` et son cache de pages. Le
+leader déplace donc les messages plus vieux que ARCHIVE_HOT_MIN dans des fichiers :
+
+    ARCHIVE_DIR/<h[:2]>/<h>/<premier id>-<aléa>.seg        h = sha1(room_id)
+
+- Un segment = une tranche de l'historique d'une room (au plus SEGMENT_MAX_MESSAGES messages,
+  SEGMENT_MAX_SPAN entre le premier et le dernier), écrit une seule fois (fichier temporaire,
+  fsync, rename) puis jamais modifié.
+- Contenu : blocs zlib de BLOCK_MESSAGES messages (JSON ; `content` reste chiffré Fernet), puis
+  un petit index (position, taille, bornes de dates et d'ids de chaque bloc) et une fin fixe.
+  Lecture par mmap : seuls l'index et les blocs utiles sont lus et décompressés.
+- Index en base (`archive_segments`, avec expéditeurs et pièces jointes) dans le stockage des
+  messages de la room (base principale ou son shard) : même session que l'historique chaud.
+- Tout message archivé est plus ancien que tout message chaud (la limite ne fait qu'avancer) :
+  l'historique lit l'archive d'abord, puis complète avec `messages`.
+- Les jetons de recherche restent dans `message_tokens`. La purge TTL supprime un segment entier
+  quand son message le plus récent a dépassé le TTL, soit au plus SEGMENT_MAX_SPAN (la cadence
+  de la purge) de retard. Entre-temps, lectures et exports écartent les messages expirés.
+- Fichiers supprimés après le commit : une interruption laisse au pire un fichier orphelin.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from .config import ARCHIVE_DIR, GLOBAL_MESSAGE_TTL_MIN
+from .models import ArchiveAttachment, ArchiveSegment, ArchiveSender, Message, MessageToken
+from .shards import message_dbs
+
+logger = logging.getLogger(__name__)
+
+BLOCK_MESSAGES = 256  # messages par bloc compressé (unité de lecture)
+SEGMENT_MAX_MESSAGES = 20_000
+SEGMENT_MAX_SPAN = timedelta(hours=1)  # cadence de la purge TTL (app/main.py)
+_BATCH = 500  # ids par IN (...)
+_MAGIC = b"OCSEG01\n"
+_TRAILER = struct.Struct("<Q8s")  # taille de l'index JSON, magique
+_EPOCH = datetime(1970, 1, 1)
+
+# Ligne d'un bloc : [id, sender_id, created_at (µs UTC), content chiffré, attachment_id]
+_Row = list
+
+
+class ArchivedMessage(NamedTuple):
+    """Message lu dans un segment : mêmes attributs qu'un Message pour la mise en forme."""
+
+    id: int
+    room_id: str
+    sender_id: int
+    content: str
+    created_at: datetime
+    attachment_id: Optional[int]
+
+
+def _to_us(dt: datetime) -> int:
+    """Microsecondes depuis l'époque ; les dates lues dans SQLite sont naïves (UTC)."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=us)  # naïve UTC, comme une lecture SQLite
+
+
+def _message(room_id: str, row: _Row) -> ArchivedMessage:
+    return ArchivedMessage(row[0], room_id, row[1], row[3], _from_us(row[2]), row[4])
+
+
+def _live_from(since: Optional[datetime] = None) -> Optional[int]:
+    """Première date (µs) servie : `since` et le TTL (un message expiré n'est plus lu, même
+    avant le passage de la purge). None : pas de borne."""
+    bounds = [] if since is None else [_to_us(since)]
+    if GLOBAL_MESSAGE_TTL_MIN > 0:
+        deadline = datetime.now(timezone.utc) - timedelta(minutes=GLOBAL_MESSAGE_TTL_MIN)
+        bounds.append(_to_us(deadline) + 1)  # la purge supprime created_at <= deadline
+    return max(bounds, default=None)
+
+
+def _by_span(rows: list[_Row]) -> Iterator[list[_Row]]:
+    """Découpe des lignes triées par date en tranches d'au plus SEGMENT_MAX_SPAN."""
+    span = SEGMENT_MAX_SPAN // timedelta(microseconds=1)
+    start = 0
+    for i in range(1, len(rows) + 1):
+        if i == len(rows) or rows[i][2] >= rows[start][2] + span:
+            yield rows[start:i]
+            start = i
+
+
+def _chunks(ids: list[int]) -> Iterator[list[int]]:
+    for start in range(0, len(ids), _BATCH):
+        stop = start + _BATCH
+        yield ids[start:stop]
+
+
+# ─────────────────────────── Fichiers segments ───────────────────────────
+def _room_dir(room_id: str) -> str:
+    digest = hashlib.sha1(room_id.encode("utf-8")).hexdigest()
+    return os.path.join(digest[:2], digest)
+
+
+def _fsync_dir(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_segment(room_id: str, rows: list[_Row]) -> tuple[str, int]:
+    """Écrit un segment (lignes triées par date puis id) ; renvoie (chemin relatif, taille)."""
+    rel_dir = _room_dir(room_id)
+    directory = os.path.join(ARCHIVE_DIR, rel_dir)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{rows[0][0]}-{uuid.uuid4().hex[:8]}.seg"
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    blocks = []
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        for start in range(0, len(rows), BLOCK_MESSAGES):
+            stop = start + BLOCK_MESSAGES
+            block = rows[start:stop]
+            data = zlib.compress(json.dumps(block, separators=(",", ":")).encode("utf-8"))
+            ids = [r[0] for r in block]
+            # [position, taille, nb, première date, dernière date, id min, id max]
+            bounds = [len(block), block[0][2], block[-1][2], min(ids), max(ids)]
+            blocks.append([f.tell(), len(data), *bounds])
+            f.write(data)
+        index = json.dumps({"room_id": room_id, "blocks": blocks}).encode("utf-8")
+        f.write(index)
+        f.write(_TRAILER.pack(len(index), _MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp_path, os.path.join(directory, name))
+    _fsync_dir(directory)
+    return os.path.join(rel_dir, name), size
+
+
+def _read_rows(path: str, keep: Callable[[list], bool] = lambda bounds: True) -> list[_Row]:
+    """Lignes des blocs dont les bornes [nb, date min, date max, id min, id max] passent `keep`.
+    Fichier absent (sauvegarde incomplète…) : journalisé, lu comme vide."""
+    try:
+        f = open(os.path.join(ARCHIVE_DIR, path), "rb")
+    except FileNotFoundError:
+        logger.error("Segment d'archive introuvable : %s", path)
+        return []
+    rows: list[_Row] = []
+    with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm) - _TRAILER.size
+        index_len, magic = _TRAILER.unpack_from(mm, end)
+        if magic != _MAGIC or mm[: len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Segment d'archive invalide : {path}")
+        start = end - index_len
+        for offset, length, *bounds in json.loads(mm[start:end])["blocks"]:
+            if keep(bounds):
+                stop = offset + length
+                rows.extend(json.loads(zlib.decompress(mm[offset:stop])))
+    return rows
+
+
+def remove_files(paths: Iterable[str]) -> None:
+    """Supprime des segments (après commit) et les dossiers de room devenus vides."""
+    for path in paths:
+        full = os.path.join(ARCHIVE_DIR, path)
+        try:
+            os.remove(full)
+            os.rmdir(os.path.dirname(full))
+        except OSError:
+            pass  # déjà absent, ou dossier encore utilisé
+
+
+# ─────────────────────────── Index en base ───────────────────────────
+def _add_segment(mdb: Session, room_id: str, rows: list[_Row]) -> str:
+    """Écrit le fichier et l'indexe (dans la transaction de l'appelant) ; renvoie son chemin."""
+    path, size = write_segment(room_id, rows)
+    ids = [r[0] for r in rows]
+    segment = ArchiveSegment(
+        room_id=room_id,
+        path=path,
+        first_id=min(ids),
+        last_id=max(ids),
+        first_at=_from_us(rows[0][2]),
+        last_at=_from_us(rows[-1][2]),
+        count=len(rows),
+        size=size,
+    )
+    mdb.add(segment)
+    mdb.flush()
+    senders = sorted({r[1] for r in rows})
+    mdb.execute(
+        insert(ArchiveSender), [{"segment_id": segment.id, "sender_id": s} for s in senders]
+    )
+    attachments = sorted({r[4] for r in rows if r[4] is not None})
+    if attachments:
+        mdb.execute(
+            insert(ArchiveAttachment),
+            [{"segment_id": segment.id, "attachment_id": a} for a in attachments],
+        )
+    return path
+
+
+def _drop_segments(mdb: Session, segment_ids: list[int]) -> None:
+    for chunk in _chunks(segment_ids):
+        mdb.execute(delete(ArchiveSender).where(ArchiveSender.segment_id.in_(chunk)))
+        mdb.execute(delete(ArchiveAttachment).where(ArchiveAttachment.segment_id.in_(chunk)))
+        mdb.execute(delete(ArchiveSegment).where(ArchiveSegment.id.in_(chunk)))
+
+
+def _drop_tokens(mdb: Session, message_ids: list[int]) -> None:
+    for chunk in _chunks(message_ids):
+        mdb.execute(delete(MessageToken).where(MessageToken.message_id.in_(chunk)))
+
+
+# ─────────────────────────── Lecture ───────────────────────────
+def room_history(
+    mdb: Session, room_id: str, since: Optional[datetime], limit: int
+) -> list[ArchivedMessage]:
+    """Début (≤ limit messages) de l'historique chronologique de la room pris dans l'archive."""
+    stmt = select(ArchiveSegment.path, ArchiveSegment.first_at).where(
+        ArchiveSegment.room_id == room_id
+    )
+    since_us = _live_from(since)
+    if since_us is not None:
+        stmt = stmt.where(ArchiveSegment.last_at >= _from_us(since_us))
+    out: list[ArchivedMessage] = []
+    for path, first_at in mdb.execute(stmt.order_by(ArchiveSegment.first_at, ArchiveSegment.id)):
+        # Segments d'une room quasi disjoints dans le temps : arrêt dès que le suivant commence
+        # après le dernier message retenu
+        if len(out) >= limit and first_at > out[-1].created_at:
+            break
+        if since_us is None:
+            rows = _read_rows(path)
+        else:
+            rows = [r for r in _read_rows(path, lambda b: b[2] >= since_us) if r[2] >= since_us]
+        out.extend(_message(room_id, r) for r in rows)
+        out.sort(key=lambda m: (m.created_at, m.id))
+        del out[limit:]
+    return out
+
+
+def load_ids(mdb: Session, room_id: str, ids: Iterable[int]) -> list[ArchivedMessage]:
+    """Messages archivés de la room parmi `ids` (résultats de recherche)."""
+    wanted = set(ids)
+    if not wanted:
+        return []
+    lo, hi = min(wanted), max(wanted)
+    stmt = select(ArchiveSegment.path).where(
+        ArchiveSegment.room_id == room_id,
+        ArchiveSegment.first_id <= hi,
+        ArchiveSegment.last_id >= lo,
+    )
+    live_us = _live_from() or 0
+    if live_us:
+        stmt = stmt.where(ArchiveSegment.last_at >= _from_us(live_us))
+    out: list[ArchivedMessage] = []
+    for path in mdb.scalars(stmt).all():
+        rows = _read_rows(path, lambda b: b[3] <= hi and b[4] >= lo and b[2] >= live_us)
+        out.extend(_message(room_id, r) for r in rows if r[0] in wanted and r[2] >= live_us)
+    return out
+
+
+def iter_archived(
+    mdb: Session, room_id: Optional[str] = None, sender_id: Optional[int] = None
+) -> Iterator[ArchivedMessage]:
+    """Messages archivés non expirés (export), un segment en mémoire à la fois.
+    Une room : ordre chronologique ; sinon segment par segment (ordre du premier id)."""
+    stmt = select(ArchiveSegment.room_id, ArchiveSegment.path)
+    live_us = _live_from() or 0
+    if live_us:
+        stmt = stmt.where(ArchiveSegment.last_at >= _from_us(live_us))
+    if sender_id is not None:
+        stmt = stmt.where(
+            ArchiveSegment.id.in_(
+                select(ArchiveSender.segment_id).where(ArchiveSender.sender_id == sender_id)
+            )
+        )
+    if room_id is not None:
+        stmt = stmt.where(ArchiveSegment.room_id == room_id)
+        stmt = stmt.order_by(ArchiveSegment.first_at, ArchiveSegment.id)
+    else:
+        stmt = stmt.order_by(ArchiveSegment.first_id)
+    for seg_room, path in mdb.execute(stmt).all():
+        for row in _read_rows(path, lambda b: b[2] >= live_us):
+            if row[2] >= live_us and (sender_id is None or row[1] == sender_id):
+                yield _message(seg_room, row)
+
+
+# ─────────────────────────── Écriture (leader, admin) ───────────────────────────
+def archive_room(mdb: Session, room_id: str, older_than: datetime) -> int:
+    """Déplace les messages de la room plus vieux que `older_than` en segment(s) d'au plus
+    SEGMENT_MAX_SPAN ; un commit par segment. Renvoie le nombre de messages déplacés."""
+    # messages est en AUTOINCREMENT (base principale et shards) : les identifiants archivés
+    # ne sont jamais réattribués, même une fois la table vidée
+    moved = 0
+    while True:
+        batch = mdb.execute(
+            select(
+                Message.id,
+                Message.sender_id,
+                Message.created_at,
+                Message.content,
+                Message.attachment_id,
+            )
+            .where(
+                Message.room_id == room_id,
+                Message.created_at < older_than,
+            )
+            .order_by(Message.created_at, Message.id)
+            .limit(SEGMENT_MAX_MESSAGES)
+        ).all()
+        if not batch:
+            return moved
+        rows = [
+            [m.id, m.sender_id, _to_us(m.created_at), m.content, m.attachment_id] for m in batch
+        ]
+        # Tranches bornées dans le temps : la purge TTL, par segment entier, reste précise
+        for span in _by_span(rows):
+            path = _add_segment(mdb, room_id, span)
+            for chunk in _chunks([r[0] for r in span]):
+                mdb.execute(delete(Message).where(Message.id.in_(chunk)))
+            try:
+                mdb.commit()
+            except Exception:
+                mdb.rollback()
+                remove_files([path])
+                raise
+            moved += len(span)
+
+
+def archive_messages(db: Session, older_than: datetime) -> int:
+    """Une passe de l'archiveur sur tout le stockage des messages ; renvoie le nombre déplacé."""
+    moved = 0
+    for mdb in message_dbs(db):
+        rooms = mdb.scalars(
+            select(Message.room_id).where(Message.created_at < older_than).distinct()
+        ).all()
+        for room_id in rooms:
+            moved += archive_room(mdb, room_id, older_than)
+    return moved
+
+
+def purge_segments(mdb: Session, deadline: datetime) -> int:
+    """Purge TTL : supprime les segments dont le message le plus récent date d'avant
+    `deadline`, avec les jetons de recherche de leurs messages. Valide (commit) elle-même.
+    Renvoie le nombre de messages supprimés."""
+    expired = mdb.execute(
+        select(ArchiveSegment.id, ArchiveSegment.path, ArchiveSegment.count).where(
+            ArchiveSegment.last_at <= deadline
+        )
+    ).all()
+    if not expired:
+        return 0
+    if mdb.scalar(select(MessageToken.message_id).limit(1)) is not None:
+        for seg in expired:
+            _drop_tokens(mdb, [r[0] for r in _read_rows(seg.path)])
+    _drop_segments(mdb, [seg.id for seg in expired])
+    mdb.commit()
+    remove_files(seg.path for seg in expired)
+    return sum(seg.count for seg in expired)
+
+
+def drop_sender(mdb: Session, sender_id: int) -> list[str]:
+    """Retire les messages archivés d'un expéditeur : chaque segment concerné est réécrit sans
+    eux (ou supprimé). Dans la transaction de l'appelant ; renvoie les fichiers à supprimer
+    (`remove_files`) après son commit."""
+    segments = mdb.execute(
+        select(ArchiveSegment.id, ArchiveSegment.room_id, ArchiveSegment.path).where(
+            ArchiveSegment.id.in_(
+                select(ArchiveSender.segment_id).where(ArchiveSender.sender_id == sender_id)
+            )
+        )
+    ).all()
+    for seg in segments:
+        rows = _read_rows(seg.path)
+        _drop_tokens(mdb, [r[0] for r in rows if r[1] == sender_id])
+        kept = [r for r in rows if r[1] != sender_id]
+        if kept:
+            _add_segment(mdb, seg.room_id, kept)
+    _drop_segments(mdb, [seg.id for seg in segments])
+    return [seg.path for seg in segments]
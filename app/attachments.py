@@ -0,0 +1,205 @@
+"""Magasin de pièces jointes (ATTACHMENTS_DIR) : les fichiers ne passent plus par `messages`.
+
+Disposition sur disque :
+    uploads/<upload_id>/<index:06d>              blocs reçus d'un envoi en cours
+    blobs/<sha[:2]>/<sha>.<upload_id>/<index:06d> blob finalisé, immuable
+- Chaque bloc clair fait ATTACHMENT_CHUNK_SIZE octets (le dernier est plus court) et est chiffré
+  seul (Fernet) : une lecture partielle (Range) ne déchiffre que les blocs concernés.
+- Adressage par contenu : sha256 du clair, calculé par le serveur à la finalisation. Un contenu
+  déjà présent n'est pas stocké deux fois. Le client l'envoie quand même : connaître un hash ne
+  prouve pas qu'on possède le fichier.
+- Dossier de blob unique (suffixe upload_id) : le ramasse-miettes ne supprime que le dossier
+  des lignes que sa transaction a retirées, sans course avec un envoi concurrent du même contenu.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .config import ATTACHMENTS_DIR
+from .crypto import decrypt_chunk, encrypt_chunk
+from .models import ArchiveAttachment, Attachment, AttachmentUpload, Blob, Message
+from .shards import SHARDED, message_dbs
+
+_GC_BATCH = 500
+
+
+class IncompleteUpload(Exception):
+    """Finalisation demandée alors que des blocs manquent."""
+
+    def __init__(self, missing: list[int]) -> None:
+        super().__init__(f"{len(missing)} bloc(s) manquant(s)")
+        self.missing = missing
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return max(1, -(-size // chunk_size))
+
+
+def expected_chunk_len(size: int, chunk_size: int, index: int) -> int:
+    """Taille claire attendue du bloc `index` (0 si hors limites)."""
+    if index < 0 or index >= chunk_count(size, chunk_size):
+        return 0
+    return min(chunk_size, size - index * chunk_size)
+
+
+def _upload_dir(upload_id: str) -> str:
+    return os.path.join(ATTACHMENTS_DIR, "uploads", upload_id)
+
+
+def _chunk_name(index: int) -> str:
+    return f"{index:06d}"
+
+
+def write_chunk(upload_id: str, index: int, data: bytes) -> None:
+    """Chiffre et écrit un bloc (atomique ; renvoyer un bloc le remplace)."""
+    directory = _upload_dir(upload_id)
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, _chunk_name(index))
+    tmp = target + ".part"
+    with open(tmp, "wb") as f:
+        f.write(encrypt_chunk(data))
+    os.replace(tmp, target)
+
+
+def received_chunks(upload_id: str) -> list[int]:
+    try:
+        names = os.listdir(_upload_dir(upload_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(n) for n in names if n.isdigit())
+
+
+def _read_chunk(directory: str, index: int) -> bytes:
+    with open(os.path.join(directory, _chunk_name(index)), "rb") as f:
+        return decrypt_chunk(f.read())
+
+
+def finalize_upload(db: Session, upload: AttachmentUpload) -> Attachment:
+    """Vérifie les blocs, calcule le sha256, range le blob (dédupliqué) et crée l'Attachment."""
+    n = chunk_count(upload.size, upload.chunk_size)
+    missing = sorted(set(range(n)) - set(received_chunks(upload.id)))
+    if missing:
+        raise IncompleteUpload(missing)
+
+    staging = _upload_dir(upload.id)
+    digest = hashlib.sha256()
+    for i in range(n):
+        data = _read_chunk(staging, i)
+        if len(data) != expected_chunk_len(upload.size, upload.chunk_size, i):
+            raise ValueError(f"Bloc {i} de taille inattendue")
+        digest.update(data)
+    sha = digest.hexdigest()
+
+    rel_path = os.path.join("blobs", sha[:2], f"{sha}.{upload.id}")
+    final = os.path.join(ATTACHMENTS_DIR, rel_path)
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    os.replace(staging, final)
+    inserted = db.execute(
+        sqlite_insert(Blob)
+        .values(sha256=sha, size=upload.size, chunk_size=upload.chunk_size, path=rel_path)
+        .on_conflict_do_nothing(index_elements=[Blob.sha256])
+    ).rowcount
+    attachment = Attachment(
+        owner_id=upload.owner_id,
+        blob_sha256=sha,
+        filename=upload.filename,
+        content_type=upload.content_type,
+    )
+    db.add(attachment)
+    db.delete(upload)
+    db.commit()
+    if not inserted:
+        shutil.rmtree(final, ignore_errors=True)  # contenu déjà stocké : doublon inutile
+    db.refresh(attachment)
+    return attachment
+
+
+def iter_blob_range(blob: Blob, start: int, end: int) -> Iterator[bytes]:
+    """Octets [start, end] (inclus) du blob, en ne déchiffrant que les blocs concernés."""
+    directory = os.path.join(ATTACHMENTS_DIR, blob.path)
+    for i in range(start // blob.chunk_size, end // blob.chunk_size + 1):
+        data = _read_chunk(directory, i)
+        offset = i * blob.chunk_size
+        lo, hi = max(0, start - offset), end - offset + 1
+        yield data[lo:hi]
+
+
+def discard_upload(upload_id: str) -> None:
+    shutil.rmtree(_upload_dir(upload_id), ignore_errors=True)
+
+
+def gc_attachments(db: Session, orphan_before: datetime) -> dict:
+    """Ramasse-miettes (après la purge TTL des messages) ; renvoie les compteurs.
+
+    1. pièces jointes plus référencées par aucun message, chaud ou archivé (et plus vieilles
+       que le délai de grâce, pour laisser le temps d'envoyer le message) ;
+    2. envois par blocs abandonnés ;
+    3. blobs plus référencés par aucune pièce jointe → lignes puis dossiers.
+    """
+    if SHARDED:
+        attachments = _delete_unreferenced_sharded(db, orphan_before)
+    else:
+        referenced = exists().where(Message.attachment_id == Attachment.id) | exists().where(
+            ArchiveAttachment.attachment_id == Attachment.id
+        )
+        attachments = db.execute(
+            delete(Attachment).where(Attachment.created_at < orphan_before, ~referenced)
+        ).rowcount
+    stale_uploads = list(
+        db.scalars(select(AttachmentUpload.id).where(AttachmentUpload.created_at < orphan_before))
+    )
+    if stale_uploads:
+        db.execute(delete(AttachmentUpload).where(AttachmentUpload.id.in_(stale_uploads)))
+    used = exists().where(Attachment.blob_sha256 == Blob.sha256)
+    blob_paths = list(db.scalars(delete(Blob).where(~used).returning(Blob.path)))
+    db.commit()
+    for upload_id in stale_uploads:
+        discard_upload(upload_id)
+    for rel_path in blob_paths:
+        shutil.rmtree(os.path.join(ATTACHMENTS_DIR, rel_path), ignore_errors=True)
+    return {"attachments": attachments, "uploads": len(stale_uploads), "blobs": len(blob_paths)}
+
+
+def _delete_unreferenced_sharded(db: Session, orphan_before: datetime) -> int:
+    """MESSAGE_SHARDS : pas de sous-requête EXISTS vers d'autres fichiers. Candidats par lots,
+    puis une recherche indexée (ix_messages_attachment_id) par shard. Le délai de grâce couvre
+    l'écart entre la vérification et la suppression."""
+    deleted, last_id = 0, 0
+    while True:
+        ids = list(
+            db.scalars(
+                select(Attachment.id)
+                .where(Attachment.created_at < orphan_before, Attachment.id > last_id)
+                .order_by(Attachment.id)
+                .limit(_GC_BATCH)
+            )
+        )
+        if not ids:
+            return deleted
+        last_id = ids[-1]
+        used: set[int] = set()
+        for mdb in message_dbs(db):
+            used.update(
+                mdb.scalars(
+                    select(Message.attachment_id).where(Message.attachment_id.in_(ids)).distinct()
+                )
+            )
+            used.update(
+                mdb.scalars(
+                    select(ArchiveAttachment.attachment_id).where(
+                        ArchiveAttachment.attachment_id.in_(ids)
+                    )
+                )
+            )
+        orphans = [i for i in ids if i not in used]
+        if orphans:
+            deleted += db.execute(delete(Attachment).where(Attachment.id.in_(orphans))).rowcount
@@ -10,19 +10,32 @@ from jwt import PyJWTError
 from passlib.context import CryptContext
 
 from .config import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
+from .metrics import BCRYPT
 
 # Contexte de hashage (bcrypt)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Hash qui ne correspond à aucun mot de passe (compte révoqué, suppression en cours)
+UNUSABLE_PASSWORD = "!"
+
 
 def get_password_hash(password: str) -> str:
     """Hache un mot de passe en utilisant bcrypt."""
-    return pwd_context.hash(password)
+    with BCRYPT.labels("hash").time():
+        return pwd_context.hash(password)
 
 
 def verify_password(plain_password: str, password_hash: str) -> bool:
     """Vérifie qu'un mot de passe correspond au hash stocké."""
-    return pwd_context.verify(plain_password, password_hash)
+    if password_hash == UNUSABLE_PASSWORD:
+        return False
+    with BCRYPT.labels("verify").time():
+        return pwd_context.verify(plain_password, password_hash)
+
+
+def warm_up_hashing() -> None:
+    """Charge le backend bcrypt de passlib (détection + autotests) au démarrage."""
+    pwd_context.handler("bcrypt").get_backend()
 
 
 def create_access_token(
@@ -41,11 +54,11 @@ def create_access_token(
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def decode_access_token(token: str) -> str:
-    """Décode et valide un JWT, renvoie le subject (username)."""
+def decode_access_token(token: str) -> tuple[str, int]:
+    """Décode et valide un JWT, renvoie (subject = username, version de jeton)."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return str(payload.get("sub"))
+        return str(payload.get("sub")), int(payload.get("ver") or 0)
     except PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Token invalide ou expiré"
@@ -0,0 +1,242 @@
+"""Sauvegarde à chaud (et restauration) de la base SQLite + des clés.
+
+- Copie via l'API de sauvegarde en ligne de SQLite (`sqlite3.Connection.backup`) par pas de
+  `pages` pages : le verrou est relâché entre deux pas, les écrivains ne sont bloqués que
+  le temps d'un pas (et la copie est cohérente : SQLite recommence si la source change).
+- Le snapshot est emballé avec MESSAGE_KEY_FILE (et SEARCH_KEY_FILE s'il existe) dans une
+  archive tar + manifest.json (sha256 de chaque fichier), écrite dans un fichier temporaire
+  puis renommée (`os.replace`) : l'archive finale est complète ou absente.
+- Restauration : serveur arrêté, vérification des empreintes, remplacement atomique des fichiers.
+- MESSAGE_SHARDS : chaque shard de messages est copié de la même façon (membre `shards/…`) ;
+  les copies sont cohérentes fichier par fichier, pas entre fichiers.
+
+Usage :
+    python -m app.backup create [--pages 256] [--sleep 0.005]
+    python -m app.backup list
+    python -m app.backup restore data/backups/offcom-YYYYmmddTHHMMSSZ.tar
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy.engine import make_url
+
+from .config import BACKUP_DIR, DATABASE_URL, MESSAGE_KEY_FILE, SEARCH_KEY_FILE
+from .shards import shard_paths
+
+DB_MEMBER = "offcom.db"
+MANIFEST_MEMBER = "manifest.json"
+KEY_MEMBERS = {"message_key.key": MESSAGE_KEY_FILE, "search_key.key": SEARCH_KEY_FILE}
+
+
+def _shard_members() -> dict[str, str]:
+    """Membre d'archive → chemin, pour chaque shard de messages (vide sans MESSAGE_SHARDS)."""
+    return {f"shards/{os.path.basename(p)}": p for p in shard_paths()}
+
+
+def sqlite_db_path(url: str = DATABASE_URL) -> str:
+    """Chemin du fichier SQLite de DATABASE_URL (erreur si autre moteur / base mémoire)."""
+    parsed = make_url(url)
+    if not parsed.drivername.startswith("sqlite") or parsed.database in (None, "", ":memory:"):
+        raise ValueError("Sauvegarde à chaud disponible uniquement pour une base SQLite fichier")
+    return os.path.abspath(parsed.database)
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class _Restarted(Exception):
+    """La source a changé trop souvent pendant la copie : on agrandit le pas."""
+
+
+def online_copy(
+    src_path: str,
+    dst_path: str,
+    pages: int = 256,
+    sleep: float = 0.005,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    max_restarts: int = 3,
+) -> int:
+    """Copie cohérente de src_path vers dst_path par pas de `pages` pages.
+
+    Si une autre connexion écrit pendant la copie, SQLite la reprend depuis le début : sous
+    écriture continue, un petit pas ne termine jamais. Après `max_restarts` reprises on
+    quadruple le pas (jusqu'à une copie en un seul pas). Renvoie le pas finalement utilisé.
+    """
+    while True:
+        last_remaining = None
+        restarts = 0
+
+        def _watch(status: int, remaining: int, total: int) -> None:
+            nonlocal last_remaining, restarts
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > max_restarts and pages > 0:
+                    raise _Restarted()
+            last_remaining = remaining
+            if progress:
+                progress(status, remaining, total)
+
+        src = sqlite3.connect(src_path, timeout=30)
+        dst = sqlite3.connect(dst_path)
+        try:
+            src.backup(dst, pages=pages, progress=_watch, sleep=sleep)
+            return pages
+        except _Restarted:
+            pages = pages * 4 if pages * 4 < 1 << 20 else -1
+        finally:
+            dst.close()
+            src.close()
+
+
+def create_snapshot(dest_dir: str = BACKUP_DIR, pages: int = 256, sleep: float = 0.005) -> dict:
+    """Crée une archive DB + clés dans dest_dir ; renvoie son résumé (chemin, taille, durée)."""
+    db_path = sqlite_db_path()
+    os.makedirs(dest_dir, exist_ok=True)
+    started = time.perf_counter()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    final_path = os.path.join(dest_dir, f"offcom-{stamp}.tar")
+
+    with tempfile.TemporaryDirectory(dir=dest_dir) as work:
+        db_copy = os.path.join(work, DB_MEMBER)
+        steps = 0
+
+        def _progress(status: int, remaining: int, total: int) -> None:
+            nonlocal steps
+            steps += 1
+
+        used_pages = online_copy(db_path, db_copy, pages=pages, sleep=sleep, progress=_progress)
+
+        files = {DB_MEMBER: db_copy}
+        for member, path in _shard_members().items():
+            if os.path.exists(path):
+                files[member] = os.path.join(work, os.path.basename(path))
+                online_copy(path, files[member], pages=pages, sleep=sleep, progress=_progress)
+        for member, path in KEY_MEMBERS.items():
+            if os.path.exists(path):
+                files[member] = path
+        manifest = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "source": db_path,
+            "files": {name: _sha256_file(path) for name, path in files.items()},
+        }
+
+        tmp_tar = os.path.join(work, "bundle.tar")
+        with tarfile.open(tmp_tar, "w") as tar:
+            for name, path in files.items():
+                tar.add(path, arcname=name)
+            data = json.dumps(manifest, indent=2).encode("utf-8")
+            info = tarfile.TarInfo(MANIFEST_MEMBER)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+        os.chmod(tmp_tar, 0o600)  # contient la clé Fernet
+        os.replace(tmp_tar, final_path)  # même volume → rename atomique
+
+    return {
+        "path": final_path,
+        "size_bytes": os.path.getsize(final_path),
+        "db_bytes": os.path.getsize(db_path),
+        "steps": steps,
+        "pages_per_step": used_pages,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def list_snapshots(dest_dir: str = BACKUP_DIR) -> list[dict]:
+    """Archives présentes dans dest_dir (plus récentes d'abord)."""
+    if not os.path.isdir(dest_dir):
+        return []
+    out = []
+    for name in sorted(os.listdir(dest_dir), reverse=True):
+        if name.startswith("offcom-") and name.endswith(".tar"):
+            path = os.path.join(dest_dir, name)
+            out.append({"name": name, "path": path, "size_bytes": os.path.getsize(path)})
+    return out
+
+
+def restore_snapshot(bundle_path: str) -> dict:
+    """Restaure DB + clés depuis une archive (à lancer serveur ARRÊTÉ)."""
+    db_path = sqlite_db_path()
+    shards = _shard_members()
+    targets = {DB_MEMBER: db_path, **KEY_MEMBERS, **shards}
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(db_path)) as work:
+        with tarfile.open(bundle_path, "r") as tar:
+            manifest = json.load(tar.extractfile(MANIFEST_MEMBER))
+            for name in manifest["files"]:
+                if name not in targets:
+                    raise ValueError(f"Membre inattendu dans l'archive: {name}")
+                os.makedirs(os.path.dirname(os.path.join(work, name)), exist_ok=True)
+                with open(os.path.join(work, name), "wb") as out:
+                    shutil.copyfileobj(tar.extractfile(name), out)
+
+        for name, digest in manifest["files"].items():
+            if _sha256_file(os.path.join(work, name)) != digest:
+                raise ValueError(f"Empreinte invalide pour {name} : archive corrompue")
+        for name in manifest["files"]:
+            if name != DB_MEMBER and name not in shards:
+                continue
+            check = sqlite3.connect(os.path.join(work, name))
+            try:
+                if check.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                    raise ValueError(f"integrity_check SQLite en échec ({name})")
+            finally:
+                check.close()
+
+        # Journaux des anciennes bases : ils ne correspondent plus aux fichiers restaurés
+        for path in [db_path, *shards.values()]:
+            for suffix in ("-wal", "-shm", "-journal"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        for name in manifest["files"]:
+            dst = targets[name]
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            # copie à côté de la cible (même volume) puis rename atomique
+            staged = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.restore")
+            shutil.copyfile(os.path.join(work, name), staged)
+            os.replace(staged, dst)
+
+    return {"restored_from": bundle_path, "files": sorted(manifest["files"])}
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Sauvegarde à chaud OffCom (DB + clés)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_create = sub.add_parser("create", help="Créer un snapshot")
+    p_create.add_argument("--dest", default=BACKUP_DIR)
+    p_create.add_argument("--pages", type=int, default=256, help="Pages copiées par pas")
+    p_create.add_argument("--sleep", type=float, default=0.005, help="Pause entre pas (s)")
+    p_list = sub.add_parser("list", help="Lister les snapshots")
+    p_list.add_argument("--dest", default=BACKUP_DIR)
+    p_restore = sub.add_parser("restore", help="Restaurer un snapshot (serveur arrêté)")
+    p_restore.add_argument("bundle")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "create":
+        result = create_snapshot(args.dest, pages=args.pages, sleep=args.sleep)
+    elif args.cmd == "list":
+        result = list_snapshots(args.dest)
+    else:
+        result = restore_snapshot(args.bundle)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,35 @@ ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_MIN", "30"))  # 3
 # Répertoires (par défaut: ../data/ à côté de app/)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # .../app
 PROJECT_ROOT = os.path.dirname(BASE_DIR)  # .../
-DATA_DIR = os.getenv("DATA_DIR", os.path.join(PROJECT_ROOT, "data"))
-os.makedirs(DATA_DIR, exist_ok=True)
+DATA_DIR = os.getenv(
+    "DATA_DIR", os.path.join(PROJECT_ROOT, "data")
+)  # créé au démarrage, pas à l'import
 
 # ️ Fichiers persistants
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'offcom.db')}")
 MESSAGE_KEY_FILE = os.getenv("MESSAGE_KEY_FILE", os.path.join(DATA_DIR, "message_key.key"))
+SEARCH_KEY_FILE = os.getenv("SEARCH_KEY_FILE", os.path.join(DATA_DIR, "search_key.key"))
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(DATA_DIR, "backups"))  # créé à la demande
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", os.path.join(DATA_DIR, "attachments"))
+
+# Messages répartis par room sur N fichiers SQLite (un écrivain par fichier) ; 0 = base unique.
+# Nombre figé une fois des messages écrits (voir app/shards.py).
+MESSAGE_SHARDS: int = int(os.getenv("MESSAGE_SHARDS", "0"))
+SHARDS_DIR = os.getenv("SHARDS_DIR", os.path.join(DATA_DIR, "shards"))
+
+# Archive froide : messages plus vieux que la fenêtre chaude → segments compressés par room,
+# hors de la table `messages` (voir app/archive.py). 0 = pas d'archivage.
+ARCHIVE_HOT_MIN: int = int(os.getenv("ARCHIVE_HOT_MIN", "360"))  # 6 h
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+
+# Pièces jointes : envoi par blocs, chiffrées par bloc, dédupliquées (sha256)
+ATTACHMENT_MAX_BYTES: int = int(os.getenv("ATTACHMENT_MAX_BYTES", str(50 * 1024 * 1024)))
+ATTACHMENT_CHUNK_SIZE: int = int(os.getenv("ATTACHMENT_CHUNK_SIZE", str(1024 * 1024)))
+ATTACHMENT_ORPHAN_MIN: int = int(os.getenv("ATTACHMENT_ORPHAN_MIN", "1440"))  # délai de grâce
+
+# Multi-workers : un seul worker (le leader, verrou fichier) exécute les tâches de fond
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", os.path.join(DATA_DIR, "offcom.leader.lock"))
+LEADER_RETRY_S: float = float(os.getenv("LEADER_RETRY_S", "5"))  # délai max de bascule
 
 # CORS (en dev on autorise tout, à restreindre en prod)
 CORS_ALLOW_ORIGINS = os.getenv("CORS_ALLOW_ORIGINS", "*").split(",")
@@ -26,3 +49,35 @@ HIDE_AFTER_MIN: int = int(os.getenv("HIDE_AFTER_MIN", "10"))  # masquer dans l'A
 GLOBAL_MESSAGE_TTL_MIN: int = int(
     os.getenv("GLOBAL_MESSAGE_TTL_MIN", "14400")
 )  # purge DB après 10 jours
+
+# Compactage de `connections` : lignes de télémétrie plus vieilles → 1 ligne par utilisateur
+CONNECTION_RETENTION_MIN: int = int(os.getenv("CONNECTION_RETENTION_MIN", "1440"))  # 0 = off
+
+# Événements éphémères (saisie en cours, "vu") : mémoire seulement, jamais en base
+EVENTS_MIN_INTERVAL_MS: int = int(os.getenv("EVENTS_MIN_INTERVAL_MS", "1000"))  # par émetteur
+EVENTS_TTL_S: float = float(os.getenv("EVENTS_TTL_S", "10"))  # durée de vie d'un événement
+EVENTS_POLL_TIMEOUT_S: float = float(os.getenv("EVENTS_POLL_TIMEOUT_S", "25"))  # attente max
+
+# Flux SSE de présence (/presence/stream) : calculé une fois par worker pour tous les abonnés
+PRESENCE_TICK_S: float = float(os.getenv("PRESENCE_TICK_S", "5"))  # granularité des transitions
+PRESENCE_HEARTBEAT_S: float = float(os.getenv("PRESENCE_HEARTBEAT_S", "15"))
+PRESENCE_REPLAY_SIZE: int = int(os.getenv("PRESENCE_REPLAY_SIZE", "1000"))  # reprise Last-Event-ID
+
+# Renvois de POST /rooms/{id}/messages (Idempotency-Key) : réponses récentes gardées en mémoire
+IDEMPOTENCY_CACHE_S: float = float(os.getenv("IDEMPOTENCY_CACHE_S", "300"))
+IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+# Recherche dans l'historique (index aveugle HMAC, optionnel)
+MESSAGE_SEARCH_ENABLED: bool = os.getenv("MESSAGE_SEARCH_ENABLED", "false").lower() == "true"
+
+# Observabilité : /metrics (format Prometheus) + instrumentation interne
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# Jeton du collecteur ("Authorization: Bearer <jeton>") ; vide : /metrics réservé aux admins
+METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+# Profilage SQL par requête (debug) : Server-Timing + rapport /admin/profiler
+SQL_PROFILING: bool = os.getenv("SQL_PROFILING", "false").lower() == "true"
+PROFILER_REPORT_SIZE: int = int(os.getenv("PROFILER_REPORT_SIZE", "200"))  # requêtes gardées
+PROFILER_N_PLUS_ONE: int = int(os.getenv("PROFILER_N_PLUS_ONE", "5"))  # même SQL ≥ N fois
+
+# Annuaire / clés publiques
+PUBLIC_KEY_BATCH_MAX: int = int(os.getenv("PUBLIC_KEY_BATCH_MAX", "200"))  # ids max par lot
@@ -2,25 +2,55 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
 from .models import Connection
 
 
 def upsert_connection(db: Session, user_id: int, transport: str, address: str) -> None:
-    """🇫🇷 Crée/MAJ une connexion pour (user, transport, adresse)."""
-    row = (
+    """🇫🇷 Crée/MAJ une connexion pour (user, transport, adresse) en une seule instruction."""
+    stmt = sqlite_insert(Connection).values(
+        owner_id=user_id, transport=transport, address=address, last_seen=datetime.now(timezone.utc)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Connection.owner_id, Connection.transport, Connection.address],
+        index_where=Connection.peer_id.is_(None),
+        set_={"last_seen": stmt.excluded.last_seen},
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def compact_connections(db: Session, older_than: datetime) -> int:
+    """🇫🇷 Replie la télémétrie ancienne ; renvoie le nombre de lignes supprimées.
+
+    Par utilisateur, on garde ses lignes récentes + sa ligne la plus récente : MAX(last_seen)
+    (présence) est inchangé. Les voisins P2P (peer_id renseigné) ne sont pas concernés.
+    """
+    ranked = (
+        select(
+            Connection.id,
+            func.row_number()
+            .over(
+                partition_by=Connection.owner_id,
+                order_by=(Connection.last_seen.desc(), Connection.id.desc()),
+            )
+            .label("rn"),
+        )
+        .where(Connection.peer_id.is_(None))
+        .subquery()
+    )
+    latest_per_owner = select(ranked.c.id).where(ranked.c.rn == 1)
+    deleted = (
         db.query(Connection)
         .filter(
-            Connection.owner_id == user_id,
-            Connection.transport == transport,
-            Connection.address == address,
+            Connection.peer_id.is_(None),
+            Connection.last_seen < older_than,
+            Connection.id.not_in(latest_per_owner),
         )
-        .first()
+        .delete(synchronize_session=False)
     )
-    now = datetime.now(timezone.utc)
-    if row:
-        row.last_seen = now
-    else:
-        db.add(Connection(owner_id=user_id, transport=transport, address=address, last_seen=now))
     db.commit()
+    return deleted
@@ -15,14 +15,15 @@ if __name__ == "__main__" and __package__ is None:
 from .auth import get_password_hash
 
 # Imports relatifs (fonctionneront maintenant en mode script)
-from .database import Base, SessionLocal, engine
+from .database import SessionLocal, engine
+from .migrations import run_migrations
 from .models import User
 
 
 def main() -> None:
     """Crée le compte root (admin) si absent."""
-    # Crée les tables si besoin
-    Base.metadata.create_all(bind=engine)
+    # Crée / met à jour le schéma si besoin
+    run_migrations(engine)
 
     db = SessionLocal()
     try:
@@ -1,17 +1,34 @@
 """Utilitaires de chiffrement pour le contenu des messages (au repos).
 - Fernet (cryptography) garantit confidentialité + intégrité.
 - Le token chiffré est une chaîne base64 URL-safe, stockable en TEXT.
+- Index aveugle (recherche) : mots normalisés → HMAC-SHA256 avec une clé distincte.
+- Pièces jointes : un token Fernet par bloc de fichier, stocké décodé (binaire).
 """
 
 from __future__ import annotations
 
+import base64
+import hashlib
+import hmac
 import os
+import re
+import unicodedata
 
 from cryptography.fernet import Fernet, InvalidToken
 
-from .config import MESSAGE_KEY_FILE
+from .config import MESSAGE_KEY_FILE, SEARCH_KEY_FILE
+from .metrics import CRYPTO
 
 _FERNET: Fernet | None = None
+_SEARCH_KEY: bytes | None = None
+
+_ENCRYPT_HIST = CRYPTO.labels("encrypt")
+_DECRYPT_HIST = CRYPTO.labels("decrypt")
+_ENCRYPT_CHUNK_HIST = CRYPTO.labels("encrypt_chunk")
+_DECRYPT_CHUNK_HIST = CRYPTO.labels("decrypt_chunk")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+MAX_TOKENS_PER_MESSAGE = 256
 
 
 def _load_or_create_key(path: str) -> bytes:
@@ -22,6 +39,7 @@ def _load_or_create_key(path: str) -> bytes:
         with open(path, "rb") as f:
             return f.read().strip()
     key = Fernet.generate_key()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
     with open(path, "wb") as f:
         f.write(key)
     return key
@@ -34,14 +52,35 @@ def _get_fernet() -> Fernet:
     return _FERNET
 
 
+def load_keys(search: bool = False) -> None:
+    """Charge (ou crée) les clés au démarrage plutôt qu'à la première requête."""
+    _get_fernet()
+    if search:
+        _get_search_key()
+
+
+def encrypt_chunk(data: bytes) -> bytes:
+    """Chiffre un bloc de fichier ; renvoie le token Fernet décodé (binaire, -25 % sur disque)."""
+    with _ENCRYPT_CHUNK_HIST.time():
+        return base64.urlsafe_b64decode(_get_fernet().encrypt(data))
+
+
+def decrypt_chunk(raw: bytes) -> bytes:
+    """Déchiffre un bloc écrit par encrypt_chunk (intégrité vérifiée par Fernet)."""
+    with _DECRYPT_CHUNK_HIST.time():
+        return _get_fernet().decrypt(base64.urlsafe_b64encode(raw))
+
+
 def encrypt_text(plaintext: str) -> str:
     """Chiffre du texte clair en token base64 (str)."""
-    return _get_fernet().encrypt(plaintext.encode("utf-8")).decode("utf-8")
+    with _ENCRYPT_HIST.time():
+        return _get_fernet().encrypt(plaintext.encode("utf-8")).decode("utf-8")
 
 
 def decrypt_text(token_str: str) -> str:
     """Déchiffre un token base64 (str) vers texte clair."""
-    return _get_fernet().decrypt(token_str.encode("utf-8")).decode("utf-8")
+    with _DECRYPT_HIST.time():
+        return _get_fernet().decrypt(token_str.encode("utf-8")).decode("utf-8")
 
 
 def safe_decrypt(token_str: str) -> str:
@@ -51,3 +90,29 @@ def safe_decrypt(token_str: str) -> str:
     except (InvalidToken, Exception):
         # on renvoie le contenu brut si ce n'était pas du Fernet
         return token_str
+
+
+# ─────────────────────────── Index aveugle (recherche) ───────────────────────────
+def _get_search_key() -> bytes:
+    global _SEARCH_KEY
+    if _SEARCH_KEY is None:
+        _SEARCH_KEY = _load_or_create_key(SEARCH_KEY_FILE)
+    return _SEARCH_KEY
+
+
+def normalize_words(text: str) -> list[str]:
+    """Mots uniques normalisés : minuscules, sans accents, >= 2 caractères (ordre conservé)."""
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    words = dict.fromkeys(w for w in _WORD_RE.findall(folded) if len(w) >= 2)
+    return list(words)[:MAX_TOKENS_PER_MESSAGE]
+
+
+def blind_token(word: str) -> str:
+    """HMAC-SHA256 d'un mot normalisé, tronqué à 128 bits (hex)."""
+    return hmac.new(_get_search_key(), word.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def blind_tokens(text: str) -> list[str]:
+    """Jetons d'index aveugle d'un texte clair (un par mot normalisé)."""
+    return [blind_token(w) for w in normalize_words(text)]
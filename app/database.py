@@ -5,7 +5,8 @@ from typing import Generator
 from sqlalchemy import create_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
-from .config import DATABASE_URL
+from . import metrics, profiler
+from .config import DATABASE_URL, METRICS_ENABLED, SQL_PROFILING
 
 # Création du moteur SQLAlchemy
 # - future=True = nouvelle API
@@ -17,6 +18,10 @@ engine = create_engine(
     echo=False,
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
 )
+if METRICS_ENABLED:
+    metrics.instrument_engine(engine)  # durée de chaque requête SQL (voir app/metrics.py)
+if SQL_PROFILING:
+    profiler.instrument_engine(engine)  # profil SQL par requête HTTP (voir app/profiler.py)
 
 # Fabrique de sessions : une session par requête HTTP
 SessionLocal = sessionmaker(
@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import logging
-from typing import Optional
+from typing import Generator, Optional
 
 # Dépendance: exige un admin
 from fastapi import Depends, Header, HTTPException, Request, status
@@ -11,36 +11,59 @@ from sqlalchemy.orm import Session
 
 from .auth import decode_access_token
 from .connections_util import upsert_connection
-from .database import get_db
+from .database import SessionLocal, get_db
 from .models import User
+from .shards import SHARDED, room_session
 
 logger = logging.getLogger(__name__)
 
 
+def get_room_db(room_id: str, db: Session = Depends(get_db)) -> Generator:
+    """Session des messages de la room (path param `room_id`) : son shard si MESSAGE_SHARDS,
+    sinon la session principale de la requête."""
+    if not SHARDED:
+        yield db
+        return
+    room_db = room_session(room_id)
+    try:
+        yield room_db
+    finally:
+        room_db.close()
+
+
 def get_user_by_username(db: Session, username: str) -> Optional[User]:
     """Récupère un utilisateur par son nom (helper partagé)."""
     return db.query(User).filter(User.username == username).first()
 
 
-def get_current_user(
-    request: Request,
-    db: Session = Depends(get_db),
-    authorization: Optional[str] = Header(None, alias="Authorization"),
-) -> User:
-    """Extrait le JWT de l'en-tête Authorization et retourne l'utilisateur courant.
-    Format attendu : "Authorization: Bearer <token>"
-    """
+def _authenticate(db: Session, authorization: Optional[str]) -> User:
+    """Valide l'en-tête "Authorization: Bearer <token>" et charge l'utilisateur."""
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Authorization manquante"
         )
     token = authorization.split(" ", 1)[1]
-    username = decode_access_token(token)
+    username, version = decode_access_token(token)
     user = get_user_by_username(db, username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Utilisateur introuvable"
         )
+    # token_version incrémenté (révocation, suppression en cours) : anciens jetons refusés
+    if version != (user.token_version or 0):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token révoqué")
+    return user
+
+
+def get_current_user(
+    request: Request,
+    db: Session = Depends(get_db),
+    authorization: Optional[str] = Header(None, alias="Authorization"),
+) -> User:
+    """Extrait le JWT de l'en-tête Authorization et retourne l'utilisateur courant.
+    Format attendu : "Authorization: Bearer <token>"
+    """
+    user = _authenticate(db, authorization)
 
     # Marquer l'activité HTTP (adresse IP du client)
     try:
@@ -53,6 +76,17 @@ def get_current_user(
     return user
 
 
+def get_current_user_untracked(
+    authorization: Optional[str] = Header(None, alias="Authorization"),
+) -> User:
+    """Comme get_current_user, sans écriture de télémétrie (routes très fréquentes).
+    Session courte et fermée aussitôt : une route longue (long-polling) ne garde pas
+    de connexion du pool pendant son attente.
+    """
+    with SessionLocal() as db:
+        return _authenticate(db, authorization)
+
+
 def require_admin(current: User = Depends(get_current_user)) -> User:
     """Autorise uniquement les administrateurs."""
     if not current.is_admin:
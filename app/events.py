@@ -0,0 +1,174 @@
+"""Canal d'événements éphémères par room (saisie en cours, "vu"), en mémoire uniquement.
+
+- Rien n'est écrit en base ni chiffré : ces signaux n'ont plus de valeur après quelques
+  secondes (EVENTS_TTL_S).
+- Coalescence : on ne garde que le DERNIER événement par (émetteur, type) ; la mémoire d'une
+  room est bornée par (membres × types).
+- Débit : un même (émetteur, type) devient visible au plus une fois par
+  EVENTS_MIN_INTERVAL_MS. Les événements plus rapprochés remplacent celui en attente, qui
+  est publié à la fin de l'intervalle (la dernière valeur n'est jamais perdue).
+- Coût nul sans écoutant : une room n'existe que si quelqu'un l'a écoutée récemment ;
+  sinon publier se limite à une recherche dans un dict.
+- Rooms de groupe : seuls les membres actuels reçoivent (liste en cache de app/groups.py,
+  relue à chaque réveil) ; un membre parti pendant un long-polling ne reçoit plus rien.
+- Par processus : avec plusieurs workers, émetteur et écoutant doivent être servis par le
+  même (affinité côté proxy), sinon l'événement est perdu — acceptable pour ces signaux.
+Tout s'exécute dans la boucle asyncio (routes async) : pas de verrou.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .config import EVENTS_MIN_INTERVAL_MS, EVENTS_POLL_TIMEOUT_S, EVENTS_TTL_S
+from .groups import room_members
+from .metrics import EPHEMERAL_EVENTS
+from .schemas import EphemeralEventIn, EphemeralEventOut
+
+_Key = tuple[int, str]  # (sender_id, type)
+
+# Séquence globale partant de l'heure de démarrage (ms) : après un redémarrage, les curseurs
+# des clients restent inférieurs aux nouveaux numéros.
+_SEQ = itertools.count(int(time.time() * 1000))
+
+_DELIVERED = EPHEMERAL_EVENTS.labels("delivered")
+_COALESCED = EPHEMERAL_EVENTS.labels("coalesced")
+_NO_LISTENER = EPHEMERAL_EVENTS.labels("no_listener")
+
+
+@dataclass(slots=True)
+class _Event:
+    seq: int
+    type: str
+    sender_id: int
+    active: bool
+    message_id: Optional[int]
+    ts_ms: int
+    expires_at: float  # horloge de la boucle
+
+    def out(self) -> EphemeralEventOut:
+        return EphemeralEventOut.model_construct(
+            seq=self.seq,
+            type=self.type,
+            sender_id=self.sender_id,
+            active=self.active,
+            message_id=self.message_id,
+            ts_ms=self.ts_ms,
+        )
+
+
+class _RoomChannel:
+    __slots__ = ("visible", "pending", "last_visible", "wakeup", "listened_until", "last_seq")
+
+    def __init__(self) -> None:
+        self.visible: dict[_Key, _Event] = {}
+        self.pending: dict[_Key, EphemeralEventIn] = {}  # en attente de fin d'intervalle
+        self.last_visible: dict[_Key, float] = {}
+        self.wakeup = asyncio.Event()
+        self.listened_until = 0.0
+        self.last_seq = 0
+
+    def make_visible(self, key: _Key, payload: EphemeralEventIn, now: float) -> None:
+        seq = next(_SEQ)
+        self.visible[key] = _Event(
+            seq=seq,
+            type=payload.type,
+            sender_id=key[0],
+            active=payload.active,
+            message_id=payload.message_id,
+            ts_ms=int(time.time() * 1000),
+            expires_at=now + EVENTS_TTL_S,
+        )
+        self.last_visible[key] = now
+        self.last_seq = seq
+        # Réveille tous les long-pollings en attente sur cette room
+        self.wakeup.set()
+        self.wakeup = asyncio.Event()
+
+    def events_after(self, after: int, reader_id: int, now: float) -> list[EphemeralEventOut]:
+        out = []
+        for key, ev in list(self.visible.items()):
+            if ev.expires_at <= now:
+                del self.visible[key]
+            elif ev.seq > after and ev.sender_id != reader_id:
+                out.append(ev.out())
+        out.sort(key=lambda e: e.seq)
+        return out
+
+
+class EphemeralHub:
+    """Rooms écoutées de ce processus → derniers événements + réveil des long-pollings."""
+
+    def __init__(self, members: Callable[[str], Optional[frozenset[int]]] = room_members) -> None:
+        self._rooms: dict[str, _RoomChannel] = {}
+        self._next_sweep = 0.0
+        self._members = members  # room → membres (groupe), None : room ouverte ou DM
+
+    def publish(self, room_id: str, sender_id: int, payload: EphemeralEventIn) -> str:
+        """Publie un événement ; renvoie "delivered", "coalesced" ou "no_listener"."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        room = self._rooms.get(room_id)
+        if room is None or room.listened_until < now:
+            _NO_LISTENER.inc()
+            return "no_listener"
+        key = (sender_id, payload.type)
+        wait = room.last_visible.get(key, float("-inf")) + EVENTS_MIN_INTERVAL_MS / 1000 - now
+        if wait <= 0:
+            room.pending.pop(key, None)
+            room.make_visible(key, payload, now)
+            _DELIVERED.inc()
+            return "delivered"
+        if key not in room.pending:
+            loop.call_later(wait, self._flush, room_id, room, key)
+        room.pending[key] = payload  # remplace l'éventuel précédent
+        _COALESCED.inc()
+        return "coalesced"
+
+    def _flush(self, room_id: str, room: _RoomChannel, key: _Key) -> None:
+        payload = room.pending.pop(key, None)
+        if payload is not None and self._rooms.get(room_id) is room:
+            room.make_visible(key, payload, asyncio.get_running_loop().time())
+
+    async def poll(
+        self, room_id: str, reader_id: int, after: int, timeout_s: float
+    ) -> tuple[list[EphemeralEventOut], int]:
+        """Long-polling : rend les événements de seq > after (hors les siens), ou attend."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._sweep(now)
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = _RoomChannel()
+        deadline = now + timeout_s
+        # La room reste "écoutée" entre deux polls d'un même client
+        room.listened_until = max(room.listened_until, deadline + EVENTS_POLL_TIMEOUT_S)
+        while True:
+            # Diffusion aux seuls membres : l'appartenance a pu changer pendant l'attente
+            members = self._members(room_id)
+            if members is not None and reader_id not in members:
+                return [], after
+            events = room.events_after(after, reader_id, now)
+            remaining = deadline - now
+            if events or remaining <= 0:
+                return events, max(after, room.last_seq)
+            try:
+                await asyncio.wait_for(room.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            now = loop.time()
+
+    def _sweep(self, now: float) -> None:
+        """Oublie les rooms plus écoutées (au plus une passe par minute)."""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + 60
+        for room_id in [r for r, ch in self._rooms.items() if ch.listened_until < now]:
+            del self._rooms[room_id]
+
+
+HUB = EphemeralHub()
@@ -0,0 +1,112 @@
+"""Export NDJSON en flux de l'historique des messages.
+- Lecture par curseur serveur (`yield_per`) : on ne charge jamais plus d'un lot en mémoire.
+- Chaque lot : un seul `IN` pour les noms d'expéditeurs, déchiffrement, puis une ligne JSON
+  par message (format MessageOutDetailed).
+- Le générateur ouvre ses propres sessions : il s'exécute après la fin de la route, dans le
+  pool de threads de Starlette.
+- MESSAGE_SHARDS : une room est lue dans son shard ; un export global fusionne les flux des
+  shards (chacun trié par id) sans tout charger.
+- Archive froide (app/archive.py) : ses messages, plus anciens, sortent d'abord (un segment en
+  mémoire à la fois), puis ceux de `messages`.
+"""
+
+from __future__ import annotations
+
+import heapq
+from itertools import chain, islice
+from operator import attrgetter
+from typing import Iterator, Optional
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, select
+
+from .archive import iter_archived
+from .crypto import safe_decrypt
+from .database import SessionLocal
+from .models import Message, User
+from .schemas import MessageOutDetailed
+from .shards import all_sessions, room_session
+from .utils_dm import peer_id_for_sender
+
+EXPORT_CHUNK_ROWS = 500
+
+
+def _recipient_id(room_id: str, sender_id: int) -> int:
+    try:
+        return peer_id_for_sender(room_id, sender_id)
+    except ValueError:
+        return 0
+
+
+def iter_messages_ndjson(
+    stmt: Select,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    room_id: Optional[str] = None,
+    sender_id: Optional[int] = None,
+) -> Iterator[bytes]:
+    """Exécute `stmt` (colonnes de Message) et produit des blocs NDJSON, un par lot de lignes.
+    `room_id` : stmt limité à cette room (lue dans son seul shard) ; sinon trié par id.
+    `room_id`/`sender_id` filtrent aussi les messages archivés, émis avant ceux de `stmt`.
+    """
+    db = SessionLocal()
+    sources = [room_session(room_id)] if room_id is not None else all_sessions()
+    try:
+        streams = [src.execute(stmt.execution_options(yield_per=chunk_rows)) for src in sources]
+        hot = streams[0] if len(streams) == 1 else heapq.merge(*streams, key=attrgetter("id"))
+        archived = (iter_archived(src, room_id=room_id, sender_id=sender_id) for src in sources)
+        rows = chain(chain.from_iterable(archived), hot)
+        while chunk := list(islice(rows, chunk_rows)):
+            sender_ids = {m.sender_id for m in chunk}
+            names = dict(
+                db.execute(select(User.id, User.username).where(User.id.in_(sender_ids))).all()
+            )
+            lines = []
+            for m in chunk:
+                item = MessageOutDetailed.model_construct(
+                    id=m.id,
+                    room_id=m.room_id,
+                    sender=names.get(m.sender_id, f"user:{m.sender_id}"),
+                    sender_id=m.sender_id,
+                    recipient_id=_recipient_id(m.room_id, m.sender_id),
+                    content=safe_decrypt(m.content),
+                    created_at=m.created_at,
+                    attachment_id=m.attachment_id,
+                )
+                lines.append(item.model_dump_json())
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+    finally:
+        for src in sources:
+            src.close()
+        db.close()
+
+
+def ndjson_export_response(
+    stmt: Select, filename: str, room_id: Optional[str] = None, sender_id: Optional[int] = None
+) -> StreamingResponse:
+    """StreamingResponse NDJSON (téléchargement) pour un select de messages."""
+    return StreamingResponse(
+        iter_messages_ndjson(stmt, room_id=room_id, sender_id=sender_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def messages_export_stmt(room_id: str | None = None, sender_id: int | None = None) -> Select:
+    """Select des messages à exporter, dans l'ordre chronologique.
+    Colonnes seules (pas d'entités ORM) : rien ne s'accumule dans l'identity map.
+    Pour une room, l'ordre suit idx_messages_room_ts (pas de tri temporaire).
+    """
+    stmt = select(
+        Message.id,
+        Message.room_id,
+        Message.sender_id,
+        Message.content,
+        Message.created_at,
+        Message.attachment_id,
+    )
+    if sender_id is not None:
+        stmt = stmt.where(Message.sender_id == sender_id)
+    if room_id is not None:
+        stmt = stmt.where(Message.room_id == room_id)
+        return stmt.order_by(Message.created_at.asc(), Message.id.asc())
+    return stmt.order_by(Message.id.asc())
@@ -0,0 +1,67 @@
+"""Rooms de groupe : appartenance en base, contrôle d'accès en mémoire.
+
+- Room de groupe = room_id "grp:<id>" (table group_rooms) ; seuls les membres
+  (group_members) y lisent et écrivent. Les autres room_id non DM restent ouvertes, comme avant.
+- Le contrôle d'accès passe à chaque envoi et lecture : les membres d'un groupe sont gardés
+  en mémoire (frozenset) dans un VersionedCache de portée "group_members". Un ajout ou un
+  départ, quel que soit le worker, fait avancer cette version (triggers, migration 13) et
+  vide le cache : pas de fenêtre d'incohérence, et le contrôle se résume à
+  `user_id in membres` tant que rien ne change.
+- La même liste filtre la diffusion des événements éphémères (`room_members`, app/events.py) :
+  un long-polling ne rend plus rien à un membre parti, sans requête par réveil.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import select
+
+from .database import SessionLocal
+from .invalidation import VersionedCache
+from .models import GroupMember, GroupRoom
+
+GROUP_PREFIX = "grp:"
+
+# group_id → membres (frozenset des user_id), None si le groupe n'existe pas
+_MEMBERS = VersionedCache("group_members", maxsize=4096)
+
+
+def group_room_id(group_id: int) -> str:
+    return f"{GROUP_PREFIX}{group_id}"
+
+
+def is_group_room(room_id: str) -> bool:
+    return room_id.startswith(GROUP_PREFIX)
+
+
+def parse_group_id(room_id: str) -> int:
+    if not is_group_room(room_id):
+        raise ValueError("room_id n'est pas une room de groupe (attendu 'grp:<id>')")
+    try:
+        return int(room_id.removeprefix(GROUP_PREFIX))
+    except ValueError as exc:
+        raise ValueError("room_id de groupe invalide (attendu 'grp:<id>')") from exc
+
+
+def _load_members(group_id: int) -> Optional[frozenset[int]]:
+    with SessionLocal() as db:
+        if db.get(GroupRoom, group_id) is None:
+            return None
+        return frozenset(
+            db.scalars(select(GroupMember.user_id).where(GroupMember.group_id == group_id))
+        )
+
+
+def group_members(group_id: int) -> Optional[frozenset[int]]:
+    """Membres du groupe (cache, une requête après chaque changement d'appartenance)."""
+    return _MEMBERS.get_or_compute(group_id, lambda: _load_members(group_id))
+
+
+def room_members(room_id: str) -> Optional[frozenset[int]]:
+    """Membres d'une room de groupe (diffusion des événements), None pour une room inconnue ou
+    non groupe."""
+    try:
+        return group_members(parse_group_id(room_id))
+    except ValueError:
+        return None
@@ -0,0 +1,69 @@
+"""Renvois idempotents de POST /rooms/{room_id}/messages (clients hors ligne qui réessaient).
+
+- Le client joint une clé à chaque message : en-tête `Idempotency-Key` ou champ
+  `client_msg_id` de MessageIn. Elle est stockée avec le message (messages.client_msg_id),
+  unique par room et expéditeur (index partiel uq_messages_room_sender_client, migration 15) :
+  un renvoi ne crée ni doublon ni chiffrement supplémentaire, il reçoit le message d'origine.
+- Portée par room : la même clé dans une autre room est un autre message. Une room vit dans
+  un seul shard (MESSAGE_SHARDS), l'index suffit donc à garantir l'unicité.
+- Les réponses récentes sont gardées en mémoire (IDEMPOTENCY_CACHE_S) : la plupart des
+  renvois, rapprochés, repartent sans toucher la base. Sinon (autre worker, entrée expirée)
+  l'INSERT échoue sur l'index unique et le message d'origine est relu.
+- La clé vit autant que le message : purge TTL (GLOBAL_MESSAGE_TTL_MIN), suppression de
+  l'expéditeur. Un message passé dans l'archive froide (app/archive.py) ne garde pas sa clé.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .config import GLOBAL_MESSAGE_TTL_MIN, IDEMPOTENCY_CACHE_S, IDEMPOTENCY_CACHE_SIZE
+from .schemas import MessageOutDetailed
+
+_Key = tuple[int, str, str]  # (expéditeur, room, clé client)
+
+
+class RecentPosts:
+    """(expéditeur, room, clé) → réponse d'origine, pendant `ttl` secondes (LRU borné)."""
+
+    def __init__(self, ttl: float, maxsize: int) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[_Key, tuple[float, MessageOutDetailed]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sender_id: int, room_id: str, key: str) -> Optional[MessageOutDetailed]:
+        entry_key = (sender_id, room_id, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[entry_key]
+                return None
+            return entry[1]
+
+    def put(self, sender_id: int, room_id: str, key: str, out: MessageOutDetailed) -> None:
+        if self.ttl <= 0:
+            return
+        entry_key = (sender_id, room_id, key)
+        with self._lock:
+            self._entries[entry_key] = (time.monotonic() + self.ttl, out)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Jamais plus longtemps que les messages eux-mêmes (TTL global, 0 = désactivé)
+_ttl = IDEMPOTENCY_CACHE_S
+if GLOBAL_MESSAGE_TTL_MIN > 0:
+    _ttl = min(_ttl, GLOBAL_MESSAGE_TTL_MIN * 60)
+
+RECENT_POSTS = RecentPosts(_ttl, IDEMPOTENCY_CACHE_SIZE)
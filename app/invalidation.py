@@ -0,0 +1,92 @@
+"""Invalidation des caches en mémoire entre workers (SQLite : `PRAGMA data_version`).
+
+- `data_version` change dès qu'une AUTRE connexion (de ce processus ou d'un autre worker)
+  a validé une écriture. On l'interroge sur une connexion dédiée qui n'écrit jamais :
+  toute écriture, quel que soit le worker, est donc visible.
+- Vérifié à chaque lecture de cache (~10 µs, aucune lecture de page) : pas de fenêtre
+  d'incohérence ni de tâche de fond, contrairement à un sondage périodique.
+- `data_version` couvre toute la base, or chaque requête authentifiée écrit (last_seen).
+  Quand il bouge, on relit donc `cache_versions` (une ligne par table, incrémentée par
+  triggers, cf. migration 5) : un cache de portée "users" ne se vide que si `users` change.
+- Hors SQLite (ou portée inconnue) : version différente à chaque appel → pas de cache.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from .config import DATABASE_URL
+
+
+class DataVersionWatcher:
+    """Versions par table, relues seulement quand la base a été modifiée."""
+
+    def __init__(self, database_url: str) -> None:
+        prefix = "sqlite:///"
+        path = database_url.removeprefix(prefix) if database_url.startswith(prefix) else None
+        self._path = path if path and path != ":memory:" else None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._data_version: Optional[int] = None
+        self._scopes: dict[str, int] = {}
+        self._uncached = 0
+
+    def version(self, scope: str) -> Hashable:
+        """Version courante de `scope` (nom de table) ; change après toute écriture dessus."""
+        with self._lock:
+            if self._path is not None:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(
+                        self._path, check_same_thread=False, isolation_level=None
+                    )
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version != self._data_version:
+                    self._data_version = data_version
+                    try:
+                        self._scopes = dict(
+                            self._conn.execute("SELECT name, version FROM cache_versions")
+                        )
+                    except sqlite3.OperationalError:  # base pas encore migrée
+                        self._scopes = {}
+                if scope in self._scopes:
+                    return self._scopes[scope]
+            self._uncached += 1
+            return ("uncached", self._uncached)
+
+
+DATA_VERSION = DataVersionWatcher(DATABASE_URL)
+
+
+class VersionedCache:
+    """Petit cache LRU vidé dès que la table `scope` change (toutes connexions, tous workers)."""
+
+    def __init__(
+        self, scope: str, maxsize: int = 128, watcher: DataVersionWatcher = DATA_VERSION
+    ) -> None:
+        self.scope = scope
+        self.maxsize = maxsize
+        self._watcher = watcher
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._version: Hashable = None
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        version = self._watcher.version(self.scope)
+        with self._lock:
+            if version != self._version:
+                self._data.clear()
+                self._version = version
+            elif key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        value = compute()
+        with self._lock:
+            # Un autre appel a vu une version plus récente pendant le calcul : on ne garde rien
+            if version == self._version:
+                self._data[key] = value
+                if len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
@@ -0,0 +1,243 @@
+"""Tâches d'administration en arrière-plan, suivies en base (`admin_jobs`).
+
+Supprimer un utilisateur actif en une transaction (`db.delete(user)` et ses cascades ORM)
+chargeait chaque message et connexion en mémoire et gardait le verrou d'écriture tout du long.
+Désormais :
+
+- La route révoque aussitôt (token_version + 1, mot de passe inutilisable : plus aucun jeton
+  valide ni connexion), crée la tâche et répond 202 ; l'exécution suit la réponse, dans le pool
+  de threads du worker (BackgroundTasks).
+- Suppressions ensemblistes par lots (DELETE … WHERE id IN (lot)), une transaction courte par
+  lot : les autres écrivains passent entre deux lots, la mémoire reste bornée.
+- État et compteurs en base : lisibles depuis n'importe quel worker (GET /admin/jobs/{id}).
+- Reprise : une tâche sans battement depuis STALE_AFTER_S (worker arrêté en cours de route) est
+  relancée par le leader. Chaque étape est idempotente (elle supprime ce qui reste).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from .archive import drop_sender, remove_files
+from .attachments import discard_upload
+from .auth import UNUSABLE_PASSWORD
+from .database import SessionLocal
+from .models import (
+    AdminJob,
+    Attachment,
+    AttachmentUpload,
+    Connection,
+    GroupMember,
+    GroupRoom,
+    Message,
+    MessageToken,
+    User,
+)
+from .room_marks import ROOM_MARKS
+from .schemas import AdminJobOut
+from .shards import message_dbs
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER_S = 120  # battement plus ancien → tâche considérée abandonnée
+_CHUNK = 2000  # lignes par lot (une transaction)
+
+DELETE_USER = "delete-user"
+
+
+def job_out(job: AdminJob) -> AdminJobOut:
+    return AdminJobOut.model_construct(
+        id=job.id,
+        kind=job.kind,
+        target_id=job.target_id,
+        status=job.status,
+        progress=json.loads(job.progress or "{}"),
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        finished_at=job.finished_at,
+    )
+
+
+class _JobRun:
+    """Progression d'une tâche en cours : compteurs + battement, écrits en base à chaque lot."""
+
+    def __init__(self, job_id: str, progress: dict) -> None:
+        self.job_id = job_id
+        self.progress = progress
+
+    def step(self, name: str) -> None:
+        self.progress["step"] = name
+        self._save()
+
+    def add(self, counter: str, n: int) -> None:
+        self.progress[counter] = self.progress.get(counter, 0) + n
+        self._save()
+
+    def _save(self, **values) -> None:
+        with SessionLocal() as db:
+            db.execute(
+                update(AdminJob)
+                .where(AdminJob.id == self.job_id)
+                .values(
+                    progress=json.dumps(self.progress),
+                    updated_at=datetime.now(timezone.utc),
+                    **values,
+                )
+            )
+            db.commit()
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self._save(status=status, error=error, finished_at=datetime.now(timezone.utc))
+
+
+# ─────────────────────────── Suppression d'un utilisateur ───────────────────────────
+def start_user_deletion(db: Session, user: User, admin_id: int) -> AdminJob:
+    """Révoque l'utilisateur et crée sa tâche de suppression (ou renvoie celle en cours)."""
+    job = db.scalar(
+        select(AdminJob).where(
+            AdminJob.kind == DELETE_USER,
+            AdminJob.target_id == user.id,
+            AdminJob.status.in_(("pending", "running")),
+        )
+    )
+    if job is not None:
+        return job
+    user.token_version = (user.token_version or 0) + 1
+    user.password_hash = UNUSABLE_PASSWORD
+    job = AdminJob(id=uuid.uuid4().hex, kind=DELETE_USER, target_id=user.id, created_by=admin_id)
+    db.add(job)
+    db.commit()  # révocation visible de tous les workers avant la réponse
+    db.refresh(job)
+    return job
+
+
+def _delete_in_chunks(db: Session, id_col, where, run: _JobRun, counter: str) -> None:
+    """DELETE par lots d'ids (une transaction courte par lot), compteur `counter`."""
+    model = id_col.class_
+    while True:
+        ids = list(db.scalars(select(id_col).where(where).limit(_CHUNK)))
+        if not ids:
+            return
+        db.execute(delete(model).where(id_col.in_(ids)))
+        db.commit()
+        run.add(counter, len(ids))
+
+
+def _delete_user(run: _JobRun, user_id: int) -> None:
+    with SessionLocal() as db:
+        # 1. Messages et index aveugle, dans chaque shard (MESSAGE_SHARDS) ou la base ;
+        #    segments d'archive froide réécrits sans ses messages
+        run.step("messages")
+        for mdb in message_dbs(db):
+            while True:
+                ids = list(
+                    mdb.scalars(
+                        select(Message.id).where(Message.sender_id == user_id).limit(_CHUNK)
+                    )
+                )
+                if not ids:
+                    break
+                mdb.execute(delete(MessageToken).where(MessageToken.message_id.in_(ids)))
+                mdb.execute(delete(Message).where(Message.id.in_(ids)))
+                mdb.commit()
+                run.add("messages", len(ids))
+            old_segments = drop_sender(mdb, user_id)
+            mdb.commit()
+            remove_files(old_segments)
+            run.add("archive_segments", len(old_segments))
+        ROOM_MARKS.clear()  # ses messages ont disparu de rooms quelconques
+
+        # 2. Télémétrie et voisins
+        run.step("connections")
+        _delete_in_chunks(db, Connection.id, Connection.owner_id == user_id, run, "connections")
+
+        # 3. Pièces jointes et envois en cours ; les blobs orphelins partent au prochain
+        #    ramasse-miettes
+        run.step("attachments")
+        _delete_in_chunks(db, Attachment.id, Attachment.owner_id == user_id, run, "attachments")
+        upload_ids = list(
+            db.scalars(select(AttachmentUpload.id).where(AttachmentUpload.owner_id == user_id))
+        )
+        if upload_ids:
+            db.execute(delete(AttachmentUpload).where(AttachmentUpload.id.in_(upload_ids)))
+            db.commit()
+            run.add("uploads", len(upload_ids))
+        for upload_id in upload_ids:
+            discard_upload(upload_id)
+
+        # 4. Appartenances aux groupes (vide le cache des membres, tous workers)
+        run.step("groups")
+        left = db.execute(delete(GroupMember).where(GroupMember.user_id == user_id)).rowcount
+        db.execute(update(GroupRoom).where(GroupRoom.created_by == user_id).values(created_by=None))
+        db.commit()
+        run.add("groups", left)
+
+        # 5. Le compte lui-même (sans cascade ORM : il ne reste plus rien à charger)
+        run.step("user")
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+
+
+_RUNNERS: dict[str, Callable[[_JobRun, int], None]] = {DELETE_USER: _delete_user}
+
+
+# ─────────────────────────── Exécution, reprise ───────────────────────────
+def _claim(job_id: str) -> Optional[AdminJob]:
+    """Prend la tâche si elle est en attente ou abandonnée (UPDATE conditionnel : un seul
+    worker gagne)."""
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=STALE_AFTER_S)
+    with SessionLocal() as db:
+        claimed = db.execute(
+            update(AdminJob)
+            .where(
+                AdminJob.id == job_id,
+                or_(
+                    AdminJob.status == "pending",
+                    (AdminJob.status == "running") & (AdminJob.updated_at < stale),
+                ),
+            )
+            .values(status="running", updated_at=now)
+        ).rowcount
+        db.commit()
+        return db.get(AdminJob, job_id) if claimed else None
+
+
+def run_job(job_id: str) -> None:
+    """Exécute une tâche (après la réponse HTTP, ou reprise par le leader)."""
+    job = _claim(job_id)
+    if job is None:
+        return  # déjà prise par un autre worker, ou terminée
+    run = _JobRun(job.id, json.loads(job.progress or "{}"))
+    try:
+        _RUNNERS[job.kind](run, job.target_id)
+    except Exception as exc:
+        logger.error("Tâche %s (%s) en échec : %s", job.id, job.kind, exc, exc_info=True)
+        run.finish("failed", error=str(exc))
+        return
+    run.progress["step"] = "done"
+    run.finish("done")
+
+
+def resume_stale_jobs() -> int:
+    """Leader : relance les tâches restées en attente ou abandonnées ; renvoie leur nombre."""
+    stale = datetime.now(timezone.utc) - timedelta(seconds=STALE_AFTER_S)
+    with SessionLocal() as db:
+        job_ids = list(
+            db.scalars(
+                select(AdminJob.id)
+                .where(AdminJob.status.in_(("pending", "running")), AdminJob.updated_at < stale)
+                .order_by(AdminJob.created_at)
+            )
+        )
+    for job_id in job_ids:
+        run_job(job_id)
+    return len(job_ids)
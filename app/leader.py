@@ -0,0 +1,73 @@
+"""Élection d'un leader entre workers (`uvicorn --workers N`) pour les tâches de fond uniques.
+
+- Chaque worker tente de prendre un verrou fichier exclusif (filelock, non bloquant).
+- Celui qui le tient est le leader : il lance les tâches enregistrées (purge TTL…).
+- Les autres réessaient toutes les LEADER_RETRY_S secondes. Si le leader meurt, le système
+  libère son verrou et un autre worker prend le relais au plus tard après ce délai.
+- Arrêt propre : tâches annulées puis verrou relâché (un autre worker reprend la main).
+Les tâches doivent rester idempotentes : juste après une bascule, le nouveau leader peut
+rejouer une passe déjà faite par l'ancien.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+from typing import Awaitable, Callable
+
+from filelock import FileLock, Timeout
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class LeaderElection:
+    """Verrou de leader + tâches à n'exécuter que sur le leader."""
+
+    def __init__(self, lock_file: str, retry_s: float) -> None:
+        self.lock_file = lock_file
+        self.retry_s = retry_s
+        # thread_local=False : acquis et relâché depuis la boucle asyncio, pas un thread fixe
+        self._lock = FileLock(lock_file, thread_local=False)
+        self._jobs: list[tuple[str, Job]] = []
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock.is_locked
+
+    def add_job(self, name: str, job: Job) -> None:
+        """Enregistre une coroutine (boucle longue) à lancer quand ce worker devient leader."""
+        self._jobs.append((name, job))
+
+    def _try_acquire(self) -> bool:
+        try:
+            self._lock.acquire(blocking=False)
+            return True
+        except Timeout:
+            return False
+
+    async def run(self) -> None:
+        """Attend le leadership puis exécute les tâches jusqu'à annulation (arrêt du worker)."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_file)), exist_ok=True)
+        while not self._try_acquire():
+            await asyncio.sleep(self.retry_s)
+        logger.info("Worker %d élu leader (%s)", os.getpid(), ", ".join(n for n, _ in self._jobs))
+        tasks = [asyncio.create_task(job(), name=name) for name, job in self._jobs]
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for (name, _), result in zip(self._jobs, results):
+                if isinstance(result, Exception):
+                    logger.error("Tâche leader %s arrêtée: %s", name, result, exc_info=result)
+            # On garde le verrou même si les tâches sont finies (ex. TTL désactivé) :
+            # sinon les workers se le repasseraient en boucle.
+            await asyncio.Future()
+        finally:
+            for task in tasks:
+                task.cancel()
+            for task in tasks:
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+            self._lock.release()
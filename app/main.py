@@ -4,6 +4,7 @@ import asyncio
 import contextlib
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from ipaddress import ip_address
@@ -11,43 +12,109 @@ from ipaddress import ip_address
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from sqlalchemy import func, select, text
 
-from .config import CORS_ALLOW_ORIGINS, GLOBAL_MESSAGE_TTL_MIN
-from .database import Base, SessionLocal, engine
-from .models import Message
+from .archive import archive_messages, purge_segments
+from .attachments import gc_attachments
+from .auth import warm_up_hashing
+from .config import (
+    ARCHIVE_HOT_MIN,
+    ATTACHMENT_ORPHAN_MIN,
+    CONNECTION_RETENTION_MIN,
+    CORS_ALLOW_ORIGINS,
+    GLOBAL_MESSAGE_TTL_MIN,
+    LEADER_LOCK_FILE,
+    LEADER_RETRY_S,
+    MESSAGE_SEARCH_ENABLED,
+    METRICS_ENABLED,
+    SQL_PROFILING,
+)
+from .connections_util import compact_connections
+from .crypto import load_keys
+from .database import SessionLocal, engine
+from .jobs import resume_stale_jobs
+from .leader import LeaderElection
+from .metrics import (
+    ARCHIVE,
+    ARCHIVE_ROWS,
+    CLEANUP,
+    CLEANUP_ROWS,
+    COMPACTION,
+    COMPACTION_ROWS,
+    MetricsMiddleware,
+)
+from .migrations import run_migrations
+from .models import Message, MessageToken, User
+from .profiler import ProfilerMiddleware
+from .room_marks import ROOM_MARKS
 from .routers import admin as admin_router
+from .routers import attachments as attachments_router
 from .routers import auth as auth_router
 from .routers import connections as connections_router
 from .routers import dm as dm_router
+from .routers import groups as groups_router
 from .routers import messages as messages_router
+from .routers import metrics as metrics_router
 from .routers import presence as presence_router
 from .routers import users as users_router
+from .serialization import MESSAGES_ADAPTER, USERS_ADAPTER
+from .shards import init_shards, message_dbs
+from .static_ui import UIStatic
 
 logger = logging.getLogger(__name__)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Tâche périodique : purge des messages au-delà du TTL global
+# Tâches périodiques (leader) : purge TTL des messages, archivage froid, compactage
+# de connections, reprise des tâches d'administration
 # ─────────────────────────────────────────────────────────────────────────────
+def _purge_expired_messages() -> int:
+    """Une passe de purge TTL ; renvoie le nombre de messages supprimés."""
+    db = SessionLocal()
+    try:
+        deadline = datetime.now(timezone.utc) - timedelta(minutes=GLOBAL_MESSAGE_TTL_MIN)
+        # L'index aveugle part avec ses messages (pas de FK actives sous SQLite)
+        expired_ids = select(Message.id).where(Message.created_at <= deadline)
+        deleted = 0
+        for mdb in message_dbs(db):  # base principale, ou chaque shard à tour de rôle
+            mdb.query(MessageToken).filter(MessageToken.message_id.in_(expired_ids)).delete(
+                synchronize_session=False
+            )
+            deleted += (
+                mdb.query(Message)
+                .filter(Message.created_at <= deadline)
+                .delete(synchronize_session=False)
+            )
+            # Archive froide : segments entiers (app/archive.py), validés à part
+            deleted += purge_segments(mdb, deadline)
+        if deleted:
+            db.commit()
+            ROOM_MARKS.clear()
+        return deleted
+    finally:
+        db.close()
+
+
+def _collect_attachments() -> dict:
+    """Ramasse-miettes des pièces jointes (plus référencées après la purge, envois abandonnés)."""
+    orphan_before = datetime.now(timezone.utc) - timedelta(minutes=ATTACHMENT_ORPHAN_MIN)
+    with SessionLocal() as db:
+        counts = gc_attachments(db, orphan_before)
+    if any(counts.values()):
+        logger.info("Pièces jointes supprimées : %s", counts)
+    return counts
+
+
 async def _cleanup_loop() -> None:
-    """Supprime périodiquement les messages plus vieux que GLOBAL_MESSAGE_TTL_MIN minutes."""
-    if GLOBAL_MESSAGE_TTL_MIN <= 0:
-        return  # TTL désactivé
+    """Supprime périodiquement les messages plus vieux que GLOBAL_MESSAGE_TTL_MIN minutes,
+    puis les pièces jointes qui ne sont plus référencées."""
     while True:
         try:
-            db = SessionLocal()
-            try:
-                deadline = datetime.now(timezone.utc) - timedelta(minutes=GLOBAL_MESSAGE_TTL_MIN)
-                deleted = (
-                    db.query(Message)
-                    .filter(Message.created_at <= deadline)
-                    .delete(synchronize_session=False)
-                )
-                if deleted:
-                    db.commit()
-            finally:
-                db.close()
+            if GLOBAL_MESSAGE_TTL_MIN > 0:  # 0 = TTL désactivé
+                with CLEANUP.labels().time():
+                    deleted = _purge_expired_messages()
+                CLEANUP_ROWS.labels().inc(deleted)
+            _collect_attachments()
         except Exception as exc:
             # On ne tue pas la boucle pour une erreur ponctuelle
             logger.error("Erreur dans la tâche de nettoyage: %s", exc, exc_info=True)
@@ -55,18 +122,113 @@ async def _cleanup_loop() -> None:
         await asyncio.sleep(3600)
 
 
+def _archive_old_messages() -> int:
+    """Une passe d'archivage ; renvoie le nombre de messages déplacés vers les segments."""
+    older_than = datetime.now(timezone.utc) - timedelta(minutes=ARCHIVE_HOT_MIN)
+    with SessionLocal() as db:
+        moved = archive_messages(db, older_than)
+    if moved:
+        ROOM_MARKS.clear()
+    return moved
+
+
+async def _archive_loop() -> None:
+    """Déplace périodiquement les messages sortis de la fenêtre chaude vers l'archive froide."""
+    if ARCHIVE_HOT_MIN <= 0:
+        return  # archivage désactivé
+    if 0 < GLOBAL_MESSAGE_TTL_MIN <= ARCHIVE_HOT_MIN:
+        return  # purgés avant d'être froids : rien à archiver
+    while True:
+        try:
+            with ARCHIVE.labels().time():
+                # Hors boucle d'événements : la première passe peut déplacer tout l'historique
+                moved = await asyncio.to_thread(_archive_old_messages)
+            ARCHIVE_ROWS.labels().inc(moved)
+        except Exception as exc:
+            logger.error("Erreur dans l'archivage des messages: %s", exc, exc_info=True)
+        await asyncio.sleep(3600)
+
+
+async def _admin_jobs_loop() -> None:
+    """Reprend les tâches d'administration abandonnées (worker arrêté pendant l'exécution)."""
+    while True:
+        try:
+            resumed = await asyncio.to_thread(resume_stale_jobs)
+            if resumed:
+                logger.info("%d tâche(s) d'administration reprise(s)", resumed)
+        except Exception as exc:
+            logger.error("Erreur dans la reprise des tâches admin: %s", exc, exc_info=True)
+        await asyncio.sleep(30)
+
+
+async def _compaction_loop() -> None:
+    """Replie périodiquement la télémétrie `connections` plus vieille que la rétention."""
+    if CONNECTION_RETENTION_MIN <= 0:
+        return  # compactage désactivé
+    while True:
+        try:
+            older_than = datetime.now(timezone.utc) - timedelta(minutes=CONNECTION_RETENTION_MIN)
+            with COMPACTION.labels().time():
+                with SessionLocal() as db:
+                    deleted = compact_connections(db, older_than)
+            COMPACTION_ROWS.labels().inc(deleted)
+        except Exception as exc:
+            logger.error("Erreur dans le compactage des connexions: %s", exc, exc_info=True)
+        await asyncio.sleep(3600)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Démarrage : migrations puis préchauffage (avant d'accepter du trafic)
+# ─────────────────────────────────────────────────────────────────────────────
+def _warm_up() -> None:
+    """Paie les coûts paresseux au démarrage plutôt que sur les premières requêtes."""
+    load_keys(search=MESSAGE_SEARCH_ENABLED)  # lecture des fichiers de clés
+    warm_up_hashing()  # détection du backend bcrypt par passlib
+    MESSAGES_ADAPTER.dump_json([])  # sérialiseurs pydantic construits
+    USERS_ADAPTER.dump_json([])
+    with SessionLocal() as db:  # pool ouvert + pages chaudes de users en cache SQLite
+        db.execute(text("SELECT 1"))
+        db.execute(select(func.count(User.id)))
+    if UI_STATIC is not None:  # empreintes + variantes gzip de l'UI, une fois par worker
+        logger.info("UI statique : %s", UI_STATIC.load())
+
+
+def _startup() -> dict:
+    """Migrations + préchauffage ; renvoie les durées (ms) de chaque phase."""
+    t0 = time.perf_counter()
+    version = run_migrations(engine)
+    init_shards()  # MESSAGE_SHARDS : création/vérification des shards de messages
+    t1 = time.perf_counter()
+    _warm_up()
+    t2 = time.perf_counter()
+    timings = {
+        "schema_version": version,
+        "migrations_ms": round((t1 - t0) * 1000, 1),
+        "warm_up_ms": round((t2 - t1) * 1000, 1),
+    }
+    logger.info("Démarrage : %s", timings)
+    return timings
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Lifespan FastAPI (remplace les anciens @app.on_event)
 # ─────────────────────────────────────────────────────────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Démarrage
-    Base.metadata.create_all(bind=engine)
-    task = asyncio.create_task(_cleanup_loop())
+    app.state.startup = _startup()
+    # Tâches de fond uniques : seulement sur le worker leader (uvicorn --workers N)
+    leader = LeaderElection(LEADER_LOCK_FILE, LEADER_RETRY_S)
+    leader.add_job("purge-ttl", _cleanup_loop)
+    leader.add_job("archive-messages", _archive_loop)
+    leader.add_job("compact-connections", _compaction_loop)
+    leader.add_job("admin-jobs", _admin_jobs_loop)
+    app.state.leader = leader
+    task = asyncio.create_task(leader.run())
     try:
         yield
     finally:
-        # Arrêt propre de la tâche
+        # Arrêt propre : tâches annulées, verrou relâché (un autre worker prend le relais)
         task.cancel()
         with contextlib.suppress(asyncio.CancelledError):
             await task
@@ -90,6 +252,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if SQL_PROFILING:
+    app.add_middleware(ProfilerMiddleware)
 
 # Routeurs
 app.include_router(auth_router.router, prefix="/auth", tags=["auth"])
@@ -97,13 +263,19 @@ app.include_router(messages_router.router, prefix="/rooms", tags=["messages"])
 app.include_router(connections_router.router, prefix="/connections", tags=["connections"])
 app.include_router(users_router.router)  # le routeur a déjà prefix="/users"
 app.include_router(dm_router.router, prefix="/dm", tags=["dm"])
+app.include_router(groups_router.router)  # prefix="/groups" dans le routeur
+app.include_router(attachments_router.router)  # prefix="/attachments" dans le routeur
 app.include_router(presence_router.router)
 app.include_router(admin_router.router)
+if METRICS_ENABLED:
+    app.include_router(metrics_router.router)
 
-# UI statique facultative (si app/../web existe) -> /ui
+# UI statique facultative (si app/../web existe) -> /ui ; empreintes et gzip préparés au
+# démarrage (app/static_ui.py)
 _web_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "web"))
-if os.path.isdir(_web_dir):
-    app.mount("/ui", StaticFiles(directory=_web_dir, html=True), name="ui")
+UI_STATIC = UIStatic(_web_dir) if os.path.isdir(_web_dir) else None
+if UI_STATIC is not None:
+    app.mount("/ui", UI_STATIC, name="ui")
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Lancement direct en dev
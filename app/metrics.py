@@ -0,0 +1,263 @@
+"""Métriques internes exposées au format texte Prometheus (`GET /metrics`).
+
+- Histogrammes à seaux fixes : mémoire constante (un compteur par seau), `observe` = une
+  bissection + un verrou tenu le temps de trois additions.
+- Étiquettes bornées : gabarit de route (`/rooms/{room_id}/messages`) et non le chemin brut.
+- Temps DB par requête : événements SQLAlchemy sur `engine` cumulés dans un ContextVar posé
+  par le middleware (hérité par le pool de threads des routes synchrones).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seaux (secondes) : latences HTTP / DB / crypto / bcrypt
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Histogram:
+    """Histogramme à seaux fixes (cumulés à l'export)."""
+
+    __slots__ = ("bounds", "counts", "total", "count", "_lock")
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # dernier = +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def snapshot(self) -> tuple[list[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+class Counter:
+    """Compteur monotone."""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _Family(ABC):
+    """Famille de métriques étiquetées (une instance enfant par tuple d'étiquettes)."""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    @abstractmethod
+    def _new_child(self) -> object:
+        """Nouvel enfant (Histogram, Counter…) pour un tuple d'étiquettes."""
+
+    def labels(self, *values: str):
+        child = self._children.get(values)  # chemin rapide, sans verrou
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self) -> list[tuple[tuple[str, ...], object]]:
+        with self._lock:
+            return sorted(self._children.items(), key=lambda kv: kv[0])
+
+    def _label_str(self, values: tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self) -> Histogram:
+        return Histogram(self.buckets)
+
+    def render(self) -> list[str]:
+        lines = []
+        for values, hist in self._items():
+            counts, total, count = hist.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = self._label_str(values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(values)} {total}")
+            lines.append(f"{self.name}_count{self._label_str(values)} {count}")
+        return lines
+
+
+class CounterFamily(_Family):
+    kind = "counter"
+
+    def _new_child(self) -> Counter:
+        return Counter()
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{self._label_str(values)} {c.value}" for values, c in self._items()]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY: list[_Family] = []
+
+HTTP_LATENCY = HistogramFamily(
+    "offcom_http_request_duration_seconds",
+    "Durée des requêtes HTTP par route",
+    ("method", "route", "status"),
+)
+HTTP_DB_TIME = HistogramFamily(
+    "offcom_http_request_db_seconds", "Temps DB cumulé par requête HTTP", ("method", "route")
+)
+DB_QUERY = HistogramFamily("offcom_db_query_duration_seconds", "Durée des requêtes SQL")
+CRYPTO = HistogramFamily(
+    "offcom_crypto_duration_seconds", "Durée Fernet (au repos)", ("op",), FAST_BUCKETS
+)
+BCRYPT = HistogramFamily("offcom_bcrypt_duration_seconds", "Durée bcrypt", ("op",))
+CLEANUP = HistogramFamily(
+    "offcom_cleanup_duration_seconds", "Durée d'une passe de purge TTL", (), SLOW_BUCKETS
+)
+CLEANUP_ROWS = CounterFamily("offcom_cleanup_deleted_rows_total", "Lignes supprimées par la purge")
+EPHEMERAL_EVENTS = CounterFamily(
+    "offcom_ephemeral_events_total", "Événements éphémères publiés", ("outcome",)
+)
+COMPACTION = HistogramFamily(
+    "offcom_connections_compaction_duration_seconds",
+    "Durée d'une passe de compactage de connections",
+    (),
+    SLOW_BUCKETS,
+)
+COMPACTION_ROWS = CounterFamily(
+    "offcom_connections_compacted_rows_total", "Lignes de connections supprimées par compactage"
+)
+
+ARCHIVE = HistogramFamily(
+    "offcom_archive_duration_seconds", "Durée d'une passe d'archivage froid", (), SLOW_BUCKETS
+)
+ARCHIVE_ROWS = CounterFamily(
+    "offcom_archived_messages_total", "Messages déplacés vers les segments d'archive"
+)
+
+
+def render_prometheus() -> str:
+    """Toutes les métriques au format d'exposition texte Prometheus 0.0.4."""
+    lines: list[str] = []
+    for fam in REGISTRY:
+        lines.append(f"# HELP {fam.name} {fam.help}")
+        lines.append(f"# TYPE {fam.name} {fam.kind}")
+        lines.extend(fam.render())
+    return "\n".join(lines) + "\n"
+
+
+# ─────────────────────────── Temps DB (événements SQLAlchemy) ───────────────────────────
+# Accumulateur [secondes] de la requête HTTP en cours (None hors requête)
+_request_db_time: ContextVar[Optional[list[float]]] = ContextVar("request_db_time", default=None)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Mesure chaque requête SQL (histogramme global + cumul par requête HTTP)."""
+    db_hist = DB_QUERY.labels()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_hist.observe(elapsed)
+        acc = _request_db_time.get()
+        if acc is not None:
+            acc[0] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+
+# ─────────────────────────── Middleware ASGI ───────────────────────────
+class MetricsMiddleware:
+    """Middleware ASGI pur : latence + temps DB par (méthode, gabarit de route, statut)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_holder = [500]
+
+        async def _send(message) -> None:
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        acc = [0.0]
+        token = _request_db_time.set(acc)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            elapsed = time.perf_counter() - t0
+            _request_db_time.reset(token)
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            method = scope.get("method", "")
+            HTTP_LATENCY.labels(method, template, str(status_holder[0])).observe(elapsed)
+            HTTP_DB_TIME.labels(method, template).observe(acc[0])
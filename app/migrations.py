@@ -0,0 +1,359 @@
+"""Migrations de schéma versionnées (SQLite), sans Alembic.
+
+- La version du schéma est stockée dans l'en-tête SQLite (`PRAGMA user_version`).
+- Au démarrage : une seule lecture de cette version ; si elle est à jour, aucune
+  introspection ni `create_all` n'est exécuté.
+- Sinon, sous verrou fichier (plusieurs workers peuvent démarrer ensemble), on applique
+  dans l'ordre les étapes dont la version dépasse celle de la base.
+- L'étape 1 crée le schéma courant (create_all) : sur une base neuve, les étapes suivantes
+  n'ont donc rien à faire. Chaque étape doit rester idempotente (IF NOT EXISTS, colonne
+  ajoutée seulement si absente…), car elle peut tourner sur une base déjà à jour.
+
+Ajouter une migration : une fonction `_mNNN_xxx(conn)` + une entrée dans MIGRATIONS.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from contextlib import nullcontext
+from typing import Callable
+
+from filelock import FileLock
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from .database import Base
+from .search import create_user_search_index, detect_user_search_index
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> None:
+    cols = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+    if column not in cols:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _m001_initial_schema(conn: Connection) -> None:
+    from . import models  # noqa: F401  (enregistre les tables dans Base.metadata)
+
+    Base.metadata.create_all(bind=conn)
+
+
+def _m002_public_key_version(conn: Connection) -> None:
+    _add_column_if_missing(conn, "users", "public_key_version", "INTEGER DEFAULT 0")
+
+
+def _m003_connections_owner_seen(conn: Connection) -> None:
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS idx_connections_owner_seen "
+            "ON connections (owner_id, last_seen)"
+        )
+    )
+
+
+def _m004_users_fts(conn: Connection) -> None:
+    create_user_search_index(conn)
+
+
+def _m005_cache_versions(conn: Connection) -> None:
+    # Compteurs par table pour l'invalidation des caches (app/invalidation.py)
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS cache_versions ("
+            "name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+        )
+    )
+    conn.execute(text("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('users', 0)"))
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+        conn.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS users_cv_{suffix} AFTER {event} ON users BEGIN "
+                "UPDATE cache_versions SET version = version + 1 WHERE name = 'users'; END"
+            )
+        )
+
+
+_DEDUP_CONNECTIONS = (
+    "DELETE FROM connections WHERE {where} AND id NOT IN ("
+    "SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+    "PARTITION BY {key} ORDER BY last_seen DESC, id DESC) AS rn "
+    "FROM connections WHERE {where}) WHERE rn = 1)"
+)
+
+
+def _m006_connections_unique(conn: Connection) -> None:
+    # Doublons historiques (SELECT puis INSERT non atomique) : on garde la ligne la plus récente
+    for name, key, where in (
+        (
+            "uq_connections_owner_transport_address",
+            "owner_id, transport, address",
+            "peer_id IS NULL",
+        ),
+        ("uq_connections_owner_peer", "owner_id, peer_id", "peer_id IS NOT NULL"),
+    ):
+        conn.execute(text(_DEDUP_CONNECTIONS.format(key=key, where=where)))
+        conn.execute(
+            text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON connections ({key}) WHERE {where}")
+        )
+
+
+def _m007_attachments(conn: Connection) -> None:
+    from .models import Attachment, AttachmentUpload, Blob
+
+    Base.metadata.create_all(
+        bind=conn, tables=[Blob.__table__, Attachment.__table__, AttachmentUpload.__table__]
+    )
+    _add_column_if_missing(conn, "messages", "attachment_id", "INTEGER REFERENCES attachments (id)")
+    conn.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_messages_attachment_id ON messages (attachment_id)")
+    )
+
+
+def _m008_connections_last_seen(conn: Connection) -> None:
+    conn.execute(
+        text("CREATE INDEX IF NOT EXISTS idx_connections_last_seen ON connections (last_seen)")
+    )
+
+
+def create_message_version_triggers(conn: Connection) -> None:
+    """Compteurs 'messages' (toute écriture) et 'messages_deleted' (suppressions) : repères
+    d'historique par room (app/room_marks.py). Aussi appelé sur chaque shard de messages."""
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS cache_versions ("
+            "name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+        )
+    )
+    conn.execute(
+        text(
+            "INSERT OR IGNORE INTO cache_versions (name, version) "
+            "VALUES ('messages', 0), ('messages_deleted', 0)"
+        )
+    )
+    for suffix, event, names in (
+        ("ai", "INSERT", "'messages'"),
+        ("au", "UPDATE", "'messages'"),
+        ("ad", "DELETE", "'messages', 'messages_deleted'"),
+    ):
+        conn.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS messages_cv_{suffix} AFTER {event} ON messages "
+                f"BEGIN UPDATE cache_versions SET version = version + 1 WHERE name IN ({names}); "
+                "END"
+            )
+        )
+
+
+def _m009_message_versions(conn: Connection) -> None:
+    create_message_version_triggers(conn)
+
+
+def create_archive_tables(conn: Connection) -> None:
+    """Index des segments d'archive froide ; supprimer (purger, réécrire) un segment fait
+    avancer les compteurs des messages, comme une suppression de messages. Aussi sur les shards.
+    """
+    from .models import ArchiveAttachment, ArchiveSegment, ArchiveSender
+
+    tables = [ArchiveSegment.__table__, ArchiveSender.__table__, ArchiveAttachment.__table__]
+    Base.metadata.create_all(bind=conn, tables=tables)
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS archive_segments_cv_ad AFTER DELETE ON archive_segments "
+            "BEGIN UPDATE cache_versions SET version = version + 1 "
+            "WHERE name IN ('messages', 'messages_deleted'); END"
+        )
+    )
+
+
+def _m010_archive_segments(conn: Connection) -> None:
+    create_archive_tables(conn)
+
+
+def _m011_admin_jobs(conn: Connection) -> None:
+    from .models import AdminJob
+
+    Base.metadata.create_all(bind=conn, tables=[AdminJob.__table__])
+
+
+def create_message_client_ids(conn: Connection) -> None:
+    """Colonne messages.client_msg_id + index unique partiel (room, expéditeur, clé). Aussi
+    appelé sur chaque shard de messages. Portée par room : une room vit dans un seul shard,
+    l'unicité y est donc garantie par l'index, quel que soit le nombre de shards."""
+    _add_column_if_missing(conn, "messages", "client_msg_id", "VARCHAR(64)")
+    # Ancien index (expéditeur, clé), unique par fichier seulement avec MESSAGE_SHARDS
+    conn.execute(text("DROP INDEX IF EXISTS uq_messages_sender_client"))
+    conn.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_room_sender_client "
+            "ON messages (room_id, sender_id, client_msg_id) WHERE client_msg_id IS NOT NULL"
+        )
+    )
+
+
+def _m012_message_client_ids(conn: Connection) -> None:
+    create_message_client_ids(conn)
+
+
+def _m013_group_rooms(conn: Connection) -> None:
+    from .models import GroupMember, GroupRoom
+
+    Base.metadata.create_all(bind=conn, tables=[GroupRoom.__table__, GroupMember.__table__])
+    # Cache des membres (app/groups.py) vidé dès qu'une appartenance change, tous workers
+    conn.execute(
+        text("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('group_members', 0)")
+    )
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+        conn.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS group_members_cv_{suffix} AFTER {event} "
+                "ON group_members BEGIN "
+                "UPDATE cache_versions SET version = version + 1 WHERE name = 'group_members'; END"
+            )
+        )
+
+
+def _m014_admin_listing_indexes(conn: Connection) -> None:
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_users_admin_id ON users (is_admin, id)"))
+    conn.execute(
+        text("CREATE INDEX IF NOT EXISTS idx_connections_address ON connections (address)")
+    )
+
+
+def _m015_room_scoped_client_ids(conn: Connection) -> None:
+    create_message_client_ids(conn)
+
+
+def create_dm_peer_indexes(conn: Connection) -> None:
+    """Index partiel (second participant d'une DM, room) sur messages et archive_segments,
+    voir models.DM_PEER_SQL. Aussi appelé sur chaque shard de messages."""
+    from .models import DM_PEER_SQL
+
+    for table in ("messages", "archive_segments"):
+        conn.execute(
+            text(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_dm_peer "
+                f"ON {table} ({DM_PEER_SQL}, room_id) WHERE {DM_PEER_SQL} IS NOT NULL"
+            )
+        )
+
+
+def _m016_dm_peer(conn: Connection) -> None:
+    create_dm_peer_indexes(conn)
+
+
+def message_id_floor(conn: Connection) -> int:
+    """Plus grand identifiant de message jamais attribué dans cette base : messages, archive,
+    jetons de recherche et compteur AUTOINCREMENT."""
+    seq = 0
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'")).first():
+        seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'messages'")).scalar()
+    return max(
+        seq or 0,
+        conn.execute(text("SELECT max(id) FROM messages")).scalar() or 0,
+        conn.execute(text("SELECT max(last_id) FROM archive_segments")).scalar() or 0,
+        conn.execute(text("SELECT max(message_id) FROM message_tokens")).scalar() or 0,
+    )
+
+
+def _m017_messages_autoincrement(conn: Connection) -> None:
+    """Reconstruit messages en AUTOINCREMENT (SQLite ne sait pas l'ajouter à une table) :
+    sans lui, supprimer le plus grand id (purge, suppression d'utilisateur) laissait SQLite
+    réattribuer des identifiants déjà archivés ou encore présents dans message_tokens."""
+    from .models import Message
+
+    table = Message.__table__
+    ddl = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'")
+    ).scalar()
+    if "AUTOINCREMENT" not in (ddl or "").upper():
+        create = str(CreateTable(table).compile(dialect=conn.dialect))
+        conn.execute(text(create.replace("CREATE TABLE messages", "CREATE TABLE messages_new", 1)))
+        cols = ", ".join(c.name for c in table.c)
+        conn.execute(text(f"INSERT INTO messages_new ({cols}) SELECT {cols} FROM messages"))
+        conn.execute(text("DROP TABLE messages"))  # ses index et triggers avec elle
+        conn.execute(text("ALTER TABLE messages_new RENAME TO messages"))
+        for index in table.indexes:  # table neuve : aucun index encore
+            index.create(conn)
+        create_message_version_triggers(conn)
+    # Plancher du compteur : au-delà de tout id déjà vu (archive et jetons compris)
+    floor = message_id_floor(conn)
+    conn.execute(
+        text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'messages', 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'messages')"
+        )
+    )
+    conn.execute(
+        text("UPDATE sqlite_sequence SET seq = max(seq, :floor) WHERE name = 'messages'"),
+        {"floor": floor},
+    )
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "schéma initial", _m001_initial_schema),
+    (2, "users.public_key_version", _m002_public_key_version),
+    (3, "index connections(owner_id, last_seen)", _m003_connections_owner_seen),
+    (4, "index FTS5 trigram des noms d'utilisateur", _m004_users_fts),
+    (5, "compteurs de version pour l'invalidation des caches", _m005_cache_versions),
+    (6, "connections : une ligne par clé (index uniques partiels)", _m006_connections_unique),
+    (7, "pièces jointes (blobs, attachments, envois par blocs)", _m007_attachments),
+    (8, "index connections(last_seen)", _m008_connections_last_seen),
+    (9, "compteurs de version des messages (historique conditionnel)", _m009_message_versions),
+    (10, "segments d'archive froide des messages", _m010_archive_segments),
+    (11, "tâches d'administration en arrière-plan", _m011_admin_jobs),
+    (12, "clés d'idempotence des messages", _m012_message_client_ids),
+    (13, "rooms de groupe et leurs membres", _m013_group_rooms),
+    (14, "index des listes admin (users, connections)", _m014_admin_listing_indexes),
+    (15, "clés d'idempotence uniques par room", _m015_room_scoped_client_ids),
+    (16, "second participant des rooms DM (my-rooms sans parcours de users)", _m016_dm_peer),
+    (
+        17,
+        "messages en AUTOINCREMENT (identifiants jamais réattribués)",
+        _m017_messages_autoincrement,
+    ),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: Connection) -> int:
+    return int(conn.execute(text("PRAGMA user_version")).scalar() or 0)
+
+
+def run_migrations(engine: Engine) -> int:
+    """Met le schéma à jour si besoin ; renvoie la version finale."""
+    if engine.dialect.name != "sqlite":
+        # Hors SQLite : pas de user_version, on garde le comportement historique
+        with engine.begin() as conn:
+            _m001_initial_schema(conn)
+        return LATEST_VERSION
+
+    db_file = engine.url.database
+    on_disk = bool(db_file) and db_file != ":memory:"
+    if on_disk:
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)) or ".", exist_ok=True)
+
+    with engine.connect() as conn:
+        current = schema_version(conn)
+    if current < LATEST_VERSION:
+        lock = FileLock(os.path.abspath(db_file) + ".migrate.lock") if on_disk else nullcontext()
+        with lock:
+            with engine.begin() as conn:
+                current = schema_version(conn)  # un autre worker a pu migrer entre-temps
+                for version, description, step in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    logger.info("Migration %d : %s", version, description)
+                    step(conn)
+                    conn.execute(text(f"PRAGMA user_version = {version}"))
+                    current = version
+    elif current > LATEST_VERSION:
+        logger.warning(
+            "Schéma en version %d, plus récent que ce code (%d)", current, LATEST_VERSION
+        )
+
+    detect_user_search_index(engine)
+    return current
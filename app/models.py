@@ -3,11 +3,22 @@ from __future__ import annotations
 from datetime import datetime, timezone
 from typing import List
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, String, Text, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
 
+# Second participant d'une room DM : "dmid:<a>:<b>" → "<b>", "dm:<x>:<y>" → "<y>", NULL sinon.
+# Index partiel sur cette expression (messages, archive_segments) : les DM dont l'utilisateur
+# est le second participant se trouvent sans parcourir la table users. Les requêtes doivent
+# reprendre l'expression telle quelle (DM_PEER) pour que SQLite utilise l'index.
+DM_PEER_SQL = (
+    "(CASE WHEN room_id >= 'dmid:' AND room_id < 'dmid;' "
+    "THEN substr(room_id, instr(substr(room_id, 6), ':') + 6) "
+    "WHEN room_id >= 'dm:' AND room_id < 'dm;' "
+    "THEN substr(room_id, instr(substr(room_id, 4), ':') + 4) END)"
+)
+
 
 class User(Base):
     """Utilisateur local (compte applicatif)."""
@@ -20,6 +31,7 @@ class User(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     token_version: Mapped[int] = mapped_column(Integer, default=0)
     public_key: Mapped[str | None] = mapped_column(String(2048), nullable=True)  # clé publique
+    public_key_version: Mapped[int] = mapped_column(Integer, default=0)  # +1 à chaque changement
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)  # privilèges admin
 
     # Relations (chargées à la demande)
@@ -31,10 +43,17 @@ class User(Base):
     )
 
 
+# Vue admin filtrée sur le drapeau, paginée par id (keyset)
+Index("idx_users_admin_id", User.is_admin, User.id)
+
+
 class Message(Base):
     """Message textuel dans une room (canal)."""
 
     __tablename__ = "messages"
+    # AUTOINCREMENT : un identifiant n'est jamais réattribué (archive, jetons de recherche,
+    # clients), même après suppression du plus grand (migration 17)
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     room_id: Mapped[str] = mapped_column(String(128), index=True)
@@ -43,6 +62,13 @@ class Message(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), index=True, default=lambda: datetime.now(timezone.utc)
     )
+    # Pièce jointe éventuelle (référence seulement, le fichier est dans le magasin de blobs)
+    attachment_id: Mapped[int | None] = mapped_column(
+        ForeignKey("attachments.id"), index=True, nullable=True
+    )
+    # Clé d'idempotence fournie par le client (Idempotency-Key / client_msg_id) : un renvoi
+    # après coupure réseau retrouve ce message au lieu d'en créer un doublon
+    client_msg_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
 
     # Relation inverse vers User
     sender: Mapped[User] = relationship(back_populates="messages")
@@ -50,6 +76,118 @@ class Message(Base):
 
 # Index composé pour accélérer les timelines par room/chrono
 Index("idx_messages_room_ts", Message.room_id, Message.created_at)
+# Rooms DM par second participant (/rooms/my-rooms)
+Index(
+    "idx_messages_dm_peer",
+    text(DM_PEER_SQL),
+    Message.room_id,
+    sqlite_where=text(f"{DM_PEER_SQL} IS NOT NULL"),
+)
+# Une clé d'idempotence par room et expéditeur (messages sans clé non indexés)
+Index(
+    "uq_messages_room_sender_client",
+    Message.room_id,
+    Message.sender_id,
+    Message.client_msg_id,
+    unique=True,
+    sqlite_where=Message.client_msg_id.isnot(None),
+)
+
+
+class MessageToken(Base):
+    """Index aveugle : jeton HMAC d'un mot normalisé d'un message (recherche sans déchiffrer)."""
+
+    __tablename__ = "message_tokens"
+
+    room_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    token: Mapped[str] = mapped_column(String(32), primary_key=True)  # HMAC tronqué (hex)
+    message_id: Mapped[int] = mapped_column(
+        ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+
+
+class ArchiveSegment(Base):
+    """Segment d'archive froide : messages anciens d'une room, compressés dans un fichier
+    immuable (app/archive.py). Les lignes quittent `messages` ; leurs jetons de recherche restent.
+    """
+
+    __tablename__ = "archive_segments"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    room_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    path: Mapped[str] = mapped_column(String(255), unique=True)  # relatif à ARCHIVE_DIR
+    first_id: Mapped[int] = mapped_column(Integer, nullable=False)  # plus petit id contenu
+    last_id: Mapped[int] = mapped_column(Integer, nullable=False)  # plus grand id contenu
+    first_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)  # purge TTL
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)  # octets sur disque
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+
+# Historique d'une room : ses segments dans l'ordre chronologique
+Index("idx_archive_segments_room", ArchiveSegment.room_id, ArchiveSegment.first_at)
+Index(
+    "idx_archive_segments_dm_peer",
+    text(DM_PEER_SQL),
+    ArchiveSegment.room_id,
+    sqlite_where=text(f"{DM_PEER_SQL} IS NOT NULL"),
+)
+
+
+class ArchiveSender(Base):
+    """Expéditeurs présents dans un segment (my-rooms, suppression d'un utilisateur)."""
+
+    __tablename__ = "archive_senders"
+
+    segment_id: Mapped[int] = mapped_column(
+        ForeignKey("archive_segments.id", ondelete="CASCADE"), primary_key=True
+    )
+    sender_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+
+
+class ArchiveAttachment(Base):
+    """Pièces jointes référencées par un segment (ramasse-miettes, droits de lecture)."""
+
+    __tablename__ = "archive_attachments"
+
+    segment_id: Mapped[int] = mapped_column(
+        ForeignKey("archive_segments.id", ondelete="CASCADE"), primary_key=True
+    )
+    attachment_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+
+
+class GroupRoom(Base):
+    """Room de groupe (room_id "grp:<id>") : seuls ses membres la lisent et y écrivent."""
+
+    __tablename__ = "group_rooms"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(128), nullable=False)
+    is_private: Mapped[bool] = mapped_column(Boolean, default=False)  # entrée sur ajout seulement
+    created_by: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class GroupMember(Base):
+    """Appartenance d'un utilisateur à une room de groupe."""
+
+    __tablename__ = "group_members"
+
+    group_id: Mapped[int] = mapped_column(
+        ForeignKey("group_rooms.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+    role: Mapped[str] = mapped_column(String(16), default="member")  # 'owner' | 'member'
+    joined_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
 
 
 class Connection(Base):
@@ -67,3 +205,98 @@ class Connection(Base):
     )
 
     owner: Mapped["User"] = relationship(back_populates="connections")
+
+
+# Présence : MAX(last_seen) par owner lu directement dans l'index (couvrant)
+Index("idx_connections_owner_seen", Connection.owner_id, Connection.last_seen)
+# Activité récente (flux de présence, vue admin) : seulement les lignes modifiées depuis T
+Index("idx_connections_last_seen", Connection.last_seen)
+# Vue admin : filtre par préfixe d'adresse (intervalle sur l'index)
+Index("idx_connections_address", Connection.address)
+# Une ligne par clé → upsert en une instruction (INSERT … ON CONFLICT DO UPDATE)
+# - télémétrie (peer_id NULL) : (owner, transport, adresse)
+# - voisins P2P : (owner, peer)
+Index(
+    "uq_connections_owner_transport_address",
+    Connection.owner_id,
+    Connection.transport,
+    Connection.address,
+    unique=True,
+    sqlite_where=Connection.peer_id.is_(None),
+)
+Index(
+    "uq_connections_owner_peer",
+    Connection.owner_id,
+    Connection.peer_id,
+    unique=True,
+    sqlite_where=Connection.peer_id.isnot(None),
+)
+
+
+class Blob(Base):
+    """Contenu de fichier adressé par son sha256 (stocké une seule fois, chiffré par blocs)."""
+
+    __tablename__ = "blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    chunk_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    path: Mapped[str] = mapped_column(String(255), nullable=False)  # relatif à ATTACHMENTS_DIR
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class Attachment(Base):
+    """Pièce jointe d'un utilisateur : métadonnées + référence vers un blob partagé."""
+
+    __tablename__ = "attachments"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True, nullable=False)
+    blob_sha256: Mapped[str] = mapped_column(ForeignKey("blobs.sha256"), index=True)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    content_type: Mapped[str] = mapped_column(String(127), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), index=True, default=lambda: datetime.now(timezone.utc)
+    )
+
+    blob: Mapped[Blob] = relationship(lazy="joined")
+
+
+class AttachmentUpload(Base):
+    """Envoi par blocs en cours (reprenable) ; les blocs reçus sont sur disque."""
+
+    __tablename__ = "attachment_uploads"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)  # uuid4 hex
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    chunk_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    content_type: Mapped[str] = mapped_column(String(127), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), index=True, default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class AdminJob(Base):
+    """Tâche d'administration longue, exécutée en arrière-plan (app/jobs.py)."""
+
+    __tablename__ = "admin_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)  # uuid4 hex
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)  # ex. "delete-user"
+    target_id: Mapped[int | None] = mapped_column(Integer, index=True, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), index=True, default="pending")
+    progress: Mapped[str] = mapped_column(Text, default="{}")  # JSON
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_by: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    # Battement : mis à jour à chaque lot ; trop ancien → tâche reprise par le leader
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
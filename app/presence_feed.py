@@ -0,0 +1,251 @@
+"""Flux de présence partagé (SSE) : transitions en ligne / hors ligne calculées une seule fois.
+
+- Un suivi par fenêtre `minutes`, créé au premier abonné et arrêté au départ du dernier.
+- Chargement initial : une requête (dernier last_seen de chaque utilisateur), puis état
+  en mémoire. Ensuite, toutes les PRESENCE_TICK_S secondes :
+  - passages en ligne : seules les connexions modifiées depuis le dernier passage sont lues
+    (index idx_connections_last_seen) ;
+  - passages hors ligne : en mémoire, tas trié par échéance (last_seen + fenêtre).
+  Le coût est donc proportionnel aux transitions, pas au nombre d'abonnés ni d'utilisateurs.
+- Chaque transition est diffusée à tous les abonnés (file par abonné) et gardée dans un
+  tampon circulaire pour la reprise `Last-Event-ID` ; au-delà, l'abonné reçoit un instantané.
+- Par worker : chaque worker lit la base (source de vérité) pour ses propres abonnés.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import logging
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import func, select
+
+from .config import PRESENCE_HEARTBEAT_S, PRESENCE_REPLAY_SIZE, PRESENCE_TICK_S
+from .database import SessionLocal
+from .models import Connection, User
+
+logger = logging.getLogger(__name__)
+
+# Écritures concurrentes : un last_seen légèrement antérieur peut être validé après un plus
+# récent. On relit donc un peu avant le dernier maximum vu (relecture idempotente).
+_OVERLAP = timedelta(seconds=5)
+_QUEUE_MAX = 1000  # abonné trop lent → déconnecté (il reprendra via Last-Event-ID)
+
+try:
+    from zoneinfo import ZoneInfo
+
+    TZ_PARIS = ZoneInfo("Europe/Paris")
+except Exception:
+    TZ_PARIS = None
+
+
+def _utc(ts: Optional[datetime]) -> Optional[datetime]:
+    if ts is not None and ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+@dataclass(slots=True)
+class _UserState:
+    username: str
+    is_admin: bool
+    last_seen: Optional[datetime]
+    online: bool = False
+
+    def entry(self, user_id: int) -> dict:
+        ls = self.last_seen
+        return {
+            "user_id": user_id,
+            "username": self.username,
+            "online": self.online,
+            "last_seen": ls.isoformat() if ls else None,
+            "last_seen_paris": ls.astimezone(TZ_PARIS).isoformat() if (ls and TZ_PARIS) else None,
+            "is_admin": self.is_admin,
+        }
+
+
+def _sse(event: str, data, event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class _PresenceTracker:
+    """État de présence d'une fenêtre donnée, partagé par tous ses abonnés."""
+
+    def __init__(self, minutes: int) -> None:
+        self.window = timedelta(minutes=minutes)
+        self.epoch = uuid.uuid4().hex[:8]  # change à chaque recréation → ids précédents caducs
+        self.seq = 0
+        self.users: dict[int, _UserState] = {}
+        # (échéance, user_id) ; entrées périmées tolérées, ignorées au dépilage
+        self.expiry: list[tuple[datetime, int]] = []
+        self.watermark: Optional[datetime] = None
+        self.replay: deque[tuple[int, str]] = deque(maxlen=PRESENCE_REPLAY_SIZE)
+        self.subscribers: set[asyncio.Queue] = set()
+        self.ready = asyncio.Event()
+        self.failed = False  # chargement initial en échec : abonnés avertis, suivi abandonné
+        self.task: Optional[asyncio.Task] = None
+
+    # ── Lecture base (dans un thread) ──
+    def _load_all(self) -> list:
+        last = (
+            select(Connection.owner_id, func.max(Connection.last_seen).label("last_seen"))
+            .group_by(Connection.owner_id)
+            .subquery()
+        )
+        with SessionLocal() as db:
+            return db.execute(
+                select(User.id, User.username, User.is_admin, last.c.last_seen).outerjoin(
+                    last, last.c.owner_id == User.id
+                )
+            ).all()
+
+    def _load_changed(self, since: datetime) -> list:
+        with SessionLocal() as db:
+            return db.execute(
+                select(
+                    Connection.owner_id,
+                    User.username,
+                    User.is_admin,
+                    func.max(Connection.last_seen),
+                )
+                .join(User, User.id == Connection.owner_id)
+                .where(Connection.last_seen > since)
+                .group_by(Connection.owner_id)
+            ).all()
+
+    # ── Mise à jour de l'état ──
+    def _apply(self, user_id: int, username: str, is_admin: bool, last_seen, now, emit: bool):
+        last_seen = _utc(last_seen)
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = _UserState(username, bool(is_admin), None)
+        if last_seen is None or (state.last_seen and last_seen <= state.last_seen):
+            return
+        state.last_seen = last_seen
+        if self.watermark is None or last_seen > self.watermark:
+            self.watermark = last_seen
+        if last_seen + self.window > now:
+            heapq.heappush(self.expiry, (last_seen + self.window, user_id))
+            if not state.online:
+                state.online = True
+                if emit:
+                    self._emit("online", user_id, state)
+
+    def _expire(self, now: datetime) -> None:
+        while self.expiry and self.expiry[0][0] <= now:
+            _, user_id = heapq.heappop(self.expiry)
+            state = self.users.get(user_id)
+            # Entrée périmée si l'utilisateur a été revu depuis (échéance plus lointaine)
+            if state and state.online and state.last_seen + self.window <= now:
+                state.online = False
+                self._emit("offline", user_id, state)
+
+    def _emit(self, kind: str, user_id: int, state: _UserState) -> None:
+        self.seq += 1
+        message = _sse(kind, state.entry(user_id), f"{self.epoch}-{self.seq}")
+        self.replay.append((self.seq, message))
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((self.seq, message))
+            except asyncio.QueueFull:
+                self.subscribers.discard(queue)  # son flux se termine à la prochaine itération
+
+    def snapshot(self) -> str:
+        entries = sorted(
+            (s.entry(uid) for uid, s in self.users.items()), key=lambda e: e["username"]
+        )
+        return _sse("snapshot", entries, f"{self.epoch}-{self.seq}")
+
+    def replay_after(self, last_event_id: Optional[str]) -> Optional[list[tuple[int, str]]]:
+        """Événements après `last_event_id`, ou None si impossible (autre époque, trop ancien)."""
+        if not last_event_id:
+            return None
+        epoch, _, seq_str = last_event_id.partition("-")
+        if epoch != self.epoch or not seq_str.isdigit():
+            return None
+        seq = int(seq_str)
+        if seq > self.seq:
+            return None
+        if seq < self.seq and (not self.replay or self.replay[0][0] > seq + 1):
+            return None  # trou dans le tampon
+        return [(s, m) for s, m in self.replay if s > seq]
+
+    # ── Boucle partagée ──
+    async def run(self) -> None:
+        now = datetime.now(timezone.utc)
+        try:
+            rows = await asyncio.to_thread(self._load_all)
+        except Exception as exc:
+            logger.error("Chargement initial du flux de présence: %s", exc, exc_info=True)
+            self.failed = True
+            self.ready.set()  # sinon les abonnés attendraient indéfiniment
+            return
+        for row in rows:
+            self._apply(*row, now=now, emit=False)
+        self.ready.set()
+        while True:
+            await asyncio.sleep(PRESENCE_TICK_S)
+            try:
+                now = datetime.now(timezone.utc)
+                since = (self.watermark or now - self.window) - _OVERLAP
+                for row in await asyncio.to_thread(self._load_changed, since):
+                    self._apply(*row, now=now, emit=True)
+                self._expire(now)
+            except Exception as exc:
+                logger.error("Erreur du flux de présence: %s", exc, exc_info=True)
+
+
+class PresenceFeed:
+    """Suivis par fenêtre ; démarre/arrête leur boucle selon la présence d'abonnés."""
+
+    def __init__(self) -> None:
+        self._trackers: dict[int, _PresenceTracker] = {}
+
+    async def stream(self, minutes: int, last_event_id: Optional[str]) -> AsyncIterator[str]:
+        tracker = self._trackers.get(minutes)
+        if tracker is None:
+            tracker = self._trackers[minutes] = _PresenceTracker(minutes)
+            tracker.task = asyncio.create_task(tracker.run())
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_MAX)
+        tracker.subscribers.add(queue)
+        try:
+            await tracker.ready.wait()
+            if tracker.failed:
+                # Retiré tout de suite : l'abonné suivant (ou la reconnexion) recrée un suivi
+                if self._trackers.get(minutes) is tracker:
+                    del self._trackers[minutes]
+                yield _sse("error", {"detail": "Présence indisponible, réessayer plus tard"})
+                return
+            yield f"retry: {int(PRESENCE_TICK_S * 1000)}\n\n"
+            replay = tracker.replay_after(last_event_id)
+            if replay is None:
+                sent = tracker.seq
+                yield tracker.snapshot()
+            else:
+                sent = replay[-1][0] if replay else int(last_event_id.rpartition("-")[2])
+                for _, message in replay:
+                    yield message
+            while queue in tracker.subscribers:
+                try:
+                    seq, message = await asyncio.wait_for(queue.get(), PRESENCE_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"  # garde la connexion ouverte (proxies)
+                    continue
+                if seq > sent:  # déjà envoyé via le tampon / l'instantané
+                    sent = seq
+                    yield message
+        finally:
+            tracker.subscribers.discard(queue)
+            if not tracker.subscribers and self._trackers.get(minutes) is tracker:
+                del self._trackers[minutes]
+                tracker.task.cancel()
+
+
+FEED = PresenceFeed()
@@ -0,0 +1,180 @@
+"""Profilage SQL par requête HTTP (mode debug, SQL_PROFILING=true).
+
+Pour chaque requête : nombre d'instructions SQL, temps DB total, instruction la plus lente et
+formes répétées (même SQL normalisé exécuté N fois → suspicion de N+1, ex. `db.get(User, ...)`
+dans une boucle).
+- En-têtes de réponse : `Server-Timing` (db, app) et `X-SQL-Queries`.
+- Rapport glissant en mémoire (PROFILER_REPORT_SIZE dernières requêtes) : /admin/profiler.
+- Aide aux tests : `assert_query_budget(n)` échoue si un bloc dépasse n requêtes SQL
+  (tests/test_profiler.py : historique d'une room).
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import PROFILER_N_PLUS_ONE, PROFILER_REPORT_SIZE
+
+_WS_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """SQL normalisé : espaces compactés, listes `IN (?, ?, ...)` ramenées à `(?)`."""
+    return _IN_LIST_RE.sub("(?)", _WS_RE.sub(" ", statement).strip())
+
+
+class RequestProfile:
+    """Mesures SQL d'une requête HTTP."""
+
+    __slots__ = ("queries", "db_time", "slowest_sql", "slowest_time", "shapes")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_sql = ""
+        self.slowest_time = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        shape = statement_shape(statement)
+        self.queries += 1
+        self.db_time += elapsed
+        self.shapes[shape] += 1
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_sql = shape
+
+    def repeated(self, threshold: int = PROFILER_N_PLUS_ONE) -> list[dict]:
+        return [
+            {"sql": sql[:500], "count": n} for sql, n in self.shapes.most_common() if n >= threshold
+        ]
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+_report: deque[dict] = deque(maxlen=PROFILER_REPORT_SIZE)
+_report_lock = threading.Lock()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Branche le profileur sur `engine` (n'enregistre que pendant une requête profilée)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+        profile = _current.get()
+        if profile is not None:
+            profile.record(statement, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("profile_start"):
+            conn.info["profile_start"].pop()
+
+
+def recent_report(limit: int = 50, only_n_plus_one: bool = False) -> list[dict]:
+    """Dernières requêtes profilées (plus récentes d'abord)."""
+    with _report_lock:
+        entries = list(_report)
+    entries.reverse()
+    if only_n_plus_one:
+        entries = [e for e in entries if e["repeated"]]
+    return entries[:limit]
+
+
+class ProfilerMiddleware:
+    """Middleware ASGI : profile SQL de chaque requête → en-têtes + rapport glissant."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        token = _current.set(profile)
+        t0 = time.perf_counter()
+        status_holder = [500]
+
+        async def _send(message) -> None:
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                app_ms = (time.perf_counter() - t0) * 1000
+                timing = (
+                    f'db;dur={profile.db_time * 1000:.2f};desc="{profile.queries} queries", '
+                    f"app;dur={app_ms:.2f}"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.encode("latin-1")))
+                headers.append((b"x-sql-queries", str(profile.queries).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            entry = {
+                "method": scope.get("method", ""),
+                "path": scope.get("path", ""),
+                "route": getattr(route, "path", None),
+                "status": status_holder[0],
+                "queries": profile.queries,
+                "db_ms": round(profile.db_time * 1000, 2),
+                "total_ms": round((time.perf_counter() - t0) * 1000, 2),
+                "slowest": {
+                    "sql": profile.slowest_sql[:500],
+                    "ms": round(profile.slowest_time * 1000, 2),
+                },
+                "repeated": profile.repeated(),
+            }
+            with _report_lock:
+                _report.append(entry)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Levée par `assert_query_budget` quand un bloc dépasse son budget de requêtes SQL."""
+
+
+@contextmanager
+def assert_query_budget(max_queries: int, engine: Optional[Engine] = None) -> Iterator[list[str]]:
+    """Aide aux tests : compte toutes les requêtes SQL exécutées dans le bloc (tous threads).
+
+    with assert_query_budget(4):
+        client.get("/rooms/dmid:1:2/messages", headers=auth)
+    """
+    if engine is None:
+        from .database import engine as default_engine
+
+        engine = default_engine
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement_shape(statement))
+
+    event.listen(engine, "after_cursor_execute", _count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "after_cursor_execute", _count)
+    if len(statements) > max_queries:
+        detail = "\n".join(f"  {n}× {sql}" for sql, n in Counter(statements).most_common(5))
+        raise QueryBudgetExceeded(
+            f"{len(statements)} requêtes SQL (budget {max_queries}) :\n{detail}"
+        )
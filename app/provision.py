@@ -0,0 +1,215 @@
+"""Création de comptes en masse (import d'un site) depuis un fichier CSV ou NDJSON.
+
+`/auth/register` coûte un hachage bcrypt et une transaction par compte ; pour des milliers de
+comptes :
+
+- Les lignes sont validées comme à l'inscription (UserCreate, clé publique ≤ 4096 caractères) ;
+  doublons du fichier : la première occurrence gagne.
+- Les noms déjà pris sont écartés en une requête ensembliste (username IN (…)), avant tout
+  hachage.
+- Les mots de passe sont hachés en parallèle dans un pool de processus (un par cœur par
+  défaut : bcrypt est lié au CPU, les threads resteraient sous le GIL).
+- Les insertions se font par lots, une transaction par lot (INSERT … ON CONFLICT DO NOTHING :
+  un nom créé entre-temps par /auth/register est simplement compté comme existant). Le lot N
+  est écrit pendant que les processus hachent la suite.
+- Un bilan JSON (compteurs, durées, comptes/s) est affiché à la fin.
+
+Format : colonnes `username`, `password`, et optionnellement `public_key`, `is_admin`
+(true/1/oui). CSV avec ligne d'en-tête, ou un objet JSON par ligne (.ndjson / .jsonl).
+
+Usage :
+    python -m app.provision users.csv [--workers 8] [--batch 500]
+    python -m app.provision users.ndjson --format ndjson
+    cat users.csv | python -m app.provision - --format csv
+"""
+
+from __future__ import annotations
+
+import os
+
+# IMPORTANT — ce bloc doit être AVANT tout import relatif (from .xxx import ...)
+import sys
+
+if __name__ == "__main__" and __package__ is None:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    __package__ = "app"
+
+import argparse
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .auth import get_password_hash
+from .database import SessionLocal, engine
+from .migrations import run_migrations
+from .models import User
+from .schemas import UserCreate
+
+_IN_CHUNK = 10_000  # noms par requête d'existence (sous la limite de paramètres SQLite)
+_MAX_ERRORS = 20  # erreurs détaillées dans le bilan
+_TRUE = {"1", "true", "yes", "oui", "y", "o"}
+
+
+# ─────────────────────────── Lecture et validation ───────────────────────────
+def _read_records(stream: TextIO, fmt: str) -> Iterator[tuple[int, dict[str, Any]]]:
+    """(numéro de ligne, enregistrement brut) pour chaque ligne de données."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_no, {"__error__": f"JSON invalide : {exc.msg}"}
+            continue
+        yield line_no, record if isinstance(record, dict) else {"__error__": "objet attendu"}
+
+
+def _validate(record: dict[str, Any]) -> dict[str, Any]:
+    """Ligne → valeurs de la table users (mot de passe en clair) ; ValueError si invalide."""
+    if "__error__" in record:
+        raise ValueError(record["__error__"])
+    try:
+        user = UserCreate(
+            username=str(record.get("username") or "").strip(),
+            password=str(record.get("password") or ""),
+            public_key=(str(record.get("public_key") or "").strip() or None),
+        )
+    except ValidationError as exc:
+        err = exc.errors()[0]
+        raise ValueError(f"{'.'.join(map(str, err['loc']))} : {err['msg']}") from None
+    if user.public_key and len(user.public_key) > 4096:
+        raise ValueError("Clé publique trop longue")
+    is_admin = record.get("is_admin")
+    return {
+        "username": user.username,
+        "password": user.password,
+        "public_key": user.public_key,
+        "public_key_version": 1 if user.public_key else 0,
+        "is_admin": is_admin is True or str(is_admin or "").strip().lower() in _TRUE,
+    }
+
+
+def _existing_usernames(names: list[str]) -> set[str]:
+    """Noms déjà présents en base : une requête ensembliste (par tranche de _IN_CHUNK)."""
+    found: set[str] = set()
+    with SessionLocal() as db:
+        for start in range(0, len(names), _IN_CHUNK):
+            stop = start + _IN_CHUNK
+            found.update(
+                db.scalars(select(User.username).where(User.username.in_(names[start:stop])))
+            )
+    return found
+
+
+# ─────────────────────────── Hachage parallèle, insertions par lots ───────────────────────────
+def _insert_batch(rows: list[dict[str, Any]]) -> int:
+    """Un lot = une transaction ; renvoie le nombre de comptes réellement créés."""
+    stmt = sqlite_insert(User).on_conflict_do_nothing(index_elements=[User.username])
+    with engine.begin() as conn:
+        return conn.execute(stmt, rows).rowcount
+
+
+def provision(
+    records: Iterable[tuple[int, dict[str, Any]]],
+    workers: Optional[int] = None,
+    batch: int = 500,
+) -> dict[str, Any]:
+    """Crée les comptes valides et absents ; renvoie le bilan."""
+    started = time.perf_counter()
+    workers = max(1, workers or os.cpu_count() or 1)
+    report: dict[str, Any] = {"read": 0, "invalid": 0, "duplicates": 0, "existing": 0}
+    errors: list[dict[str, Any]] = []
+
+    pending: dict[str, dict[str, Any]] = {}
+    for line_no, record in records:
+        report["read"] += 1
+        try:
+            row = _validate(record)
+        except ValueError as exc:
+            report["invalid"] += 1
+            if len(errors) < _MAX_ERRORS:
+                errors.append({"line": line_no, "error": str(exc)})
+            continue
+        if row["username"] in pending:
+            report["duplicates"] += 1
+            continue
+        pending[row["username"]] = row
+
+    existing = _existing_usernames(list(pending))
+    todo = [row for name, row in pending.items() if name not in existing]
+    report["existing"] = len(existing)
+
+    hash_started = time.perf_counter()
+    created = 0
+    passwords = [row.pop("password") for row in todo]
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(todo) > 1 else None
+    try:
+        if pool is not None:
+            chunksize = max(1, min(64, len(todo) // (workers * 4)))
+            hashes = pool.map(get_password_hash, passwords, chunksize=chunksize)
+        else:
+            hashes = map(get_password_hash, passwords)
+        rows: list[dict[str, Any]] = []
+        for row, password_hash in zip(todo, hashes):
+            row["password_hash"] = password_hash
+            rows.append(row)
+            if len(rows) >= batch:
+                created += _insert_batch(rows)
+                rows = []
+        if rows:
+            created += _insert_batch(rows)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    report["existing"] += len(todo) - created  # créés ailleurs entre la vérification et l'insert
+    report.update(
+        created=created,
+        workers=workers if pool is not None else 1,
+        batch=batch,
+        hash_insert_seconds=round(time.perf_counter() - hash_started, 3),
+        total_seconds=round(elapsed, 3),
+        users_per_s=round(created / elapsed, 1) if elapsed > 0 else None,
+        errors=errors,
+    )
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Création de comptes OffCom en masse")
+    parser.add_argument("source", help="Fichier CSV / NDJSON ('-' : entrée standard)")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="Déduit de l'extension")
+    parser.add_argument("--workers", type=int, default=None, help="Processus de hachage (cœurs)")
+    parser.add_argument("--batch", type=int, default=500, help="Comptes par transaction")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.source)[1].lower()
+        fmt = "ndjson" if ext in (".ndjson", ".jsonl", ".json") else "csv"
+
+    # Crée / met à jour le schéma si besoin
+    run_migrations(engine)
+
+    if args.source == "-":
+        report = provision(_read_records(sys.stdin, fmt), args.workers, max(1, args.batch))
+    else:
+        with open(args.source, encoding="utf-8", newline="") as stream:
+            report = provision(_read_records(stream, fmt), args.workers, max(1, args.batch))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
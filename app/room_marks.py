@@ -0,0 +1,84 @@
+"""Repères par room (« high-water mark ») pour le GET conditionnel de l'historique.
+
+- Repère d'une room = (dernier id de message, compteur de suppressions de sa base). Un envoi
+  change le premier ; la purge TTL, l'archivage froid ou la suppression d'un utilisateur, le
+  second. L'ETag de GET /rooms/{id}/messages en dérive (avec les paramètres) : il est
+  identique sur tous les workers, un client peut alterner entre eux.
+- Gardé en mémoire avec la version "messages" de sa base (cache_versions + triggers,
+  migration 9 ; le shard de la room avec MESSAGE_SHARDS). Version inchangée → repère exact,
+  If-None-Match obtient 304 sans requête ni déchiffrement. Sinon un seul accès d'index
+  (MAX(id) de la room) le recalcule.
+- post_message et la purge oublient directement les repères de ce worker ; les écritures des
+  autres workers sont vues par la version (`PRAGMA data_version`, cf. app/invalidation.py).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .config import DATABASE_URL
+from .invalidation import DATA_VERSION, DataVersionWatcher
+from .models import Message
+from .shards import storage_url
+
+_Mark = tuple[int, Hashable]  # (dernier id, compteur de suppressions)
+
+
+class RoomMarks:
+    """room_id → repère, valable tant que la version "messages" de sa base n'a pas bougé."""
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = maxsize
+        self._marks: OrderedDict[str, tuple[Hashable, _Mark]] = OrderedDict()
+        self._watchers: dict[str, DataVersionWatcher] = {DATABASE_URL: DATA_VERSION}
+        self._lock = threading.Lock()
+
+    def _watcher(self, room_id: str) -> DataVersionWatcher:
+        url = storage_url(room_id)
+        watcher = self._watchers.get(url)
+        if watcher is None:
+            with self._lock:
+                watcher = self._watchers.setdefault(url, DataVersionWatcher(url))
+        return watcher
+
+    def current(self, room_db: Session, room_id: str) -> _Mark:
+        """Repère de la room : en mémoire si encore valable, sinon relu (une requête d'index)."""
+        watcher = self._watcher(room_id)
+        # Versions lues AVANT la requête : une écriture concurrente rend le repère périmé
+        version = watcher.version("messages")
+        with self._lock:
+            cached = self._marks.get(room_id)
+            if cached is not None and cached[0] == version:
+                self._marks.move_to_end(room_id)
+                return cached[1]
+        deleted = watcher.version("messages_deleted")
+        last_id = room_db.scalar(select(func.max(Message.id)).where(Message.room_id == room_id))
+        mark = (last_id or 0, deleted)
+        with self._lock:
+            self._marks[room_id] = (version, mark)
+            self._marks.move_to_end(room_id)
+            if len(self._marks) > self.maxsize:
+                self._marks.popitem(last=False)
+        return mark
+
+    def discard(self, room_id: str) -> None:
+        with self._lock:
+            self._marks.pop(room_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._marks.clear()
+
+
+def history_etag(mark: _Mark, since_ms: Optional[int], limit: int) -> str:
+    etag_str = f"{mark[0]}|{mark[1]}|{since_ms or 0}|{limit}"
+    return 'W/"' + hashlib.sha256(etag_str.encode("utf-8")).hexdigest() + '"'
+
+
+ROOM_MARKS = RoomMarks()
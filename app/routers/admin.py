@@ -1,25 +1,51 @@
 from __future__ import annotations
 
-from typing import List
+from typing import List, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from ..backup import create_snapshot, list_snapshots
+from ..config import SQL_PROFILING
 from ..database import get_db
 from ..deps import require_admin
-from ..models import User
-from ..schemas import UserPublic
+from ..export import messages_export_stmt, ndjson_export_response
+from ..jobs import job_out, run_job, start_user_deletion
+from ..models import AdminJob, User
+from ..profiler import recent_report
+from ..schemas import AdminJobOut, UserPublic
+from ..serialization import USERS_ADAPTER, json_list_response, ndjson_response, user_public
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
 @router.get("/users", response_model=List[UserPublic])
 def admin_list_all_users(
+    cursor: int | None = Query(None, description="X-Next-Cursor de la page précédente"),
+    limit: int = Query(500, ge=1, le=5000),
+    is_admin: bool | None = Query(None, description="Seulement les admins (ou non-admins)"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson : tout, en flux"),
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin),
-) -> List[UserPublic]:
-    rows = db.query(User).order_by(User.id.asc()).all()
-    return [UserPublic.model_validate(u) for u in rows]
+) -> Response:
+    """
+    Utilisateurs par id croissant, pagination par curseur (keyset : `id > cursor`, pas
+    d'OFFSET). Page pleine → en-tête `X-Next-Cursor` à renvoyer comme `cursor`.
+    `format=ndjson` : toute la suite en flux (curseur serveur), sans `limit`.
+    Filtre `is_admin` : index (is_admin, id).
+    """
+    stmt = select(User.id, User.username, User.is_admin, User.public_key).order_by(User.id)
+    if cursor is not None:
+        stmt = stmt.where(User.id > cursor)
+    if is_admin is not None:
+        stmt = stmt.where(User.is_admin == is_admin)
+    if format == "ndjson":
+        return ndjson_response(stmt, user_public)
+    rows = db.execute(stmt.limit(limit)).all()
+    headers = {"X-Next-Cursor": str(rows[-1].id)} if len(rows) == limit else None
+    return json_list_response(USERS_ADAPTER, [user_public(u) for u in rows], headers=headers)
 
 
 @router.post("/users/{user_id:int}/promote", response_model=UserPublic)
@@ -50,14 +76,92 @@ def admin_demote(
     return UserPublic.model_validate(user)
 
 
-@router.delete("/users/{user_id:int}", status_code=204)
+@router.delete("/users/{user_id:int}", status_code=202, response_model=AdminJobOut)
 def admin_delete_user(
-    user_id: int, db: Session = Depends(get_db), admin: User = Depends(require_admin)
-) -> None:
+    user_id: int,
+    response: Response,
+    background: BackgroundTasks,
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+) -> AdminJobOut:
+    """
+    Suppression asynchrone (app/jobs.py) : l'utilisateur est révoqué tout de suite (jetons
+    refusés, connexion impossible), ses données sont supprimées par lots en arrière-plan.
+    Suivi : `Location` → GET /admin/jobs/{id}. Rappeler la route renvoie la tâche en cours.
+    """
     if user_id == admin.id:
         raise HTTPException(status_code=400, detail="Impossible de se supprimer soi-même")
     user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
-    db.delete(user)
-    db.commit()
+    job = start_user_deletion(db, user, admin.id)
+    background.add_task(run_job, job.id)
+    response.headers["Location"] = f"/admin/jobs/{job.id}"
+    return job_out(job)
+
+
+@router.get("/jobs", response_model=List[AdminJobOut])
+def admin_list_jobs(
+    status: str | None = Query(None, description="pending | running | done | failed"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin),
+) -> List[AdminJobOut]:
+    """Tâches d'administration, plus récentes d'abord."""
+    stmt = select(AdminJob).order_by(AdminJob.created_at.desc()).limit(limit)
+    if status is not None:
+        stmt = stmt.where(AdminJob.status == status)
+    return [job_out(job) for job in db.scalars(stmt)]
+
+
+@router.get("/jobs/{job_id}", response_model=AdminJobOut)
+def admin_get_job(
+    job_id: str, db: Session = Depends(get_db), admin: User = Depends(require_admin)
+) -> AdminJobOut:
+    """État et progression (compteurs par étape) d'une tâche d'administration."""
+    job = db.get(AdminJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Tâche introuvable")
+    return job_out(job)
+
+
+@router.get("/export/messages")
+def admin_export_messages(
+    room_id: str | None = Query(None, description="Limiter à une room"),
+    user_id: int | None = Query(None, description="Limiter aux messages de cet expéditeur"),
+    admin: User = Depends(require_admin),
+) -> StreamingResponse:
+    """Export NDJSON (flux) de l'historique : global, par room et/ou par expéditeur."""
+    return ndjson_export_response(
+        messages_export_stmt(room_id=room_id, sender_id=user_id),
+        "messages.ndjson",
+        room_id=room_id,
+        sender_id=user_id,
+    )
+
+
+@router.post("/backups", status_code=201)
+def admin_create_backup(admin: User = Depends(require_admin)) -> dict:
+    """Snapshot à chaud de la base + clés (API de sauvegarde SQLite, par pas)."""
+    try:
+        return create_snapshot()
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/backups")
+def admin_list_backups(admin: User = Depends(require_admin)) -> List[dict]:
+    """Snapshots disponibles (plus récents d'abord)."""
+    return list_snapshots()
+
+
+@router.get("/profiler")
+def admin_profiler_report(
+    limit: int = Query(50, ge=1, le=1000),
+    only_n_plus_one: bool = Query(False, description="Seulement les requêtes avec SQL répété"),
+    admin: User = Depends(require_admin),
+) -> dict:
+    """Rapport glissant du profileur SQL (SQL_PROFILING=true) : dernières requêtes d'abord."""
+    if not SQL_PROFILING:
+        raise HTTPException(status_code=404, detail="Profilage SQL désactivé")
+    return {"requests": recent_report(limit, only_n_plus_one)}
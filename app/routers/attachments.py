@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import re
+import uuid
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, union
+from sqlalchemy.orm import Session
+
+from ..attachments import (
+    IncompleteUpload,
+    chunk_count,
+    discard_upload,
+    expected_chunk_len,
+    finalize_upload,
+    iter_blob_range,
+    received_chunks,
+    write_chunk,
+)
+from ..config import ATTACHMENT_CHUNK_SIZE
+from ..database import get_db
+from ..deps import get_current_user
+from ..models import (
+    ArchiveAttachment,
+    ArchiveSegment,
+    Attachment,
+    AttachmentUpload,
+    Message,
+    User,
+)
+from ..schemas import AttachmentOut, AttachmentUploadIn, AttachmentUploadOut
+from ..shards import message_dbs
+from .messages import _ensure_room_access
+
+router = APIRouter(prefix="/attachments", tags=["attachments"])
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _upload_out(upload: AttachmentUpload) -> AttachmentUploadOut:
+    return AttachmentUploadOut(
+        upload_id=upload.id,
+        size=upload.size,
+        chunk_size=upload.chunk_size,
+        chunks=chunk_count(upload.size, upload.chunk_size),
+        received=received_chunks(upload.id),
+    )
+
+
+def _attachment_out(att: Attachment) -> AttachmentOut:
+    return AttachmentOut(
+        id=att.id,
+        filename=att.filename,
+        content_type=att.content_type,
+        size=att.blob.size,
+        sha256=att.blob_sha256,
+        created_at=att.created_at,
+    )
+
+
+def _owned_upload(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> AttachmentUpload:
+    upload = db.get(AttachmentUpload, upload_id)
+    if not upload or upload.owner_id != current.id:
+        raise HTTPException(status_code=404, detail="Envoi introuvable")
+    return upload
+
+
+def _readable_attachment(
+    attachment_id: int,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> Attachment:
+    """Lisible par son propriétaire et par les membres d'une room où elle a été envoyée."""
+    att = db.get(Attachment, attachment_id)
+    if att and att.owner_id != current.id:
+        for mdb in message_dbs(db):  # base principale, ou chaque shard (MESSAGE_SHARDS)
+            rooms = mdb.scalars(
+                union(
+                    select(Message.room_id).where(Message.attachment_id == att.id),
+                    # Messages archivés (app/archive.py)
+                    select(ArchiveSegment.room_id)
+                    .join(ArchiveAttachment, ArchiveAttachment.segment_id == ArchiveSegment.id)
+                    .where(ArchiveAttachment.attachment_id == att.id),
+                )
+            )
+            for room_id in rooms:
+                try:
+                    _ensure_room_access(room_id, current)
+                    return att
+                except HTTPException:
+                    continue
+        att = None
+    if not att:
+        raise HTTPException(status_code=404, detail="Pièce jointe introuvable")
+    return att
+
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Une seule plage `bytes=a-b` / `a-` / `-n` → (début, fin incluse) ; None = tout le fichier."""
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None  # plages multiples ou syntaxe inconnue : réponse complète (RFC 9110)
+    first, last = m.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Plage invalide",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+@router.post("/uploads", response_model=AttachmentUploadOut, status_code=201)
+def start_upload(
+    payload: AttachmentUploadIn,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> AttachmentUploadOut:
+    """
+    Ouvre un envoi par blocs : envoyer ensuite chaque bloc (`PUT …/chunks/{index}`,
+    `chunk_size` octets, le dernier plus court) dans n'importe quel ordre, puis `…/complete`.
+    """
+    upload = AttachmentUpload(
+        id=uuid.uuid4().hex,
+        owner_id=current.id,
+        size=payload.size,
+        chunk_size=ATTACHMENT_CHUNK_SIZE,
+        filename=payload.filename,
+        content_type=payload.content_type,
+    )
+    db.add(upload)
+    db.commit()
+    return _upload_out(upload)
+
+
+@router.get("/uploads/{upload_id}", response_model=AttachmentUploadOut)
+def get_upload(upload: AttachmentUpload = Depends(_owned_upload)) -> AttachmentUploadOut:
+    """État d'un envoi : reprendre en renvoyant seulement les blocs absents de `received`."""
+    return _upload_out(upload)
+
+
+@router.put("/uploads/{upload_id}/chunks/{index}", status_code=204)
+async def put_chunk(
+    request: Request,
+    index: int = Path(..., ge=0),
+    upload: AttachmentUpload = Depends(_owned_upload),
+) -> Response:
+    """Corps brut (application/octet-stream) du bloc `index` ; renvoyer un bloc le remplace."""
+    expected = expected_chunk_len(upload.size, upload.chunk_size, index)
+    if not expected:
+        raise HTTPException(status_code=400, detail="Index de bloc hors limites")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > expected:
+        raise HTTPException(status_code=413, detail="Bloc trop grand")
+    # Lu en flux : sans Content-Length (Transfer-Encoding: chunked), rien au-delà de `expected`
+    # n'est gardé en mémoire
+    parts: list[bytes] = []
+    received = 0
+    async for part in request.stream():
+        received += len(part)
+        if received > expected:
+            raise HTTPException(status_code=413, detail="Bloc trop grand")
+        parts.append(part)
+    data = b"".join(parts)
+    if len(data) != expected:
+        raise HTTPException(status_code=400, detail=f"Bloc de {expected} octets attendu")
+    # Chiffrement + écriture hors de la boucle asyncio
+    await run_in_threadpool(write_chunk, upload.id, index, data)
+    return Response(status_code=204)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=AttachmentOut, status_code=201)
+def complete_upload(
+    upload: AttachmentUpload = Depends(_owned_upload),
+    db: Session = Depends(get_db),
+) -> AttachmentOut:
+    """Assemble l'envoi : vérifie les blocs, déduplique (sha256), crée la pièce jointe."""
+    try:
+        att = finalize_upload(db, upload)
+    except IncompleteUpload as exc:
+        raise HTTPException(
+            status_code=409, detail=f"Blocs manquants : {exc.missing[:50]}"
+        ) from None
+    except (ValueError, FileNotFoundError):
+        # Bloc corrompu / finalisation concurrente : l'envoi est à recommencer
+        db.rollback()
+        db.delete(upload)
+        db.commit()
+        discard_upload(upload.id)
+        raise HTTPException(status_code=409, detail="Envoi invalide, à recommencer") from None
+    return _attachment_out(att)
+
+
+@router.get("/{attachment_id}/info", response_model=AttachmentOut)
+def attachment_info(att: Attachment = Depends(_readable_attachment)) -> AttachmentOut:
+    return _attachment_out(att)
+
+
+@router.get("/{attachment_id}")
+def download_attachment(
+    request: Request,
+    att: Attachment = Depends(_readable_attachment),
+) -> Response:
+    """
+    Téléchargement en flux, déchiffré bloc par bloc (jamais tout le fichier en mémoire).
+    - `Range: bytes=a-b` → 206 avec seulement les blocs concernés déchiffrés.
+    - ETag = sha256 du contenu (immuable) → If-None-Match renvoie 304.
+    """
+    blob = att.blob
+    etag = f'"{blob.sha256}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(att.filename)}",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = _parse_range(request.headers.get("range"), blob.size)
+    start, end = byte_range or (0, blob.size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+    return StreamingResponse(
+        iter_blob_range(blob, start, end),
+        status_code=status_code,
+        media_type=att.content_type,
+        headers=headers,
+    )
@@ -30,6 +30,7 @@ def register_user(payload: UserCreate, db: Session = Depends(get_db)) -> dict:
         username=payload.username,
         password_hash=get_password_hash(payload.password),
         public_key=(payload.public_key or None),
+        public_key_version=(1 if payload.public_key else 0),
     )
     db.add(user)
     db.commit()
@@ -1,15 +1,19 @@
 from __future__ import annotations
 
+import base64
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import List, Literal
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import String, select, tuple_, type_coerce
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from ..deps import get_current_user, require_admin
 from ..models import Connection, User
-from ..schemas import ConnectionIn, ConnectionOut
+from ..schemas import ConnectionAdminOut, ConnectionIn, ConnectionOut
+from ..serialization import CONNECTIONS_ADAPTER, json_list_response, ndjson_response
 
 router = APIRouter(tags=["connections"])
 
@@ -28,75 +32,136 @@ def upsert_connection(
     db: Session = Depends(get_db),
     current: User = Depends(get_current_user),
 ) -> ConnectionOut:
-    """Crée ou met à jour une entrée de voisin pour l'utilisateur courant."""
-    existing = (
-        db.query(Connection)
-        .filter(Connection.owner_id == current.id, Connection.peer_id == payload.peer_id)
-        .first()
-    )
+    """Crée ou met à jour une entrée de voisin pour l'utilisateur courant.
+    Une seule instruction (INSERT … ON CONFLICT DO UPDATE sur l'index unique (owner, peer)) :
+    pas de course entre deux upserts concurrents du même voisin.
+    """
     last_seen_at = (
         datetime.fromtimestamp(payload.last_seen_ms / 1000, tz=timezone.utc)
         if payload.last_seen_ms is not None
         else datetime.now(timezone.utc)
     )
-    if existing:
-        existing.transport = payload.transport
-        existing.address = payload.address
-        existing.last_seen = last_seen_at
-        db.add(existing)
-        db.commit()
-        db.refresh(existing)
-        conn = existing
-    else:
-        conn = Connection(
-            owner_id=current.id,
-            peer_id=payload.peer_id,
-            transport=payload.transport,
-            address=payload.address,
-            last_seen=last_seen_at,
-        )
-        db.add(conn)
-        db.commit()
-        db.refresh(conn)
+    stmt = sqlite_insert(Connection).values(
+        owner_id=current.id,
+        peer_id=payload.peer_id,
+        transport=payload.transport,
+        address=payload.address,
+        last_seen=last_seen_at,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Connection.owner_id, Connection.peer_id],
+        index_where=Connection.peer_id.isnot(None),
+        set_={
+            "transport": stmt.excluded.transport,
+            "address": stmt.excluded.address,
+            "last_seen": stmt.excluded.last_seen,
+        },
+    )
+    db.execute(stmt)
+    db.commit()
+    # Valeurs écrites telles quelles : pas de relecture
     return ConnectionOut(
-        peer_id=conn.peer_id,
-        transport=conn.transport,
-        address=conn.address,
-        last_seen=conn.last_seen,
-        last_seen_paris=(
-            conn.last_seen.astimezone(TZ_PARIS).isoformat()
-            if (TZ_PARIS and conn.last_seen)
-            else None
-        ),
+        peer_id=payload.peer_id,
+        transport=payload.transport,
+        address=payload.address,
+        last_seen=last_seen_at,
+        last_seen_paris=last_seen_at.astimezone(TZ_PARIS).isoformat() if TZ_PARIS else None,
     )
 
 
-@router.get("")
+def _prefix_upper_bound(prefix: str) -> str:
+    """Plus petite chaîne > toutes celles qui commencent par `prefix` (intervalle d'index)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _encode_cursor(seen_raw: str, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{seen_raw}|{row_id}".encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        seen_raw, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode().split("|")
+        return seen_raw, int(row_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
+def _connection_out(row) -> ConnectionAdminOut:
+    last_seen = row.last_seen
+    if TZ_PARIS and last_seen is not None:
+        aware = last_seen if last_seen.tzinfo else last_seen.replace(tzinfo=timezone.utc)
+        last_seen_paris = aware.astimezone(TZ_PARIS).isoformat()
+    else:
+        last_seen_paris = None
+    return ConnectionAdminOut.model_construct(
+        id=row.id,
+        owner_id=row.owner_id,
+        peer_id=row.peer_id,
+        transport=row.transport,
+        address=row.address,
+        last_seen=last_seen,
+        last_seen_paris=last_seen_paris,
+    )
+
+
+@router.get("", response_model=List[ConnectionAdminOut])
 def list_connections(
     minutes: int = Query(10, ge=1, le=1440),
+    cursor: str | None = Query(None, description="X-Next-Cursor de la page précédente"),
+    limit: int = Query(500, ge=1, le=5000),
+    transport: str | None = Query(None, description="Ex. 'http', 'websocket'"),
+    address_prefix: str | None = Query(None, min_length=1, description="Ex. '192.168.'"),
+    owner_id: int | None = Query(None),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson : tout, en flux"),
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin),
-) -> List[dict]:
-    """🇫🇷 Liste des connexions vues récemment (last_seen UTC + Paris)."""
+) -> Response:
+    """🇫🇷 Connexions vues récemment (last_seen UTC + Paris), plus récentes d'abord.
+    - Pagination par curseur (keyset sur (last_seen, id), index connections(last_seen)) :
+      page pleine → en-tête `X-Next-Cursor` à renvoyer comme `cursor`.
+    - Filtres en SQL : `owner_id` (index owner/last_seen), `address_prefix` (intervalle sur
+      l'index connections(address)), `transport`.
+    - `format=ndjson` : toute la suite en flux (curseur serveur), sans `limit`.
+    """
     since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    rows = (
-        db.query(Connection)
-        .filter(Connection.last_seen >= since)
-        .order_by(Connection.last_seen.desc())
-        .all()
+    # Valeur stockée telle quelle (texte SQLite) : le curseur la compare sans reconversion
+    seen_raw = type_coerce(Connection.last_seen, String)
+    stmt = (
+        select(
+            Connection.id,
+            Connection.owner_id,
+            Connection.peer_id,
+            Connection.transport,
+            Connection.address,
+            Connection.last_seen,
+            seen_raw.label("seen_raw"),
+        )
+        .where(Connection.last_seen >= since)
+        .order_by(Connection.last_seen.desc(), Connection.id.desc())
     )
-    out = []
-    for c in rows:
-        ls_paris = (
-            c.last_seen.astimezone(TZ_PARIS).isoformat() if (TZ_PARIS and c.last_seen) else None
+    if cursor is not None:
+        cursor_seen, cursor_id = _decode_cursor(cursor)
+        # Borne simple en plus de la comparaison de tuples : l'intervalle d'index commence au
+        # curseur (pas de relecture des pages précédentes)
+        stmt = stmt.where(
+            seen_raw <= cursor_seen,
+            tuple_(seen_raw, Connection.id) < tuple_(cursor_seen, cursor_id),
         )
-        out.append(
-            {
-                "owner_id": c.owner_id,
-                "transport": c.transport,
-                "address": c.address,
-                "last_seen": c.last_seen.isoformat() if c.last_seen else None,  # UTC
-                "last_seen_paris": ls_paris,  # Paris
-            }
+    if owner_id is not None:
+        stmt = stmt.where(Connection.owner_id == owner_id)
+    if transport is not None:
+        stmt = stmt.where(Connection.transport == transport)
+    if address_prefix is not None:
+        stmt = stmt.where(
+            Connection.address >= address_prefix,
+            Connection.address < _prefix_upper_bound(address_prefix),
         )
-    return out
+    if format == "ndjson":
+        return ndjson_response(stmt, _connection_out)
+    rows = db.execute(stmt.limit(limit)).all()
+    headers = None
+    if len(rows) == limit:
+        headers = {"X-Next-Cursor": _encode_cursor(rows[-1].seen_raw, rows[-1].id)}
+    return json_list_response(
+        CONNECTIONS_ADAPTER, [_connection_out(r) for r in rows], headers=headers
+    )
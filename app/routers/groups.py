@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps import get_current_user
+from ..groups import group_members, group_room_id
+from ..models import GroupMember, GroupRoom, User
+from ..schemas import GroupCreate, GroupMemberIn, GroupMemberOut, GroupOut
+
+router = APIRouter(prefix="/groups", tags=["groups"])
+
+
+def _group_out(group: GroupRoom, members: frozenset[int]) -> GroupOut:
+    return GroupOut.model_construct(
+        id=group.id,
+        room_id=group_room_id(group.id),
+        name=group.name,
+        private=bool(group.is_private),
+        created_by=group.created_by,
+        created_at=group.created_at,
+        member_count=len(members),
+    )
+
+
+def _visible_group(db: Session, group_id: int, current: User) -> tuple[GroupRoom, frozenset[int]]:
+    """Groupe et ses membres ; un groupe privé n'existe que pour ses membres."""
+    group = db.get(GroupRoom, group_id)
+    members = group_members(group_id) if group is not None else None
+    if group is None or members is None or (group.is_private and current.id not in members):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Groupe introuvable")
+    return group, members
+
+
+def _add_member(db: Session, group_id: int, user_id: int) -> None:
+    # Idempotent : déjà membre → rien (clé primaire (group_id, user_id))
+    db.execute(
+        sqlite_insert(GroupMember)
+        .values(group_id=group_id, user_id=user_id, role="member")
+        .on_conflict_do_nothing()
+    )
+    db.commit()
+
+
+@router.post("", response_model=GroupOut, status_code=201)
+def create_group(
+    payload: GroupCreate,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> GroupOut:
+    """Crée une room de groupe ; le créateur en est le premier membre (propriétaire)."""
+    group = GroupRoom(name=payload.name.strip(), is_private=payload.private, created_by=current.id)
+    db.add(group)
+    db.flush()
+    db.add(GroupMember(group_id=group.id, user_id=current.id, role="owner"))
+    db.commit()
+    db.refresh(group)
+    return _group_out(group, frozenset({current.id}))
+
+
+@router.get("", response_model=list[GroupOut])
+def list_my_groups(
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> list[GroupOut]:
+    """Groupes dont l'utilisateur courant est membre."""
+    groups = db.scalars(
+        select(GroupRoom)
+        .join(GroupMember, GroupMember.group_id == GroupRoom.id)
+        .where(GroupMember.user_id == current.id)
+        .order_by(GroupRoom.id)
+    ).all()
+    return [_group_out(g, group_members(g.id) or frozenset()) for g in groups]
+
+
+@router.get("/{group_id:int}", response_model=GroupOut)
+def get_group(
+    group_id: int,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> GroupOut:
+    group, members = _visible_group(db, group_id, current)
+    return _group_out(group, members)
+
+
+@router.post("/{group_id:int}/join", response_model=GroupOut)
+def join_group(
+    group_id: int,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> GroupOut:
+    """Rejoindre un groupe public (privé : un membre doit vous ajouter)."""
+    group, members = _visible_group(db, group_id, current)
+    if current.id not in members:
+        if group.is_private:
+            raise HTTPException(status_code=403, detail="Groupe privé : ajout par un membre requis")
+        _add_member(db, group_id, current.id)
+        members = members | {current.id}
+    return _group_out(group, members)
+
+
+@router.post("/{group_id:int}/leave", status_code=204)
+def leave_group(
+    group_id: int,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> Response:
+    """Quitter le groupe (ses messages restent dans l'historique de la room)."""
+    _visible_group(db, group_id, current)
+    db.execute(
+        delete(GroupMember).where(
+            GroupMember.group_id == group_id, GroupMember.user_id == current.id
+        )
+    )
+    db.commit()
+    return Response(status_code=204)
+
+
+@router.get("/{group_id:int}/members", response_model=list[GroupMemberOut])
+def list_group_members(
+    group_id: int,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> list[GroupMemberOut]:
+    """Membres du groupe (réservé aux membres)."""
+    _, members = _visible_group(db, group_id, current)
+    if current.id not in members:
+        raise HTTPException(status_code=403, detail="Accès réservé aux membres du groupe")
+    rows = db.execute(
+        select(GroupMember.user_id, User.username, GroupMember.role, GroupMember.joined_at)
+        .join(User, User.id == GroupMember.user_id)
+        .where(GroupMember.group_id == group_id)
+        .order_by(GroupMember.joined_at, GroupMember.user_id)
+    ).all()
+    return [
+        GroupMemberOut.model_construct(user_id=uid, username=name, role=role, joined_at=joined)
+        for uid, name, role, joined in rows
+    ]
+
+
+@router.post("/{group_id:int}/members", response_model=GroupMemberOut, status_code=201)
+def add_group_member(
+    group_id: int,
+    payload: GroupMemberIn,
+    db: Session = Depends(get_db),
+    current: User = Depends(get_current_user),
+) -> GroupMemberOut:
+    """Un membre ajoute un autre utilisateur (seule façon d'entrer dans un groupe privé)."""
+    _, members = _visible_group(db, group_id, current)
+    if current.id not in members:
+        raise HTTPException(status_code=403, detail="Accès réservé aux membres du groupe")
+    user = db.get(User, payload.user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="Utilisateur introuvable")
+    _add_member(db, group_id, user.id)
+    member = db.get(GroupMember, (group_id, user.id))
+    return GroupMemberOut.model_construct(
+        user_id=user.id, username=user.username, role=member.role, joined_at=member.joined_at
+    )
@@ -1,21 +1,58 @@
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, func, insert, literal_column, select, union
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from ..crypto import encrypt_text, safe_decrypt
+from ..archive import load_ids, room_history
+from ..config import EVENTS_POLL_TIMEOUT_S, MESSAGE_SEARCH_ENABLED
+from ..crypto import blind_token, blind_tokens, encrypt_text, normalize_words, safe_decrypt
 from ..database import get_db
-from ..deps import get_current_user
-from ..models import Message, User
-from ..schemas import MessageIn, MessageOutDetailed
+from ..deps import get_current_user, get_current_user_untracked, get_room_db
+from ..events import HUB
+from ..export import messages_export_stmt, ndjson_export_response
+from ..groups import group_members, group_room_id, is_group_room, parse_group_id
+from ..idempotency import RECENT_POSTS
+from ..models import (
+    DM_PEER_SQL,
+    ArchiveSegment,
+    ArchiveSender,
+    Attachment,
+    GroupMember,
+    Message,
+    MessageToken,
+    User,
+)
+from ..room_marks import ROOM_MARKS, history_etag
+from ..schemas import EphemeralEventIn, EphemeralEventsOut, MessageIn, MessageOutDetailed
+from ..serialization import MESSAGES_ADAPTER, json_list_response
+from ..shards import message_dbs
 from ..utils_dm import is_dm_room, is_dm_room_ids, parse_dm_ids, peer_id_for_sender
 
 router = APIRouter(tags=["messages"])
 
 
-def _ensure_dm_access(room_id: str, current_user: User) -> None:
-    """Autorisation DM: supporte dmid:<idA>:<idB> et compat dm:<alice>:<bob>."""
+def _ensure_room_access(room_id: str, current_user: User) -> None:
+    """Autorisation : DM (dmid:<idA>:<idB>, compat dm:<alice>:<bob>) et groupes (grp:<id>,
+    membres en cache, app/groups.py). Les autres rooms restent ouvertes."""
+    # Groupe : appartenance lue dans le cache des membres (pas de requête par appel)
+    if is_group_room(room_id):
+        try:
+            members = group_members(parse_group_id(room_id))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="room_id de groupe invalide"
+            )
+        if members is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Groupe introuvable")
+        if current_user.id not in members:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Accès réservé aux membres du groupe"
+            )
+        return
+
     # Nouveau format par IDs
     if is_dm_room_ids(room_id):
         try:
@@ -45,6 +82,66 @@ def _ensure_dm_access(room_id: str, current_user: User) -> None:
         return
 
 
+def _to_detailed(db: Session, room_id: str, msgs: list) -> list[MessageOutDetailed]:
+    """Déchiffre et met en forme des messages d'une même room (sender + recipient_id).
+    Construction sans validation : les champs viennent de la DB, déjà typés.
+    """
+    # Détecter si c'est une DM par IDs pour déduire le recipient_id
+    try:
+        a, b = parse_dm_ids(room_id)
+        is_dm = True
+    except ValueError:
+        is_dm = False
+        a = b = 0
+
+    out: list[MessageOutDetailed] = []
+    for m in msgs:
+        # name de l'expéditeur
+        sender_user = db.get(User, m.sender_id)
+        sender_name = sender_user.username if sender_user else f"user:{m.sender_id}"
+        # tenter de décrypter le contenu
+        try:
+            content = safe_decrypt(m.content)
+        except Exception:
+            content = m.content
+
+        # recipient_id (peer) si DM par IDs
+        if is_dm:
+            recipient_id = b if m.sender_id == a else a
+        else:
+            recipient_id = 0
+
+        out.append(
+            MessageOutDetailed.model_construct(
+                id=m.id,
+                room_id=m.room_id,
+                sender=sender_name,
+                sender_id=m.sender_id,
+                recipient_id=recipient_id,
+                content=content,
+                created_at=m.created_at,
+                attachment_id=m.attachment_id,
+            )
+        )
+    return out
+
+
+def _dm_room_branches(room_col, uid: int, uname: str) -> list[Select]:
+    """Rooms DM de l'utilisateur parmi les valeurs de `room_col` (messages ou archive)."""
+    base = select(room_col)
+    # Même texte que l'index idx_<table>_dm_peer (sinon SQLite ne le reconnaît pas)
+    peer_col = literal_column(DM_PEER_SQL)
+    return [
+        # DMs par IDs "dmid:<uid>:*" : intervalle sur room_id (';' suit ':' en ASCII)
+        base.where(room_col >= f"dmid:{uid}:", room_col < f"dmid:{uid};"),
+        # DMs par IDs "dmid:*:<uid>" : index partiel sur le second participant
+        base.where(peer_col == str(uid), room_col >= "dmid:", room_col < "dmid;"),
+        # DMs par usernames (ancien format compat), mêmes principes
+        base.where(room_col >= f"dm:{uname}:", room_col < f"dm:{uname};"),
+        base.where(peer_col == uname, room_col >= "dm:", room_col < "dm;"),
+    ]
+
+
 @router.get("/my-rooms", response_model=list[str])
 def list_user_rooms(
     db: Session = Depends(get_db),
@@ -58,53 +155,50 @@ def list_user_rooms(
       -> idem avec le username courant
     - Bonus : inclure aussi les rooms où l'utilisateur a posté (ex: 'local'),
       pour que le front voie ses fils de discussion "non-DM".
+    - Messages archivés : mêmes règles sur l'index des segments (app/archive.py).
+    - MESSAGE_SHARDS : même requête sur chaque shard, résultats fusionnés.
+    - Groupes (grp:<id>) dont il est membre, même sans message.
     """
     uid = current.id
     uname = current.username
 
-    # Modèles DM
-    dmid_left = f"dmid:{uid}:%"
-    dmid_right = f"dmid:%:{uid}"
-    dm_left = f"dm:{uname}:%"
-    dm_right = f"dm:%:{uname}"
-
-    rows = (
-        db.query(Message.room_id)
-        .filter(
-            or_(
-                # DMs (nouveau format par IDs)
-                Message.room_id.like(dmid_left),
-                Message.room_id.like(dmid_right),
-                # DMs (ancien format par usernames)
-                Message.room_id.like(dm_left),
-                Message.room_id.like(dm_right),
-                # Autres rooms où l'utilisateur a posté
-                Message.sender_id == uid,
-            )
-        )
-        .distinct()
-        .all()
+    # Chaque branche est une recherche indexée (UNION = DISTINCT) ; un OR de LIKE '%...'
+    # obligeait SQLite à parcourir tout l'index des messages.
+    stmt = union(
+        # Rooms où l'utilisateur a posté (ix_messages_sender_id)
+        select(Message.room_id).where(Message.sender_id == uid),
+        *_dm_room_branches(Message.room_id, uid, uname),
+        # Archive froide : expéditeurs par segment (ix_archive_senders_sender_id)
+        select(ArchiveSegment.room_id)
+        .join(ArchiveSender, ArchiveSender.segment_id == ArchiveSegment.id)
+        .where(ArchiveSender.sender_id == uid),
+        *_dm_room_branches(ArchiveSegment.room_id, uid, uname),
     )
+    rooms: set[str] = set()
+    for mdb in message_dbs(db):
+        rooms.update(mdb.scalars(stmt))
+    # Groupes : ceux dont il est membre, même sans message (ix_group_members_user_id), et
+    # pas ceux qu'il a quittés
+    group_ids = db.scalars(select(GroupMember.group_id).where(GroupMember.user_id == uid))
+    rooms = {r for r in rooms if not is_group_room(r)}
+    rooms.update(group_room_id(g) for g in group_ids)
+    return sorted(rooms)
 
-    # rows = [(room_id,), ...] -> on aplatit en liste de str
-    return [r[0] for r in rows]
 
+def _idempotency_key(header: str | None, payload: MessageIn) -> str | None:
+    """Clé d'idempotence du message (en-tête ou champ client_msg_id), None si absente."""
+    key = header.strip() if header is not None else None
+    if key is not None and not 1 <= len(key) <= 64:
+        raise HTTPException(status_code=400, detail="Idempotency-Key invalide (1 à 64 caractères)")
+    if key and payload.client_msg_id and key != payload.client_msg_id:
+        raise HTTPException(status_code=400, detail="Idempotency-Key et client_msg_id diffèrent")
+    return key or payload.client_msg_id
 
-@router.post("/{room_id}/messages", response_model=MessageOutDetailed, status_code=201)
-def post_message(
-    room_id: str,
-    payload: MessageIn,
-    db: Session = Depends(get_db),
-    current: User = Depends(get_current_user),
-) -> MessageOutDetailed:
-    _ensure_dm_access(room_id, current)
-    msg = Message(room_id=room_id, sender_id=current.id, content=encrypt_text(payload.content))
-    db.add(msg)
-    db.commit()
-    db.refresh(msg)
+
+def _posted_out(msg, current: User, content: str) -> MessageOutDetailed:
     # Pour DM, on déduit le recipient_id (peer) du room_id et de l'id courant
     try:
-        recipient_id = peer_id_for_sender(room_id, current.id)
+        recipient_id = peer_id_for_sender(msg.room_id, current.id)
     except ValueError:
         # Pas une DM, ou format inconnu (ex: 'local') -> on met 0
         recipient_id = 0
@@ -115,59 +209,208 @@ def post_message(
         sender=current.username,
         sender_id=current.id,
         recipient_id=recipient_id,
-        content=payload.content,  # в ответ отдаем в открытом виде
+        content=content,  # в ответ отдаем в открытом виде
         created_at=msg.created_at,
+        attachment_id=msg.attachment_id,
     )
 
 
+def _replay(
+    response: Response, original: MessageOutDetailed, payload: MessageIn
+) -> MessageOutDetailed:
+    """Renvoi d'un message déjà créé (même room) : même réponse, si c'est bien le même
+    message."""
+    if (original.content, original.attachment_id) != (payload.content, payload.attachment_id):
+        raise HTTPException(
+            status_code=409, detail="Clé d'idempotence déjà utilisée pour un autre message"
+        )
+    response.headers["Idempotent-Replayed"] = "true"
+    return original
+
+
+@router.post("/{room_id}/messages", response_model=MessageOutDetailed, status_code=201)
+def post_message(
+    room_id: str,
+    payload: MessageIn,
+    response: Response,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db),
+    room_db: Session = Depends(get_room_db),
+    current: User = Depends(get_current_user),
+) -> MessageOutDetailed:
+    """Crée un message. Avec une clé d'idempotence (app/idempotency.py), un renvoi reçoit le
+    message d'origine (en-tête `Idempotent-Replayed: true`) au lieu d'un doublon."""
+    _ensure_room_access(room_id, current)
+    key = _idempotency_key(idempotency_key, payload)
+    if key is not None:
+        original = RECENT_POSTS.get(current.id, room_id, key)
+        if original is not None:
+            return _replay(response, original, payload)
+    if payload.attachment_id is not None:
+        att = db.get(Attachment, payload.attachment_id)
+        if not att or att.owner_id != current.id:
+            raise HTTPException(status_code=404, detail="Pièce jointe introuvable")
+    msg = Message(
+        room_id=room_id,
+        sender_id=current.id,
+        content=encrypt_text(payload.content),
+        attachment_id=payload.attachment_id,
+        client_msg_id=key,
+    )
+    room_db.add(msg)
+    try:
+        if MESSAGE_SEARCH_ENABLED:
+            room_db.flush()  # obtenir msg.id pour l'index aveugle (même transaction)
+            tokens = blind_tokens(payload.content)
+            if tokens:
+                room_db.execute(
+                    insert(MessageToken),
+                    [{"room_id": room_id, "token": t, "message_id": msg.id} for t in tokens],
+                )
+        room_db.commit()
+    except IntegrityError:
+        room_db.rollback()
+        # Clé déjà prise dans la room (uq_messages_room_sender_client) : renvoi traité par un
+        # autre worker ou sorti du cache mémoire → message d'origine
+        first = None
+        if key is not None:
+            first = room_db.scalar(
+                select(Message).where(
+                    Message.room_id == room_id,
+                    Message.sender_id == current.id,
+                    Message.client_msg_id == key,
+                )
+            )
+        if first is None:
+            raise
+        original = _posted_out(first, current, safe_decrypt(first.content))
+        RECENT_POSTS.put(current.id, room_id, key, original)
+        return _replay(response, original, payload)
+    ROOM_MARKS.discard(room_id)
+    room_db.refresh(msg)
+    out = _posted_out(msg, current, payload.content)
+    if key is not None:
+        RECENT_POSTS.put(current.id, room_id, key, out)
+    return out
+
+
 @router.get("/{room_id}/messages", response_model=list[MessageOutDetailed])
 def list_messages(
+    request: Request,
     room_id: str,
     since_ms: int | None = None,
     limit: int = 100,
     db: Session = Depends(get_db),
+    room_db: Session = Depends(get_room_db),
     current: User = Depends(get_current_user),
-) -> list[MessageOutDetailed]:
-    _ensure_dm_access(room_id, current)
-    q = db.query(Message).filter(Message.room_id == room_id)
-    if since_ms:
-        q = q.filter(Message.created_at >= datetime.fromtimestamp(since_ms / 1000, tz=timezone.utc))
-    msgs = q.order_by(Message.created_at.asc()).limit(max(1, min(limit, 500))).all()
+) -> Response:
+    """
+    Historique (ordre chronologique). ETag dérivé du repère de la room (app/room_marks.py) :
+    renvoyer `If-None-Match` → 304 sans requête d'historique ni déchiffrement si rien n'a changé.
+    Les messages sortis de la fenêtre chaude sont lus dans l'archive froide (app/archive.py),
+    toujours plus ancienne que `messages` : elle d'abord, puis la table pour compléter.
+    """
+    _ensure_room_access(room_id, current)
+    limit = max(1, min(limit, 500))
+    etag = history_etag(ROOM_MARKS.current(room_db, room_id), since_ms, limit)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    inm = request.headers.get("if-none-match")
+    if inm and etag in [t.strip() for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+    since = datetime.fromtimestamp(since_ms / 1000, tz=timezone.utc) if since_ms else None
+    msgs: list = room_history(room_db, room_id, since, limit)
+    if len(msgs) < limit:
+        q = room_db.query(Message).filter(Message.room_id == room_id)
+        if since is not None:
+            q = q.filter(Message.created_at >= since)
+        msgs += q.order_by(Message.created_at.asc()).limit(limit - len(msgs)).all()
+    return json_list_response(MESSAGES_ADAPTER, _to_detailed(db, room_id, msgs), headers=headers)
 
-    # Détecter si c'est une DM par IDs pour déduire le recipient_id
-    try:
-        a, b = parse_dm_ids(room_id)
-        is_dm = True
-    except ValueError:
-        is_dm = False
-        a = b = 0
 
-    out: list[MessageOutDetailed] = []
-    for m in msgs:
-        # name de l'expéditeur
-        sender_user = db.get(User, m.sender_id)
-        sender_name = sender_user.username if sender_user else f"user:{m.sender_id}"
-        # tenter de décrypter le contenu
-        try:
-            content = safe_decrypt(m.content)
-        except Exception:
-            content = m.content
+# ───────────────────── Événements éphémères (non persistés) ─────────────────────
+@router.post("/{room_id}/events", status_code=204)
+async def publish_event(
+    room_id: str,
+    payload: EphemeralEventIn,
+    current: User = Depends(get_current_user_untracked),
+) -> Response:
+    """
+    Signal éphémère aux membres de la room ("typing" / "seen") : ni base, ni chiffrement.
+    - Perdu si personne n'écoute ; coalescé et limité en débit par émetteur (app/events.py).
+    """
+    _ensure_room_access(room_id, current)
+    HUB.publish(room_id, current.id, payload)
+    return Response(status_code=204)
 
-        # recipient_id (peer) si DM par IDs
-        if is_dm:
-            recipient_id = b if m.sender_id == a else a
-        else:
-            recipient_id = 0
 
-        out.append(
-            MessageOutDetailed(
-                id=m.id,
-                room_id=m.room_id,
-                sender=sender_name,
-                sender_id=m.sender_id,
-                recipient_id=recipient_id,
-                content=content,
-                created_at=m.created_at,
-            )
+@router.get("/{room_id}/events", response_model=EphemeralEventsOut)
+async def poll_events(
+    room_id: str,
+    after: int = Query(0, ge=0, description="Curseur renvoyé par l'appel précédent"),
+    timeout_s: float = Query(
+        EVENTS_POLL_TIMEOUT_S, ge=0, le=EVENTS_POLL_TIMEOUT_S, description="Attente maximale"
+    ),
+    current: User = Depends(get_current_user_untracked),
+) -> EphemeralEventsOut:
+    """
+    Long-polling des événements éphémères des autres membres de la room.
+    - Répond dès qu'un événement plus récent que `after` existe, sinon après `timeout_s`.
+    - Renvoyer `cursor` comme `after` à l'appel suivant.
+    """
+    _ensure_room_access(room_id, current)
+    events, cursor = await HUB.poll(room_id, current.id, after, timeout_s)
+    return EphemeralEventsOut.model_construct(events=events, cursor=cursor)
+
+
+@router.get("/{room_id}/search", response_model=list[MessageOutDetailed])
+def search_messages(
+    room_id: str,
+    q: str = Query(..., min_length=2, max_length=200, description="Mots recherchés (ET)"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    room_db: Session = Depends(get_room_db),
+    current: User = Depends(get_current_user),
+) -> Response:
+    """
+    Recherche plein texte dans l'historique d'une room via l'index aveugle HMAC.
+    - Les mots de q sont normalisés puis HMAC'és : le serveur ne compare que des jetons.
+    - Seuls les messages candidats (tous les mots présents) sont déchiffrés.
+    - Candidats absents de `messages` : lus dans l'archive froide (jetons conservés).
+    """
+    if not MESSAGE_SEARCH_ENABLED:
+        raise HTTPException(status_code=404, detail="Recherche désactivée")
+    _ensure_room_access(room_id, current)
+    words = normalize_words(q)
+    if not words:
+        return json_list_response(MESSAGES_ADAPTER, [])
+    tokens = [blind_token(w) for w in words]
+    candidate_ids = set(
+        room_db.scalars(
+            select(MessageToken.message_id)
+            .where(MessageToken.room_id == room_id, MessageToken.token.in_(tokens))
+            .group_by(MessageToken.message_id)
+            .having(func.count(MessageToken.token) == len(tokens))
+            .order_by(MessageToken.message_id.desc())
+            .limit(limit)
         )
-    return out
+    )
+    msgs: list = room_db.query(Message).filter(Message.id.in_(candidate_ids)).all()
+    archived_ids = candidate_ids - {m.id for m in msgs}
+    msgs += load_ids(room_db, room_id, archived_ids)
+    msgs.sort(key=lambda m: (m.created_at, m.id))
+    out = _to_detailed(db, room_id, msgs)
+    # HMAC tronqué : on écarte d'éventuelles collisions après déchiffrement
+    wanted = set(words)
+    hits = [m for m in out if wanted.issubset(normalize_words(m.content))]
+    return json_list_response(MESSAGES_ADAPTER, hits)
+
+
+@router.get("/{room_id}/export")
+def export_room(
+    room_id: str,
+    current: User = Depends(get_current_user),
+) -> StreamingResponse:
+    """Exporte tout l'historique d'une room en NDJSON (flux, mémoire constante)."""
+    _ensure_room_access(room_id, current)
+    filename = f"room-{room_id.replace(':', '_')}.ndjson"
+    return ndjson_export_response(messages_export_stmt(room_id=room_id), filename, room_id=room_id)
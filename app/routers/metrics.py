@@ -0,0 +1,47 @@
+"""Exposition des métriques internes (format texte Prometheus)."""
+
+from __future__ import annotations
+
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from ..config import METRICS_TOKEN
+from ..deps import get_current_user_untracked
+from ..metrics import render_prometheus
+
+router = APIRouter(tags=["metrics"])
+
+
+def require_metrics_access(
+    authorization: Optional[str] = Header(None, alias="Authorization"),
+) -> None:
+    """METRICS_TOKEN défini : le collecteur présente ce jeton (Bearer). Sinon : JWT admin."""
+    if not METRICS_TOKEN:
+        if not get_current_user_untracked(authorization).is_admin:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+        return
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.strip().encode(), METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Jeton de métriques invalide",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+    dependencies=[Depends(require_metrics_access)],
+)
+def metrics() -> PlainTextResponse:
+    """Histogrammes de latence par route, temps DB, crypto, bcrypt et purge TTL.
+    Désactivé par défaut (METRICS_ENABLED) ; jeton METRICS_TOKEN ou compte admin exigé.
+    """
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
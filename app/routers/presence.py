@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..deps import get_current_user
+from ..deps import get_current_user, get_current_user_untracked
 from ..models import Connection, User
+from ..presence_feed import FEED
 
 router = APIRouter(tags=["presence"])
 
@@ -67,3 +70,24 @@ def get_presence(
         )
 
     return out
+
+
+@router.get("/presence/stream")
+async def presence_stream(
+    minutes: int = Query(5, ge=1, le=1440, description="Fenêtre 'online' en minutes"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current: User = Depends(get_current_user_untracked),
+):
+    """
+    Server-Sent Events : un événement `snapshot` (même contenu que GET /presence), puis
+    seulement les transitions `online` / `offline` (mêmes champs, un utilisateur).
+    - État calculé une fois par worker et partagé par tous les abonnés.
+    - Reconnexion avec `Last-Event-ID` : seuls les événements manqués sont renvoyés
+      (nouvel instantané s'ils ne sont plus disponibles).
+    - Commentaire `: ping` toutes les PRESENCE_HEARTBEAT_S secondes.
+    """
+    return StreamingResponse(
+        FEED.stream(minutes, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
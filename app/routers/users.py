@@ -9,14 +9,27 @@ from sqlalchemy.orm import Session
 
 from ..database import get_db
 from ..deps import get_current_user
+from ..invalidation import VersionedCache
 from ..models import User
-from ..schemas import PublicKeyIn, PublicKeyOut, UserPublic
+from ..schemas import (
+    PublicKeyBatchIn,
+    PublicKeyBatchOut,
+    PublicKeyIn,
+    PublicKeyItem,
+    PublicKeyOut,
+    UserPublic,
+)
+from ..search import filter_by_username
+from ..serialization import USERS_ADAPTER, json_list_response, user_public
 
 # NOTE IMPORTANTE :
 # Ce routeur a déjà un préfixe "/users".
 # NE rajoute PAS encore un prefix="/users" dans main.py pour éviter "/users/users".
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Annuaire : (q, only_with_key, limit) → (ETag, corps JSON), vidé si la table users change
+_DIRECTORY_CACHE = VersionedCache("users", maxsize=64)
+
 
 def _normalize_pubkey(raw: str) -> str:
     """Nettoyage minimal de la clé publique (trim + borne de taille)."""
@@ -28,6 +41,34 @@ def _normalize_pubkey(raw: str) -> str:
     return key
 
 
+def key_fingerprint(key: str | None) -> str | None:
+    """Empreinte stable d'une clé publique (sha256 hex), None si pas de clé."""
+    if not key:
+        return None
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _public_key_item(user: User) -> PublicKeyItem:
+    return PublicKeyItem(
+        user_id=user.id,
+        username=user.username,
+        public_key=user.public_key,
+        fingerprint=key_fingerprint(user.public_key),
+        version=user.public_key_version or 0,
+    )
+
+
+def _not_modified(request: Request, response: Response, etag: str) -> bool:
+    """Pose ETag/Cache-Control ; True si If-None-Match correspond (→ 304)."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, max-age=60"
+    inm = request.headers.get("if-none-match")
+    if inm and etag in [t.strip() for t in inm.split(",")]:
+        response.status_code = 304
+        return True
+    return False
+
+
 # ─────────────────────────── Clé publique (utilisateur courant) ───────────────────────────
 @router.put("/me/public_key", response_model=PublicKeyOut)
 def set_my_public_key(
@@ -36,7 +77,10 @@ def set_my_public_key(
     current: User = Depends(get_current_user),
 ) -> PublicKeyOut:
     """Déclare/remplace la clé publique de l'utilisateur courant."""
-    current.public_key = _normalize_pubkey(payload.public_key)
+    key = _normalize_pubkey(payload.public_key)
+    if key != current.public_key:
+        current.public_key = key
+        current.public_key_version = (current.public_key_version or 0) + 1
     db.add(current)
     db.commit()
     db.refresh(current)
@@ -60,6 +104,8 @@ def get_my_public_key(
 @router.get("/{user_id:int}/public_key", response_model=PublicKeyOut)
 def get_user_public_key(
     user_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     _: User = Depends(get_current_user),
 ) -> PublicKeyOut:
@@ -67,9 +113,41 @@ def get_user_public_key(
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
+    item = _public_key_item(user)
+    if _not_modified(request, response, f'W/"{item.version}-{item.fingerprint or "none"}"'):
+        return PublicKeyOut(user_id=user.id, username=user.username)
     return PublicKeyOut(user_id=user.id, username=user.username, public_key=user.public_key)
 
 
+@router.post("/public_keys:batch", response_model=PublicKeyBatchOut)
+def get_public_keys_batch(
+    payload: PublicKeyBatchIn,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_user),
+) -> PublicKeyBatchOut:
+    """
+    Clés publiques de plusieurs utilisateurs en une seule requête (chiffrement multi-destinataires).
+    - Une seule requête `id IN (...)` sur la clé primaire.
+    - Chaque clé porte son empreinte (sha256) et sa version → cache local côté client.
+    - ETag calculé sur (id, version, empreinte) → If-None-Match renvoie 304 sans corps.
+    """
+    wanted = sorted(set(payload.user_ids))
+    rows = db.query(User).filter(User.id.in_(wanted)).order_by(User.id.asc()).all()
+    items = [_public_key_item(u) for u in rows]
+    found = {it.user_id for it in items}
+    missing = [uid for uid in wanted if uid not in found]
+
+    etag_str = ";".join(f"{it.user_id}:{it.version}:{it.fingerprint or ''}" for it in items)
+    etag_str += "|" + ",".join(str(uid) for uid in missing)
+    etag = 'W/"' + hashlib.sha256(etag_str.encode("utf-8")).hexdigest() + '"'
+    if _not_modified(request, response, etag):
+        return PublicKeyBatchOut(keys=[], missing=[])  # corps ignoré en 304
+
+    return PublicKeyBatchOut(keys=items, missing=missing)
+
+
 # ─────────────────────────── Liste des utilisateurs ───────────────────────────
 
 
@@ -79,13 +157,13 @@ def list_users(
     limit: int = 20,
     db: Session = Depends(get_db),
     current: User = Depends(get_current_user),
-) -> List[UserPublic]:
+) -> Response:
     """Liste des utilisateurs (exclut l'utilisateur courant)."""
     query = db.query(User).filter(User.id != current.id)
     if q:
-        query = query.filter(User.username.ilike(f"%{q}%"))
+        query = filter_by_username(query, q)
     rows = query.order_by(User.username.asc()).limit(max(1, min(limit, 100))).all()
-    return [UserPublic.model_validate(u) for u in rows]
+    return json_list_response(USERS_ADAPTER, [user_public(u) for u in rows])
 
 
 # ─────────────────────────── Annuaire complet ───────────────────────────
@@ -98,28 +176,35 @@ def user_directory(
     _: User = Depends(get_current_user),
     request: Request = None,
     response: Response = None,
-) -> List[UserPublic]:
+) -> List[UserPublic] | Response:
     """
     Annuaire complet des utilisateurs (inclut public_key).
     - ETag calculé sur (id, username, public_key) triés → permet 304 Not Modified.
     - Cache-Control: private, max-age=60 (ajuste selon ton besoin).
+    - Résultat mis en cache par worker, invalidé à toute écriture sur users (tous workers).
     """
-    query = db.query(User)
-    if q:
-        query = query.filter(User.username.ilike(f"%{q}%"))
-    if only_with_key:
-        query = query.filter(User.public_key.isnot(None))
-
-    rows = query.order_by(User.username.asc()).limit(limit).all()
-    items = [UserPublic.model_validate(u) for u in rows]
-
-    # -- Construction d’une empreinte stable du contenu pour ETag --
-    # On sérialise une liste minimaliste triée pour stabilité.
-    etag_payload = [
-        {"id": it.id, "username": it.username, "public_key": it.public_key} for it in items
-    ]
-    etag_str = json.dumps(etag_payload, sort_keys=True, separators=(",", ":"), default=str)
-    etag = 'W/"' + hashlib.sha256(etag_str.encode("utf-8")).hexdigest() + '"'
+
+    def _build() -> tuple[str, bytes]:
+        query = db.query(User)
+        if q:
+            query = filter_by_username(query, q)
+        if only_with_key:
+            query = query.filter(User.public_key.isnot(None))
+
+        rows = query.order_by(User.username.asc()).limit(limit).all()
+        items = [user_public(u) for u in rows]
+
+        # -- Construction d’une empreinte stable du contenu pour ETag --
+        # On sérialise une liste minimaliste triée pour stabilité.
+        etag_payload = [
+            {"id": it.id, "username": it.username, "public_key": it.public_key} for it in items
+        ]
+        etag_str = json.dumps(etag_payload, sort_keys=True, separators=(",", ":"), default=str)
+        etag = 'W/"' + hashlib.sha256(etag_str.encode("utf-8")).hexdigest() + '"'
+        return etag, USERS_ADAPTER.dump_json(items)
+
+    # Partagé entre requêtes : ni requête ni sérialisation tant que `users` n'a pas changé
+    etag, body = _DIRECTORY_CACHE.get_or_compute((q or "", only_with_key, limit), _build)
 
     # -- Si le client envoie If-None-Match et que ça matche → 304 (pas de corps) --
     inm = request.headers.get("if-none-match") if request else None
@@ -130,9 +215,9 @@ def user_directory(
             response.headers["Cache-Control"] = "private, max-age=60"
         return []  # corps ignoré en 304, renvoyer une liste vide est OK ici
 
-    # -- Sinon, on renvoie les données + entêtes de cache --
-    if response:
-        response.headers["ETag"] = etag
-        response.headers["Cache-Control"] = "private, max-age=60"
-
-    return items
+    # -- Sinon, on renvoie les données (déjà sérialisées) + entêtes de cache --
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "private, max-age=60"},
+    )
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field, constr
 
+from .config import ATTACHMENT_MAX_BYTES, PUBLIC_KEY_BATCH_MAX
+
 
 class UserCreate(BaseModel):
     """Données requises pour créer / authentifier un utilisateur."""
@@ -26,6 +28,29 @@ class PublicKeyOut(BaseModel):
     public_key: Optional[str] = None
 
 
+class PublicKeyBatchIn(BaseModel):
+    """Lot d'IDs dont on veut les clés publiques."""
+
+    user_ids: List[int] = Field(..., min_length=1, max_length=PUBLIC_KEY_BATCH_MAX)
+
+
+class PublicKeyItem(BaseModel):
+    """Clé publique d'un utilisateur, avec empreinte et version (cache client)."""
+
+    user_id: int
+    username: str
+    public_key: Optional[str] = None
+    fingerprint: Optional[str] = None  # sha256 hex de la clé
+    version: int = 0
+
+
+class PublicKeyBatchOut(BaseModel):
+    """Réponse du lot : clés trouvées + IDs inconnus."""
+
+    keys: List[PublicKeyItem]
+    missing: List[int] = []
+
+
 class TokenResponse(BaseModel):
     """Réponse renvoyant un token JWT et sa durée de vie (minutes)."""
 
@@ -38,6 +63,9 @@ class MessageIn(BaseModel):
     """Corps d'un message à créer."""
 
     content: str = Field(..., min_length=1, max_length=10_000)
+    attachment_id: Optional[int] = None  # pièce jointe déjà envoyée (POST /attachments/uploads)
+    # Clé d'idempotence (équivaut à l'en-tête Idempotency-Key) : renvoi sans doublon
+    client_msg_id: Optional[str] = Field(None, min_length=1, max_length=64)
 
 
 class MessageOut(BaseModel):
@@ -60,6 +88,62 @@ class MessageOutDetailed(BaseModel):
     recipient_id: int
     content: str
     created_at: datetime
+    attachment_id: Optional[int] = None
+
+
+class AttachmentUploadIn(BaseModel):
+    """Début d'un envoi de fichier par blocs."""
+
+    size: int = Field(..., ge=1, le=ATTACHMENT_MAX_BYTES)
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: str = Field("application/octet-stream", max_length=127)
+
+
+class AttachmentUploadOut(BaseModel):
+    """État d'un envoi : blocs attendus et déjà reçus (pour reprendre après coupure)."""
+
+    upload_id: str
+    size: int
+    chunk_size: int
+    chunks: int
+    received: List[int]
+
+
+class AttachmentOut(BaseModel):
+    """Pièce jointe finalisée (référencée ensuite par `MessageIn.attachment_id`)."""
+
+    id: int
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+
+
+class EphemeralEventIn(BaseModel):
+    """Événement éphémère (non persisté) : saisie en cours ou accusé "vu"."""
+
+    type: Literal["typing", "seen"]
+    active: bool = True  # typing : commence / arrête d'écrire
+    message_id: Optional[int] = None  # seen : dernier message lu
+
+
+class EphemeralEventOut(BaseModel):
+    """Événement livré aux membres de la room (le plus récent par émetteur et type)."""
+
+    seq: int
+    type: str
+    sender_id: int
+    active: bool
+    message_id: Optional[int] = None
+    ts_ms: int
+
+
+class EphemeralEventsOut(BaseModel):
+    """Réponse du long-polling : événements + curseur à renvoyer (`after`)."""
+
+    events: List[EphemeralEventOut]
+    cursor: int
 
 
 class ConnectionIn(BaseModel):
@@ -82,6 +166,18 @@ class ConnectionOut(BaseModel):
     last_seen_paris: Optional[str] = None
 
 
+class ConnectionAdminOut(BaseModel):
+    """Ligne de télémétrie / voisinage (vue admin, GET /connections)."""
+
+    id: int
+    owner_id: int
+    peer_id: Optional[int] = None
+    transport: str
+    address: str
+    last_seen: datetime  # UTC
+    last_seen_paris: Optional[str] = None
+
+
 class UserPublic(BaseModel):
     """Exposition publique d'un utilisateur (sans champs sensibles)."""
 
@@ -92,6 +188,54 @@ class UserPublic(BaseModel):
     public_key: Optional[str] = None
 
 
+class AdminJobOut(BaseModel):
+    """État d'une tâche d'administration en arrière-plan (suivi : GET /admin/jobs/{id})."""
+
+    id: str
+    kind: str
+    target_id: Optional[int] = None
+    status: Literal["pending", "running", "done", "failed"]
+    progress: dict  # compteurs par étape (lignes supprimées…) + étape courante
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class GroupCreate(BaseModel):
+    """Création d'une room de groupe (le créateur en devient propriétaire)."""
+
+    name: str = Field(..., min_length=1, max_length=128)
+    private: bool = False  # privé : on n'y entre que si un membre vous ajoute
+
+
+class GroupOut(BaseModel):
+    """Room de groupe ; `room_id` s'utilise avec /rooms/{room_id}/…"""
+
+    id: int
+    room_id: str
+    name: str
+    private: bool
+    created_by: Optional[int] = None
+    created_at: datetime
+    member_count: int
+
+
+class GroupMemberIn(BaseModel):
+    """Ajout d'un membre par un membre du groupe."""
+
+    user_id: int
+
+
+class GroupMemberOut(BaseModel):
+    """Membre d'un groupe."""
+
+    user_id: int
+    username: str
+    role: str
+    joined_at: datetime
+
+
 class OpenDMRequest(BaseModel):
     """Requête pour ouvrir une DM (par ID du destinataire)."""
 
@@ -0,0 +1,80 @@
+"""Recherche indexée des noms d'utilisateur (SQLite FTS5, tokenizer trigram).
+- `users_fts` est une table virtuelle à contenu externe (content='users'),
+  synchronisée par triggers : aucune écriture applicative supplémentaire.
+  Créée par une migration (app/migrations.py).
+- Trigram = recherche de sous-chaîne insensible à la casse via l'index,
+  au lieu d'un `ILIKE '%q%'` qui parcourt toute la table.
+- Requêtes de moins de 3 caractères (pas de trigramme) ou FTS5 indisponible
+  → repli sur l'ancien filtre ILIKE.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Query
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+_FTS_READY = False
+_FTS_PROBE = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='users_fts'"
+
+_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "username, content='users', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username); "
+    "INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username); END",
+]
+
+
+def create_user_search_index(conn: Connection) -> bool:
+    """Étape de migration : crée l'index FTS5 + triggers et l'alimente une fois."""
+    try:
+        for ddl in _FTS_DDL:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+        return True
+    except Exception as exc:
+        # SQLite compilé sans FTS5 / trigram (< 3.34) : on garde l'ILIKE
+        logger.warning("Index FTS5 des utilisateurs indisponible: %s", exc)
+        return False
+
+
+def detect_user_search_index(engine: Engine) -> bool:
+    """Active la recherche FTS si la table users_fts existe (une lecture de sqlite_master)."""
+    global _FTS_READY
+    _FTS_READY = False
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            _FTS_READY = conn.execute(text(_FTS_PROBE)).first() is not None
+    return _FTS_READY
+
+
+def _fts_phrase(q: str) -> str:
+    """Entoure q de guillemets FTS5 (phrase littérale, guillemets doublés)."""
+    return '"' + q.replace('"', '""') + '"'
+
+
+def filter_by_username(query: Query, q: str) -> Query:
+    """
+    Filtre + classe une requête sur User par fragment de nom :
+    d'abord les noms qui commencent par q, puis les autres (sous-chaîne), puis alphabétique.
+    """
+    if _FTS_READY and len(q) >= 3:
+        ids = text("SELECT rowid FROM users_fts WHERE users_fts MATCH :fts_q").bindparams(
+            fts_q=_fts_phrase(q)
+        )
+        query = query.filter(User.id.in_(ids))
+    else:
+        query = query.filter(User.username.ilike(f"%{q}%"))
+    return query.order_by(User.username.istartswith(q, autoescape=True).desc())
@@ -0,0 +1,70 @@
+"""Sérialisation rapide des listes (historique, annuaire).
+- Les TypeAdapter sont construits une seule fois à l'import (pas par requête).
+- Les lignes sont construites sans validation (`model_construct`) : les données viennent
+  de la DB, déjà typées.
+- `dump_json` (pydantic-core) écrit directement les octets JSON en une passe, sans repasser
+  par la validation du `response_model` ni par `jsonable_encoder` + `json.dumps`.
+Les routes gardent leur `response_model` : le schéma OpenAPI est inchangé.
+- Listes sans borne (variantes NDJSON) : curseur serveur (`yield_per`), un lot en mémoire à la
+  fois, une ligne JSON par élément.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Iterator, Mapping, Sequence
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Select
+
+from .database import SessionLocal
+from .schemas import ConnectionAdminOut, MessageOutDetailed, UserPublic
+
+NDJSON_CHUNK_ROWS = 500
+
+MESSAGES_ADAPTER: TypeAdapter[list[MessageOutDetailed]] = TypeAdapter(list[MessageOutDetailed])
+USERS_ADAPTER: TypeAdapter[list[UserPublic]] = TypeAdapter(list[UserPublic])
+CONNECTIONS_ADAPTER: TypeAdapter[list[ConnectionAdminOut]] = TypeAdapter(list[ConnectionAdminOut])
+
+
+def user_public(u: Any) -> UserPublic:
+    """UserPublic depuis une ligne ORM, sans validation."""
+    return UserPublic.model_construct(
+        id=u.id, username=u.username, is_admin=bool(u.is_admin), public_key=u.public_key
+    )
+
+
+def json_list_response(
+    adapter: TypeAdapter,
+    items: Sequence[Any],
+    status_code: int = 200,
+    headers: Mapping[str, str] | None = None,
+) -> Response:
+    """Réponse JSON pré-sérialisée (octets) pour une liste de modèles."""
+    return Response(
+        content=adapter.dump_json(list(items)),
+        status_code=status_code,
+        headers=dict(headers or {}),
+        media_type="application/json",
+    )
+
+
+def iter_ndjson(
+    stmt: Select, build: Callable[[Any], BaseModel], chunk_rows: int = NDJSON_CHUNK_ROWS
+) -> Iterator[bytes]:
+    """Exécute `stmt` par lots (`yield_per`) et produit un bloc NDJSON par lot.
+    Session propre : le générateur tourne après la fin de la route."""
+    with SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=chunk_rows))
+        for chunk in result.partitions():
+            yield "".join(build(row).model_dump_json() + "\n" for row in chunk).encode("utf-8")
+
+
+def ndjson_response(
+    stmt: Select, build: Callable[[Any], BaseModel], headers: Mapping[str, str] | None = None
+) -> StreamingResponse:
+    """StreamingResponse NDJSON : une ligne par résultat de `stmt`, mémoire constante."""
+    return StreamingResponse(
+        iter_ndjson(stmt, build), media_type="application/x-ndjson", headers=dict(headers or {})
+    )
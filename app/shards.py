@@ -0,0 +1,317 @@
+"""Messages répartis par room sur plusieurs fichiers SQLite (MESSAGE_SHARDS > 0).
+
+SQLite n'accepte qu'un écrivain à la fois par fichier : avec une base unique, tous les
+`post_message` se suivent sur un seul verrou, quel que soit le nombre de cœurs ou de workers.
+Ici chaque room est rangée (crc32 du room_id, stable entre processus) dans l'un des N fichiers
+SHARDS_DIR/messages-XX.db, avec son moteur et son propre verrou d'écriture.
+
+- Un shard ne contient que `messages`, `message_tokens`, l'index de l'archive froide de ses
+  rooms (`archive_segments`…, app/archive.py) et leurs compteurs `cache_versions`.
+  La base principale y est attachée (`ATTACH … AS core`) : les noms non qualifiés (`users`,
+  `attachments`) s'y résolvent et les jointures en lecture restent valables. On n'écrit
+  jamais dans `core` depuis un shard.
+- Identifiants uniques entre shards : le shard i numérote ses messages après i × 2^40
+  (AUTOINCREMENT) ; le shard 0 reprend après les messages déjà présents.
+- Activation sur une base existante : les messages de la base principale (et l'index de leurs
+  segments d'archive, pas les fichiers) sont déplacés dans leur shard au démarrage (par lots,
+  rejouable après interruption).
+- N est figé : chaque shard mémorise N (`PRAGMA application_id`). Démarrer avec une autre
+  valeur (ou 0) est refusé, les rooms changeraient de fichier.
+- MESSAGE_SHARDS=0 (défaut) : tout reste dans la base principale ; les fonctions ci-dessous
+  y renvoient.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import zlib
+from collections import defaultdict
+from typing import Iterator
+
+from filelock import FileLock
+from sqlalchemy import (
+    MetaData,
+    create_engine,
+    delete,
+    event,
+    func,
+    insert,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import metrics, profiler
+from .config import DATABASE_URL, MESSAGE_SHARDS, METRICS_ENABLED, SHARDS_DIR, SQL_PROFILING
+from .database import Base, SessionLocal
+from .migrations import (
+    create_archive_tables,
+    create_dm_peer_indexes,
+    create_message_client_ids,
+    create_message_version_triggers,
+    message_id_floor,
+)
+from .models import ArchiveAttachment, ArchiveSegment, ArchiveSender, Message, MessageToken
+
+logger = logging.getLogger(__name__)
+
+SHARDED = MESSAGE_SHARDS > 0
+ID_STRIDE = 1 << 40  # plage d'identifiants par shard (reste exact en JSON jusqu'à 8192 shards)
+_MOVE_BATCH = 5000
+
+# Schéma d'un shard : copie des tables de messages (AUTOINCREMENT : compteur amorçable)
+_SHARD_METADATA = MetaData()
+for _table in Base.metadata.sorted_tables:
+    _table.to_metadata(_SHARD_METADATA)
+_SHARD_TABLES = [_SHARD_METADATA.tables["messages"], _SHARD_METADATA.tables["message_tokens"]]
+
+
+def shard_index(room_id: str) -> int:
+    return zlib.crc32(room_id.encode("utf-8")) % MESSAGE_SHARDS
+
+
+def shard_paths() -> list[str]:
+    return [os.path.join(SHARDS_DIR, f"messages-{i:02d}.db") for i in range(MESSAGE_SHARDS)]
+
+
+def storage_url(room_id: str) -> str:
+    """URL de la base qui contient les messages de la room."""
+    if not SHARDED:
+        return DATABASE_URL
+    return f"sqlite:///{shard_paths()[shard_index(room_id)]}"
+
+
+def _main_db_path() -> str:
+    parsed = make_url(DATABASE_URL)
+    if not parsed.drivername.startswith("sqlite") or parsed.database in (None, "", ":memory:"):
+        raise RuntimeError("MESSAGE_SHARDS nécessite une base principale SQLite (fichier)")
+    return os.path.abspath(parsed.database)
+
+
+def _shard_engine(path: str) -> Engine:
+    engine = create_engine(
+        f"sqlite:///{path}", future=True, connect_args={"check_same_thread": False}
+    )
+    core = _main_db_path()
+
+    @event.listens_for(engine, "connect")
+    def _attach_core(dbapi_conn, _record):
+        dbapi_conn.execute("ATTACH DATABASE ? AS core", (core,))
+
+    if METRICS_ENABLED:
+        metrics.instrument_engine(engine)
+    if SQL_PROFILING:
+        profiler.instrument_engine(engine)
+    return engine
+
+
+# Moteurs créés sans connexion (comme app/database.py) ; fichiers créés par init_shards()
+_engines: list[Engine] = [_shard_engine(p) for p in shard_paths()] if SHARDED else []
+_makers = [sessionmaker(bind=e, expire_on_commit=False, autoflush=False) for e in _engines]
+
+
+# ─────────────────────────── Routage des sessions ───────────────────────────
+def room_session(room_id: str) -> Session:
+    """Nouvelle session sur le stockage des messages de la room (à fermer par l'appelant)."""
+    if not SHARDED:
+        return SessionLocal()
+    return _makers[shard_index(room_id)]()
+
+
+def all_sessions() -> list[Session]:
+    """Nouvelles sessions couvrant tous les messages (à fermer par l'appelant)."""
+    if not SHARDED:
+        return [SessionLocal()]
+    return [make() for make in _makers]
+
+
+def message_dbs(db: Session) -> Iterator[Session]:
+    """Sessions couvrant tous les messages, une à la fois (scatter-gather).
+
+    Non réparti : `db` lui-même, que l'appelant valide comme d'habitude. Réparti : une session
+    par shard, validée (commit) quand l'appelant passe à la suivante, puis fermée.
+    """
+    if not SHARDED:
+        yield db
+        return
+    for make in _makers:
+        with make() as shard_db:
+            yield shard_db
+            shard_db.commit()
+
+
+# ─────────────────────────── Initialisation (démarrage) ───────────────────────────
+def _existing_shard_files() -> set[str]:
+    if not os.path.isdir(SHARDS_DIR):
+        return set()
+    return {n for n in os.listdir(SHARDS_DIR) if n.startswith("messages-") and n.endswith(".db")}
+
+
+def _create_or_check_shard(index: int, path: str, first_id: int) -> None:
+    # Moteur nu (sans ATTACH) : l'introspection de create_all ne voit que le shard
+    bare = create_engine(f"sqlite:///{path}")
+    try:
+        with bare.begin() as conn:
+            layout = conn.execute(text("PRAGMA application_id")).scalar()
+            if layout and layout != MESSAGE_SHARDS:
+                raise RuntimeError(
+                    f"{path} appartient à un découpage en {layout} shards "
+                    f"(MESSAGE_SHARDS={MESSAGE_SHARDS})"
+                )
+            if not layout:
+                _SHARD_METADATA.create_all(conn, tables=_SHARD_TABLES)
+                conn.execute(
+                    text(
+                        "INSERT INTO sqlite_sequence (name, seq) SELECT 'messages', :seq "
+                        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'messages')"
+                    ),
+                    {"seq": max(index * ID_STRIDE, first_id)},
+                )
+                conn.execute(text(f"PRAGMA application_id = {MESSAGE_SHARDS}"))
+            # Idempotents : aussi pour les shards existants
+            create_message_version_triggers(conn)
+            create_archive_tables(conn)
+            create_message_client_ids(conn)
+            create_dm_peer_indexes(conn)
+    finally:
+        bare.dispose()
+
+
+def _move_legacy_messages() -> int:
+    """Déplace les messages de la base principale vers leur shard (identifiants conservés)."""
+    moved = 0
+    with SessionLocal() as main:
+        while True:
+            rows = main.execute(
+                select(Message.__table__).order_by(Message.id).limit(_MOVE_BATCH)
+            ).mappings()
+            batch = [dict(r) for r in rows]
+            if not batch:
+                return moved
+            ids = [r["id"] for r in batch]
+            tokens = main.execute(
+                select(MessageToken.__table__).where(MessageToken.message_id.in_(ids))
+            ).mappings()
+            per_shard: dict[int, tuple[list, list]] = defaultdict(lambda: ([], []))
+            for r in batch:
+                per_shard[shard_index(r["room_id"])][0].append(r)
+            for t in tokens:
+                per_shard[shard_index(t["room_id"])][1].append(dict(t))
+            # Shards d'abord, base principale ensuite : une interruption laisse des doublons
+            # que le prochain démarrage ignore (OR IGNORE), jamais de perte.
+            for index, (msgs, toks) in per_shard.items():
+                with _makers[index]() as shard_db:
+                    shard_db.execute(insert(Message).prefix_with("OR IGNORE"), msgs)
+                    if toks:
+                        shard_db.execute(insert(MessageToken).prefix_with("OR IGNORE"), toks)
+                    shard_db.commit()
+            main.execute(delete(MessageToken).where(MessageToken.message_id.in_(ids)))
+            main.execute(delete(Message).where(Message.id.in_(ids)))
+            main.commit()
+            moved += len(batch)
+
+
+def _move_legacy_segments() -> int:
+    """Déplace l'index des segments d'archive de la base principale vers le shard de leur room
+    (les fichiers restent en place). Chemin unique : rejouable après interruption."""
+    moved = 0
+    with SessionLocal() as main:
+        segments = main.execute(select(ArchiveSegment.__table__)).mappings().all()
+        for row in segments:
+            segment = dict(row)
+            old_id = segment.pop("id")
+            senders = main.scalars(
+                select(ArchiveSender.sender_id).where(ArchiveSender.segment_id == old_id)
+            ).all()
+            attachments = main.scalars(
+                select(ArchiveAttachment.attachment_id).where(
+                    ArchiveAttachment.segment_id == old_id
+                )
+            ).all()
+            with _makers[shard_index(segment["room_id"])]() as shard_db:
+                already = shard_db.scalar(
+                    select(ArchiveSegment.id).where(ArchiveSegment.path == segment["path"])
+                )
+                if already is None:
+                    new_id = shard_db.execute(
+                        insert(ArchiveSegment).values(**segment)
+                    ).inserted_primary_key[0]
+                    shard_db.execute(
+                        insert(ArchiveSender),
+                        [{"segment_id": new_id, "sender_id": s} for s in senders],
+                    )
+                    if attachments:
+                        shard_db.execute(
+                            insert(ArchiveAttachment),
+                            [{"segment_id": new_id, "attachment_id": a} for a in attachments],
+                        )
+                shard_db.commit()
+            main.execute(delete(ArchiveSender).where(ArchiveSender.segment_id == old_id))
+            main.execute(delete(ArchiveAttachment).where(ArchiveAttachment.segment_id == old_id))
+            main.execute(delete(ArchiveSegment).where(ArchiveSegment.id == old_id))
+            main.commit()
+            moved += 1
+    return moved
+
+
+def _move_legacy_tokens() -> int:
+    """Déplace les jetons de recherche restés dans la base principale (ceux des messages
+    archivés) vers le shard de leur room. Copie puis suppression : rejouable."""
+    moved = 0
+    key = tuple_(MessageToken.room_id, MessageToken.token, MessageToken.message_id)
+    with SessionLocal() as main:
+        while True:
+            rows = main.execute(select(MessageToken.__table__).limit(_MOVE_BATCH)).mappings()
+            batch = [dict(r) for r in rows]
+            if not batch:
+                return moved
+            per_shard: dict[int, list] = defaultdict(list)
+            for t in batch:
+                per_shard[shard_index(t["room_id"])].append(t)
+            for index, toks in per_shard.items():
+                with _makers[index]() as shard_db:
+                    shard_db.execute(insert(MessageToken).prefix_with("OR IGNORE"), toks)
+                    shard_db.commit()
+            main.execute(
+                delete(MessageToken).where(
+                    key.in_([(t["room_id"], t["token"], t["message_id"]) for t in batch])
+                )
+            )
+            main.commit()
+            moved += len(batch)
+
+
+def init_shards() -> None:
+    """Crée/vérifie les shards et y déplace les messages de la base principale (démarrage)."""
+    found = _existing_shard_files()
+    if not SHARDED:
+        if found:
+            raise RuntimeError(
+                f"{len(found)} shard(s) de messages dans {SHARDS_DIR} : définir MESSAGE_SHARDS"
+            )
+        return
+    expected = {os.path.basename(p) for p in shard_paths()}
+    if found - expected:
+        raise RuntimeError(f"Shards en trop dans {SHARDS_DIR} : {sorted(found - expected)}")
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+    with FileLock(os.path.join(SHARDS_DIR, ".init.lock")):
+        with SessionLocal() as main:
+            # Le shard 0 numérote après tout identifiant déjà attribué, archivé compris
+            first_id = message_id_floor(main.connection())
+            legacy = main.scalar(select(func.max(Message.id))) or 0
+            archived = main.scalar(select(func.max(ArchiveSegment.last_id))) or 0
+        for index, path in enumerate(shard_paths()):
+            _create_or_check_shard(index, path, first_id)
+        if legacy:
+            moved = _move_legacy_messages()
+            logger.info("%d message(s) déplacé(s) vers %d shards", moved, MESSAGE_SHARDS)
+        if archived:
+            moved = _move_legacy_segments()
+            logger.info("%d segment(s) d'archive déplacé(s) vers les shards", moved)
+        # Après les messages (qui emportent leurs jetons) : restent ceux de l'archive
+        moved = _move_legacy_tokens()
+        if moved:
+            logger.info("%d jeton(s) de recherche d'archive déplacé(s) vers les shards", moved)
@@ -0,0 +1,245 @@
+"""UI statique (/ui) : noms empreintés, gzip précalculé, cache long côté client.
+
+Sans étape de build, au démarrage (une fois par worker) :
+- Chaque fichier de web/ reçoit un nom empreinté par son contenu : `js/app.js` est aussi
+  servi sous `js/app.<sha256[:10]>.js`, avec `Cache-Control: immutable` (un an). Un client
+  qui revient ne retélécharge plus l'UI : un nouveau contenu a un autre nom.
+- Les références des pages HTML (`src=`, `href=`) et des feuilles CSS (`url(...)`) vers des
+  fichiers de web/ sont réécrites vers ces noms. Les pages, point d'entrée, gardent leur nom
+  et sont revalidées à chaque chargement (`no-cache` + ETag → 304).
+- Les types compressibles (texte, JS, JSON, SVG…) sont compressés en gzip une seule fois et
+  gardés en mémoire ; `Accept-Encoding` choisit la variante (`Vary: Accept-Encoding`).
+  Aucune compression par requête.
+- Les anciens noms restent servis (revalidation par ETag), comme avec StaticFiles.
+Modifier web/ demande un redémarrage (les empreintes sont calculées au démarrage).
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse, RedirectResponse, Response
+from starlette.types import Receive, Scope, Send
+
+_HASH_LEN = 10
+_MEMORY_MAX = 8 * 1024 * 1024  # au-delà : lu sur disque à chaque requête, sans gzip
+_GZIP_MIN = 512  # trop petit pour gagner quoi que ce soit
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "no-cache"
+_COMPRESSIBLE = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xml",
+    "image/svg+xml",
+    "text/javascript",
+}
+
+_HTML_REF = re.compile(r"""(\b(?:src|href)\s*=\s*)(["'])([^"'#?]+)([^"']*)\2""", re.IGNORECASE)
+_CSS_REF = re.compile(r"""(url\(\s*)(["']?)([^"'()#?]+)([^"'()]*)\2(\s*\))""", re.IGNORECASE)
+
+
+@dataclass
+class _Asset:
+    rel: str  # chemin relatif à web/ (séparateur /)
+    path: str  # chemin absolu sur disque
+    content_type: str
+    etag: str
+    fingerprinted: Optional[str] = None  # nom empreinté (rel), None pour les pages HTML
+    body: Optional[bytes] = None  # None : fichier trop gros, servi depuis le disque
+    gz: Optional[bytes] = None
+
+
+def _compressible(content_type: str) -> bool:
+    base = content_type.split(";")[0].strip()
+    return base.startswith("text/") or base in _COMPRESSIBLE
+
+
+def _fingerprinted_name(rel: str, digest: str) -> str:
+    head, name = posixpath.split(rel)
+    stem, ext = posixpath.splitext(name)
+    return posixpath.join(head, f"{stem}.{digest[:_HASH_LEN]}{ext}")
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip().removeprefix("q=")
+            try:
+                return not params or float(q) > 0
+            except ValueError:
+                return True
+    return False
+
+
+class UIStatic:
+    """Application ASGI montée sur /ui (remplace StaticFiles(directory, html=True))."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._assets: dict[str, _Asset] = {}  # rel (ancien nom ou nom empreinté) → asset
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    # ─────────────────────────── Préparation (démarrage) ───────────────────────────
+    def load(self) -> dict:
+        """Calcule empreintes et variantes gzip ; renvoie un résumé (fichiers, octets)."""
+        with self._lock:
+            if not self._loaded:
+                self._assets = self._build()
+                self._loaded = True
+        unique = {id(a): a for a in self._assets.values()}.values()
+        return {
+            "files": len(unique),
+            "bytes": sum(len(a.body) for a in unique if a.body is not None),
+            "gzip_bytes": sum(len(a.gz) for a in unique if a.gz is not None),
+        }
+
+    def _build(self) -> dict[str, _Asset]:
+        files: dict[str, str] = {}
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                files[rel] = path
+
+        # Ordre : fichiers simples, puis CSS (références réécrites avant leur propre empreinte),
+        # puis pages HTML (qui référencent le tout)
+        def kind(rel: str) -> int:
+            ctype = mimetypes.guess_type(rel)[0] or ""
+            return 2 if ctype == "text/html" else 1 if ctype == "text/css" else 0
+
+        renamed: dict[str, str] = {}  # rel → rel empreinté
+        assets: dict[str, _Asset] = {}
+        for rel in sorted(files, key=kind):
+            path = files[rel]
+            content_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+            size = os.path.getsize(path)
+            body: Optional[bytes] = None
+            if size <= _MEMORY_MAX:
+                with open(path, "rb") as f:
+                    body = f.read()
+                if kind(rel):
+                    body = self._rewrite(
+                        rel, body, renamed, _CSS_REF if kind(rel) == 1 else _HTML_REF
+                    )
+                digest = hashlib.sha256(body).hexdigest()
+            else:
+                digest = self._file_digest(path)
+            if content_type.startswith("text/") or content_type == "application/javascript":
+                content_type += "; charset=utf-8"
+            asset = _Asset(rel=rel, path=path, content_type=content_type, etag=f'"{digest[:32]}"')
+            asset.body = body
+            if body is not None and len(body) >= _GZIP_MIN and _compressible(content_type):
+                gz = gzip.compress(body, compresslevel=9, mtime=0)
+                if len(gz) < len(body) * 0.9:
+                    asset.gz = gz
+            assets[rel] = asset
+            if kind(rel) != 2:
+                asset.fingerprinted = _fingerprinted_name(rel, digest)
+                renamed[rel] = asset.fingerprinted
+                assets[asset.fingerprinted] = asset
+        return assets
+
+    @staticmethod
+    def _file_digest(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def _rewrite(rel: str, body: bytes, renamed: dict[str, str], pattern: re.Pattern) -> bytes:
+        """Remplace, dans une page ou une feuille de style, les références vers des fichiers de
+        web/ par leur nom empreinté (seul le dernier segment de l'URL change)."""
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return body
+        base = posixpath.dirname(rel)
+
+        def repl(m: re.Match) -> str:
+            url = m.group(3)
+            if re.match(r"^[a-z][a-z0-9+.-]*:|^//", url, re.IGNORECASE):
+                return m.group(0)  # externe, data:, mailto:…
+            if url.startswith("/ui/"):
+                target = posixpath.normpath(url.removeprefix("/ui/"))
+            elif url.startswith("/"):
+                return m.group(0)  # hors de /ui
+            else:
+                target = posixpath.normpath(posixpath.join(base, url))
+            new_rel = renamed.get(target)
+            if new_rel is None:
+                return m.group(0)
+            stop = len(url) - len(posixpath.basename(url))
+            new_url = url[:stop] + posixpath.basename(new_rel)
+            return m.group(0).replace(url, new_url, 1)
+
+        return pattern.sub(repl, text).encode("utf-8")
+
+    # ─────────────────────────── Service ───────────────────────────
+    def _lookup(self, route_path: str) -> Optional[_Asset]:
+        rel = route_path.lstrip("/")
+        if rel == "" or rel.endswith("/"):
+            rel += "index.html"
+        return self._assets.get(rel)
+
+    def _is_directory(self, route_path: str) -> bool:
+        """Répertoire demandé sans '/' final (avec une page index.html)."""
+        rel = route_path.strip("/")
+        return posixpath.join(rel, "index.html") in self._assets if rel else True
+
+    def _response(self, request: Request, route_path: str) -> Response:
+        if request.method not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405)
+        if not self._loaded:
+            self.load()
+        if not route_path.endswith("/") and self._is_directory(route_path):
+            # Comme StaticFiles : les URL relatives de la page se résolvent dans le répertoire
+            return RedirectResponse(request.url.replace(path=request.url.path + "/"))
+        asset = self._lookup(route_path)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        immutable = asset.fingerprinted == route_path.lstrip("/")
+        use_gz = asset.gz is not None and _accepts_gzip(request.headers.get("accept-encoding", ""))
+        etag = asset.etag[:-1] + '-gz"' if use_gz else asset.etag
+        headers = {
+            "ETag": etag,
+            "Cache-Control": _IMMUTABLE if immutable else _REVALIDATE,
+        }
+        if asset.gz is not None:
+            headers["Vary"] = "Accept-Encoding"
+        inm = request.headers.get("if-none-match")
+        if inm and etag in [t.strip() for t in inm.split(",")]:
+            return Response(status_code=304, headers=headers)
+        if asset.body is None:
+            return FileResponse(asset.path, media_type=asset.content_type, headers=headers)
+        if use_gz:
+            headers["Content-Encoding"] = "gzip"
+        body = asset.gz if use_gz else asset.body
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=headers, media_type=asset.content_type)
+        return Response(body, headers=headers, media_type=asset.content_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        start = len(root_path) if path.startswith(root_path) else 0
+        route_path = path[start:]
+        response = self._response(Request(scope, receive), route_path)
+        await response(scope, receive, send)
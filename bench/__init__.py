@@ -0,0 +1 @@
+"""Benchmarks OffCom (scripts lancés avec `python -m bench.<nom>`)."""
@@ -0,0 +1,83 @@
+"""Benchmark : durée d'un snapshot à chaud selon la taille de la base.
+
+Pour chaque taille, remplit une base SQLite temporaire, lance `online_copy` (API de sauvegarde
+par pas) pendant qu'un écrivain insère en continu, et mesure la durée du snapshot ainsi que
+l'attente maximale de l'écrivain (ce que le pas `--pages` doit garder court).
+
+    python -m bench.backup [--sizes-mb 8 32 128] [--pages 256] [--sleep 0.005]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from app.backup import online_copy
+
+
+def _fill(path: str, size_mb: int) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, room_id TEXT, content TEXT)")
+    row = "x" * 1000
+    n = size_mb * 1000
+    conn.executemany(
+        "INSERT INTO messages (room_id, content) VALUES (?, ?)",
+        ((f"dmid:{i % 50}:{i % 50 + 1}", row) for i in range(n)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _writer(path: str, stop: threading.Event, waits: list[float]) -> None:
+    conn = sqlite3.connect(path, timeout=60)
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        conn.execute("INSERT INTO messages (room_id, content) VALUES ('bench', 'w')")
+        conn.commit()
+        waits.append(time.perf_counter() - t0)
+        time.sleep(0.001)
+    conn.close()
+
+
+def run(size_mb: int, pages: int, sleep: float) -> dict:
+    with tempfile.TemporaryDirectory() as work:
+        src = os.path.join(work, "src.db")
+        _fill(src, size_mb)
+        db_bytes = os.path.getsize(src)
+
+        stop = threading.Event()
+        waits: list[float] = []
+        writer = threading.Thread(target=_writer, args=(src, stop, waits))
+        writer.start()
+        t0 = time.perf_counter()
+        used_pages = online_copy(src, os.path.join(work, "dst.db"), pages=pages, sleep=sleep)
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        writer.join()
+
+    return {
+        "db_mb": round(db_bytes / 1e6, 1),
+        "snapshot_s": round(elapsed, 3),
+        "mb_per_s": round(db_bytes / 1e6 / elapsed, 1),
+        "pages_per_step": used_pages,
+        "writer_commits": len(waits),
+        "writer_max_wait_ms": round(max(waits, default=0) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--pages", type=int, default=256)
+    parser.add_argument("--sleep", type=float, default=0.005)
+    args = parser.parse_args()
+    print(json.dumps([run(mb, args.pages, args.sleep) for mb in args.sizes_mb], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Générateur de jeu de données synthétique (gros volumes) pour dimensionner les index.
+
+Écrit directement via sqlite3 + executemany, par lots, contenus pré-chiffrés (un pool de
+tokens Fernet réutilisés) et un seul hash bcrypt partagé : le coût est celui de SQLite.
+Le schéma est celui de l'application (migrations, dont l'index FTS des noms), puis ANALYZE.
+
+    python -m bench.dataset --db /tmp/offcom-big.db --users 20000 --rooms 5000 \\
+        --messages 2000000 --connections 500000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from sqlalchemy import create_engine
+
+from app.auth import get_password_hash
+from app.config import GLOBAL_MESSAGE_TTL_MIN
+from app.crypto import encrypt_text
+from app.migrations import run_migrations
+
+SQLITE_TS = "%Y-%m-%d %H:%M:%S.%f"  # format DateTime de SQLAlchemy sous SQLite
+
+
+def _chunks(rows: Iterator[tuple], size: int) -> Iterator[list[tuple]]:
+    batch: list[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ts(now: datetime, rng: random.Random, window_min: int) -> str:
+    return (now - timedelta(minutes=rng.random() * window_min)).strftime(SQLITE_TS)
+
+
+def generate(
+    db_path: str,
+    users: int,
+    rooms: int,
+    messages: int,
+    connections: int,
+    seed: int = 42,
+    batch: int = 10_000,
+) -> dict:
+    """Remplit db_path (créée si besoin) ; renvoie les volumes et durées par table."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    run_migrations(engine)
+    engine.dispose()
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    ttl_window = max(GLOBAL_MESSAGE_TTL_MIN, 60)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    report: dict = {"db": db_path}
+
+    def _load(table: str, sql: str, rows: Iterator[tuple], count: int) -> None:
+        t0 = time.perf_counter()
+        for chunk in _chunks(rows, batch):
+            conn.executemany(sql, chunk)
+            conn.commit()
+        elapsed = time.perf_counter() - t0
+        report[table] = {"rows": count, "seconds": round(elapsed, 2)}
+        report[table]["rows_per_s"] = round(count / elapsed) if elapsed else None
+
+    first_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]) + 1
+    password_hash = get_password_hash("password")
+    _load(
+        "users",
+        "INSERT INTO users (id, username, password_hash, created_at, token_version, "
+        "public_key, public_key_version, is_admin) VALUES (?, ?, ?, ?, 0, ?, ?, 0)",
+        (
+            (
+                first_id + i,
+                f"user{first_id + i:07d}",
+                password_hash,
+                _ts(now, rng, ttl_window),
+                ("pk-" + "x" * 60) if i % 2 else None,
+                1 if i % 2 else 0,
+            )
+            for i in range(users)
+        ),
+        users,
+    )
+    user_ids = range(first_id, first_id + users)
+
+    pairs = []
+    for _ in range(rooms):
+        a, b = rng.sample(user_ids, 2)
+        pairs.append((min(a, b), max(a, b)))
+    pool = [encrypt_text(f"message synthétique {i} " + "lorem ipsum " * 6) for i in range(256)]
+
+    def _messages() -> Iterator[tuple]:
+        for i in range(messages):
+            a, b = pairs[i % len(pairs)] if pairs else (first_id, first_id)
+            yield (
+                f"dmid:{a}:{b}",
+                a if rng.random() < 0.5 else b,
+                pool[i % len(pool)],
+                _ts(now, rng, ttl_window),
+            )
+
+    _load(
+        "messages",
+        "INSERT INTO messages (room_id, sender_id, content, created_at) VALUES (?, ?, ?, ?)",
+        _messages(),
+        messages,
+    )
+    _load(
+        "connections",
+        "INSERT OR IGNORE INTO connections (owner_id, peer_id, transport, address, last_seen) "
+        "VALUES (?, NULL, 'http', ?, ?)",
+        (
+            (
+                rng.choice(user_ids),
+                f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+                _ts(now, rng, 1440),
+            )
+            for _ in range(connections)
+        ),
+        connections,
+    )
+
+    t0 = time.perf_counter()
+    conn.execute("ANALYZE")
+    conn.commit()
+    report["analyze_seconds"] = round(time.perf_counter() - t0, 2)
+    conn.close()
+    report["db_mb"] = round(os.path.getsize(db_path) / 1e6, 1)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="Fichier SQLite cible")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--rooms", type=int, default=2_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--connections", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch", type=int, default=10_000)
+    args = parser.parse_args()
+    report = generate(
+        args.db, args.users, args.rooms, args.messages, args.connections, args.seed, args.batch
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
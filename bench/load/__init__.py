@@ -0,0 +1,7 @@
+"""Benchmark de charge OffCom : scénarios de chat réalistes, latences p50/p95/p99 et débit.
+
+python -m bench.load                      # in-process (ASGI), base SQLite temporaire
+python -m bench.load --uvicorn            # contre un uvicorn local lancé pour l'occasion
+python -m bench.load --save-baseline bench/load/baseline.json
+python -m bench.load --baseline bench/load/baseline.json   # code 1 si régression
+"""
@@ -0,0 +1,151 @@
+"""Point d'entrée : `python -m bench.load` (voir bench/load/__init__.py)."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+
+from .scenarios import PASSWORD, SCENARIOS, BenchUser, Context
+from .stats import regressions, summarize
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@asynccontextmanager
+async def in_process_client(data_dir: str) -> AsyncIterator[httpx.AsyncClient]:
+    """Client httpx branché directement sur l'app ASGI (lifespan compris)."""
+    os.environ["DATA_DIR"] = data_dir  # lu par app.config à l'import
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(data_dir: str) -> AsyncIterator[httpx.AsyncClient]:
+    """Lance `uvicorn app.main:app` sur un port libre et renvoie un client HTTP."""
+    port = _free_port()
+    env = {**os.environ, "DATA_DIR": data_dir}
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=PROJECT_ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/openapi.json")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            yield client
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+async def setup_users(client: httpx.AsyncClient, count: int) -> list[BenchUser]:
+    """Crée `count` comptes et récupère leur JWT."""
+    users = []
+    for i in range(count):
+        name = f"bench{i:04d}"
+        reg = await client.post("/auth/register", json={"username": name, "password": PASSWORD})
+        login = await client.post("/auth/login", json={"username": name, "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        users.append(BenchUser(id=reg.json()["id"], username=name, headers=headers))
+    return users
+
+
+async def run_scenario(ctx: Context, name: str, concurrency: int, per_worker: int) -> dict:
+    """Lance `concurrency` workers de `per_worker` requêtes chacun ; résume les latences."""
+    step = SCENARIOS[name]
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker(w: int) -> None:
+        nonlocal errors
+        for i in range(per_worker):
+            t0 = time.perf_counter()
+            try:
+                resp = await step(ctx, w, i)
+                ok = resp.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - t0)
+            errors += 0 if ok else 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - t0)
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(prefix="offcom-bench-") as data_dir:
+        factory = uvicorn_client if args.uvicorn else in_process_client
+        async with factory(data_dir) as client:
+            users = await setup_users(client, max(args.users, 2 * args.concurrency))
+            ctx = Context(client=client, users=users)
+            report = {}
+            for name in args.scenarios:
+                report[name] = await run_scenario(ctx, name, args.concurrency, args.requests)
+            return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de charge OffCom")
+    parser.add_argument("--uvicorn", action="store_true", help="Cibler un uvicorn local")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=50, help="Requêtes par worker")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--baseline", help="JSON de référence : signale les régressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Écart toléré (0.25=25%%)")
+    parser.add_argument("--save-baseline", help="Écrit le rapport comme nouvelle référence")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    output = {"scenarios": report}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(report, json.load(f)["scenarios"], args.tolerance)
+        output["regressions"] = found
+    print(json.dumps(output, indent=2, ensure_ascii=False))
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"scenarios": report}, f, indent=2)
+    if output.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
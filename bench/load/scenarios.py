@@ -0,0 +1,89 @@
+"""Scénarios de charge : une coroutine `step(ctx, worker, i)` = une requête HTTP mesurée."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+
+from app.utils_dm import canonical_dm_room_ids
+
+PASSWORD = "bench-password"
+
+
+@dataclass
+class BenchUser:
+    id: int
+    username: str
+    headers: dict
+
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    users: list[BenchUser]
+    etags: dict[int, str] = field(default_factory=dict)
+
+    def pair(self, worker: int) -> tuple[BenchUser, BenchUser]:
+        """Deux utilisateurs distincts attribués à un worker (sa DM)."""
+        n = len(self.users)
+        return self.users[(2 * worker) % n], self.users[(2 * worker + 1) % n]
+
+
+Step = Callable[[Context, int, int], Awaitable[httpx.Response]]
+
+
+async def login_storm(ctx: Context, worker: int, i: int) -> httpx.Response:
+    """Connexions en rafale (bcrypt verify + JWT)."""
+    user = ctx.users[(worker + i) % len(ctx.users)]
+    return await ctx.client.post(
+        "/auth/login", json={"username": user.username, "password": PASSWORD}
+    )
+
+
+async def dm_ping_pong(ctx: Context, worker: int, i: int) -> httpx.Response:
+    """Deux utilisateurs s'écrivent à tour de rôle dans leur DM (post_message)."""
+    a, b = ctx.pair(worker)
+    sender = a if i % 2 == 0 else b
+    room = canonical_dm_room_ids(a.id, b.id)
+    return await ctx.client.post(
+        f"/rooms/{room}/messages",
+        json={"content": f"ping {worker}-{i} " + "x" * 80},
+        headers=sender.headers,
+    )
+
+
+async def poll_messages(ctx: Context, worker: int, i: int) -> httpx.Response:
+    """Polling de l'historique d'une DM (list_messages, page de 50)."""
+    a, b = ctx.pair(worker)
+    room = canonical_dm_room_ids(a.id, b.id)
+    return await ctx.client.get(f"/rooms/{room}/messages?limit=50", headers=a.headers)
+
+
+async def presence_fan_in(ctx: Context, worker: int, i: int) -> httpx.Response:
+    """Tous les clients interrogent /presence."""
+    user = ctx.users[worker % len(ctx.users)]
+    return await ctx.client.get("/presence?minutes=5", headers=user.headers)
+
+
+async def annuaire_conditional(ctx: Context, worker: int, i: int) -> httpx.Response:
+    """GET conditionnel de l'annuaire (If-None-Match → 304 attendu après le premier appel)."""
+    user = ctx.users[worker % len(ctx.users)]
+    headers = dict(user.headers)
+    etag = ctx.etags.get(worker)
+    if etag:
+        headers["If-None-Match"] = etag
+    resp = await ctx.client.get("/users/annuaire", headers=headers)
+    if resp.headers.get("etag"):
+        ctx.etags[worker] = resp.headers["etag"]
+    return resp
+
+
+SCENARIOS: dict[str, Step] = {
+    "login_storm": login_storm,
+    "dm_ping_pong": dm_ping_pong,
+    "poll_messages": poll_messages,
+    "presence_fan_in": presence_fan_in,
+    "annuaire_conditional": annuaire_conditional,
+}
@@ -0,0 +1,46 @@
+"""Statistiques de latence et comparaison à une référence (baseline)."""
+
+from __future__ import annotations
+
+import math
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Percentile au rang le plus proche sur une liste triée (0 si vide)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, wall_s: float) -> dict:
+    """Résumé d'un scénario (latences en ms, débit en requêtes/s)."""
+    values = sorted(latencies)
+    ms = [v * 1000 for v in values]
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "mean_ms": round(sum(ms) / len(ms), 2) if ms else 0.0,
+        "throughput_rps": round(len(values) / wall_s, 1) if wall_s > 0 else 0.0,
+    }
+
+
+def regressions(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Scénarios plus lents (p95) ou moins rapides (débit) que la référence au-delà de tolerance."""
+    found = []
+    for name, cur in current.items():
+        ref = baseline.get(name)
+        if not ref:
+            continue
+        if ref["p95_ms"] and cur["p95_ms"] > ref["p95_ms"] * (1 + tolerance):
+            found.append(f"{name}: p95 {ref['p95_ms']} → {cur['p95_ms']} ms")
+        if ref["throughput_rps"] and cur["throughput_rps"] < ref["throughput_rps"] * (
+            1 - tolerance
+        ):
+            found.append(f"{name}: débit {ref['throughput_rps']} → {cur['throughput_rps']} req/s")
+        if cur["errors"] > ref.get("errors", 0):
+            found.append(f"{name}: erreurs {ref.get('errors', 0)} → {cur['errors']}")
+    return found
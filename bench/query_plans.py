@@ -0,0 +1,177 @@
+"""Non-régression des plans de requête (EXPLAIN QUERY PLAN) sur les requêtes chaudes.
+
+Appelle les vraies routes (historique, my-rooms, présence, recherche annuaire) et la purge TTL
+sur un jeu de données synthétique, capture le SQL réellement émis, puis vérifie pour chacun :
+- que l'index attendu apparaît dans le plan ;
+- qu'aucune grosse table n'est parcourue entièrement (`SCAN messages`, `SCAN connections`…).
+Un changement de schéma ou de requête qui retombe sur un parcours complet fait échouer (code 1).
+
+    python -m bench.query_plans                     # jeu synthétique temporaire
+    python -m bench.query_plans --db data/offcom.db # sur une COPIE d'une base existante
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Tables volumineuses : jamais de parcours complet (avec ou sans index)
+NO_SCAN = ("messages", "message_tokens", "archive_segments", "archive_senders")
+# Tables moyennes : parcours complet toléré seulement via un index
+NO_TABLE_SCAN = ("connections",)
+
+
+@dataclass
+class PlanCheck:
+    name: str
+    table: str  # on n'inspecte que le SQL qui touche cette table
+    expect: Optional[str]  # index (ou fragment de plan) attendu
+    method: str = "GET"
+    path: str = ""
+    call: Optional[Callable[[], object]] = None
+    no_scan: tuple[str, ...] = ()  # tables en plus de NO_SCAN, jamais parcourues ici
+
+
+def _touches(statement: str, table: str) -> bool:
+    return re.search(rf"\b(FROM|JOIN|INTO|UPDATE)\s+{table}\b", statement) is not None
+
+
+def _plan(db_path: str, statement: str, params) -> list[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement, params or ())]
+    finally:
+        conn.close()
+
+
+def _violations(plan: list[str], no_scan: tuple[str, ...] = ()) -> list[str]:
+    problems = []
+    for line in plan:
+        for table in NO_SCAN + no_scan:
+            if re.match(rf"SCAN {table}\b", line):
+                problems.append(f"parcours complet: {line}")
+        for table in NO_TABLE_SCAN:
+            if re.fullmatch(rf"SCAN {table}", line):
+                problems.append(f"parcours de table sans index: {line}")
+    return problems
+
+
+def run_checks(db_path: str) -> dict:
+    """Exécute les contrôles sur db_path (l'app doit pointer dessus via DATABASE_URL)."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event, select
+
+    from app.database import SessionLocal, engine
+    from app.deps import get_current_user
+    from app.main import _purge_expired_messages, app
+    from app.migrations import run_migrations
+    from app.models import Message, User
+
+    run_migrations(engine)  # une copie --db d'une base ancienne est mise à jour
+    with SessionLocal() as db:
+        room, sender_id = db.execute(select(Message.room_id, Message.sender_id).limit(1)).one()
+        user = db.get(User, sender_id)
+    # Utilisateur injecté (pas de login/bcrypt) : on ne mesure que les requêtes des routes
+    app.dependency_overrides[get_current_user] = lambda: user
+    client = TestClient(app)  # sans lifespan : pas de tâche de purge en fond
+
+    checks = [
+        PlanCheck(
+            "history",
+            "messages",
+            "idx_messages_room_ts",
+            path=f"/rooms/{room}/messages?since_ms=1&limit=50",
+        ),
+        PlanCheck("my-rooms", "messages", "ix_messages_sender_id", path="/rooms/my-rooms"),
+        # DM "dmid:<autre>:<uid>" : par la colonne virtuelle dm_peer, sans parcourir users
+        PlanCheck(
+            "my-rooms-dm",
+            "messages",
+            "idx_messages_dm_peer",
+            path="/rooms/my-rooms",
+            no_scan=("users",),
+        ),
+        PlanCheck("presence", "connections", "idx_connections_owner_seen", path="/presence"),
+        PlanCheck(
+            "directory-search", "users_fts", "VIRTUAL TABLE INDEX", path="/users/annuaire?q=user000"
+        ),
+        PlanCheck("purge", "messages", "ix_messages_created_at", call=_purge_expired_messages),
+    ]
+
+    report: dict = {}
+    for check in checks:
+        captured: list[tuple[str, object]] = []
+
+        def _capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany:
+                captured.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", _capture)
+        try:
+            if check.call:
+                check.call()
+            else:
+                resp = client.request(check.method, check.path)
+                resp.raise_for_status()
+        finally:
+            event.remove(engine, "before_cursor_execute", _capture)
+
+        statements = []
+        problems: list[str] = []
+        for statement, params in captured:
+            if not _touches(statement, check.table):
+                continue
+            plan = _plan(db_path, statement, params)
+            problems += _violations(plan, check.no_scan)
+            statements.append({"sql": " ".join(statement.split())[:300], "plan": plan})
+        all_plan_lines = [line for s in statements for line in s["plan"]]
+        if not statements:
+            problems.append(f"aucune requête sur {check.table} capturée")
+        elif check.expect and not any(check.expect in line for line in all_plan_lines):
+            problems.append(f"index attendu absent: {check.expect}")
+        report[check.name] = {"ok": not problems, "problems": problems, "statements": statements}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="Base existante (analysée sur une copie)")
+    parser.add_argument("--users", type=int, default=3_000)
+    parser.add_argument("--rooms", type=int, default=1_000)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--connections", type=int, default=30_000)
+    parser.add_argument("--verbose", action="store_true", help="Afficher SQL + plans")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="offcom-plans-") as work:
+        db_path = os.path.join(work, "offcom.db")
+        # Avant tout import de app.* : la config lit ces variables à l'import
+        os.environ["DATA_DIR"] = work
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        if args.db:
+            from app.backup import online_copy
+
+            online_copy(args.db, db_path)
+        else:
+            from bench.dataset import generate
+
+            generate(db_path, args.users, args.rooms, args.messages, args.connections)
+
+        report = run_checks(db_path)
+
+    if not args.verbose:
+        report = {k: {"ok": v["ok"], "problems": v["problems"]} for k, v in report.items()}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if not all(v["ok"] for v in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
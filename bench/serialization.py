@@ -0,0 +1,106 @@
+"""Benchmark : coût de sérialisation par ligne d'une page de 500 éléments.
+
+Compare l'ancien chemin (modèle validé par ligne, puis re-validation par le `response_model`,
+`jsonable_encoder` et `json.dumps`) au chemin rapide (`model_construct` + `TypeAdapter.dump_json`).
+
+    python -m bench.serialization [--rows 500] [--repeat 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+
+from app.schemas import MessageOutDetailed, UserPublic
+from app.serialization import (
+    MESSAGES_ADAPTER,
+    USERS_ADAPTER,
+    json_list_response,
+    user_public,
+)
+
+
+def _rows(n: int) -> tuple[list[dict], list[SimpleNamespace]]:
+    now = datetime.now(timezone.utc)
+    msgs = [
+        {
+            "id": i,
+            "room_id": "dmid:1:2",
+            "sender": "alice",
+            "sender_id": 1,
+            "recipient_id": 2,
+            "content": f"message numéro {i} " * 4,
+            "created_at": now,
+        }
+        for i in range(n)
+    ]
+    users = [
+        SimpleNamespace(id=i, username=f"user{i:06d}", is_admin=False, public_key="k" * 400)
+        for i in range(n)
+    ]
+    return msgs, users
+
+
+def _old_messages(rows: list[dict]) -> bytes:
+    items = [MessageOutDetailed(**r) for r in rows]
+    validated = MESSAGES_ADAPTER.validate_python(items)  # response_model
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def _new_messages(rows: list[dict]) -> bytes:
+    items = [MessageOutDetailed.model_construct(**r) for r in rows]
+    return json_list_response(MESSAGES_ADAPTER, items).body
+
+
+def _old_users(rows: list[SimpleNamespace]) -> bytes:
+    items = [UserPublic.model_validate(u) for u in rows]
+    validated = USERS_ADAPTER.validate_python(items)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def _new_users(rows: list[SimpleNamespace]) -> bytes:
+    return json_list_response(USERS_ADAPTER, [user_public(u) for u in rows]).body
+
+
+def _per_row_us(fn: Callable, rows: list, repeat: int) -> float:
+    fn(rows)  # échauffement
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.perf_counter() - start) / (repeat * len(rows)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    msgs, users = _rows(args.rows)
+    assert json.loads(_old_messages(msgs)) == json.loads(_new_messages(msgs))
+    assert json.loads(_old_users(users)) == json.loads(_new_users(users))
+
+    report = {}
+    for name, old, new, rows in (
+        ("messages", _old_messages, _new_messages, msgs),
+        ("users", _old_users, _new_users, users),
+    ):
+        before = _per_row_us(old, rows, args.repeat)
+        after = _per_row_us(new, rows, args.repeat)
+        report[name] = {
+            "rows": args.rows,
+            "before_us_per_row": round(before, 3),
+            "after_us_per_row": round(after, 3),
+            "speedup": round(before / after, 2),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Débit d'écriture des messages selon MESSAGE_SHARDS (un verrou d'écriture par fichier).
+
+Pour chaque nombre de shards : DATA_DIR neuf, schéma créé, puis `--writers` processus lancés
+ensemble écrivent chacun `--messages` messages (une transaction par message, comme
+`post_message`) dans des rooms tirées au hasard. Contenu pré-chiffré : on mesure le stockage,
+pas Fernet. Mesurer sur le disque de production (--dir), le coût d'un commit étant
+surtout celui de la synchronisation disque.
+
+    python -m bench.shard_writes --shards 0 2 4 8 --writers 8 --messages 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Processus fils : création du schéma (et des shards)
+_SETUP = r"""
+from app.database import engine
+from app.migrations import run_migrations
+from app.shards import init_shards
+run_migrations(engine)
+init_shards()
+"""
+
+# Processus fils : un écrivain ; imprime une ligne JSON
+_WRITER = r"""
+import json, random, sys, time
+from sqlalchemy.exc import OperationalError
+from app.crypto import encrypt_text
+from app.models import Message
+from app.shards import room_session
+
+messages, rooms, seed = (int(a) for a in sys.argv[1:4])
+start_at = float(sys.argv[4])
+rng = random.Random(seed)
+pool = [encrypt_text(f"message {i} " + "lorem ipsum " * 6) for i in range(32)]
+time.sleep(max(0.0, start_at - time.time()))
+t0, busy = time.time(), 0
+for i in range(messages):
+    room = f"room-{rng.randrange(rooms)}"
+    while True:
+        db = room_session(room)
+        try:
+            db.add(Message(room_id=room, sender_id=1, content=pool[i % len(pool)]))
+            db.commit()
+            break
+        except OperationalError:  # "database is locked" après le délai d'attente SQLite
+            db.rollback()
+            busy += 1
+        finally:
+            db.close()
+print(json.dumps({"t0": t0, "t1": time.time(), "busy": busy}))
+"""
+
+
+def _env(data_dir: str, shards: int) -> dict:
+    env = {**os.environ, "DATA_DIR": data_dir, "MESSAGE_SHARDS": str(shards)}
+    env.update(METRICS_ENABLED="false", MESSAGE_SEARCH_ENABLED="false")
+    env.pop("DATABASE_URL", None)
+    env.pop("SHARDS_DIR", None)
+    return env
+
+
+def run_case(base_dir: str, shards: int, writers: int, messages: int, rooms: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="offcom-shards-", dir=base_dir) as data_dir:
+        env = _env(data_dir, shards)
+        subprocess.run([sys.executable, "-c", _SETUP], cwd=PROJECT_ROOT, env=env, check=True)
+        start_at = time.time() + 2.0  # laisse le temps aux imports de tous les écrivains
+        procs = [
+            subprocess.Popen(
+                [sys.executable, "-c", _WRITER, str(messages), str(rooms), str(i), str(start_at)],
+                cwd=PROJECT_ROOT,
+                env=env,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            for i in range(writers)
+        ]
+        results = []
+        for p in procs:
+            out, _ = p.communicate()
+            if p.returncode:
+                raise RuntimeError(f"écrivain en échec (code {p.returncode})")
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    elapsed = max(r["t1"] for r in results) - min(r["t0"] for r in results)
+    total = writers * messages
+    return {
+        "shards": shards,
+        "files": max(shards, 1),
+        "messages": total,
+        "seconds": round(elapsed, 2),
+        "messages_per_s": round(total / elapsed, 1),
+        "busy_retries": sum(r["busy"] for r in results),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 2, 4, 8])
+    parser.add_argument("--writers", type=int, default=8, help="Processus écrivains simultanés")
+    parser.add_argument("--messages", type=int, default=300, help="Messages par écrivain")
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--dir", default=None, help="Répertoire des bases (défaut : temporaire)")
+    args = parser.parse_args()
+
+    cases = [run_case(args.dir, n, args.writers, args.messages, args.rooms) for n in args.shards]
+    baseline = cases[0]["messages_per_s"]
+    for case in cases:
+        case["speedup"] = round(case["messages_per_s"] / baseline, 2)
+    print(json.dumps({"writers": args.writers, "cpus": os.cpu_count(), "cases": cases}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
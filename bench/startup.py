@@ -0,0 +1,84 @@
+"""Temps de démarrage : import de app.main, puis lifespan (migrations + préchauffage).
+
+Chaque mesure tourne dans un processus neuf (imports et caches froids), sur un DATA_DIR
+temporaire : d'abord base vide (toutes les migrations), puis base déjà à jour (lecture de
+user_version seulement). Le temps jusqu'à la première requête est mesuré aussi.
+
+    python -m bench.startup --runs 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Exécuté dans le processus fils ; imprime une ligne JSON
+_CHILD = r"""
+import asyncio, json, time
+import httpx
+t0 = time.perf_counter()
+from app.main import app
+t1 = time.perf_counter()
+
+async def _run():
+    async with app.router.lifespan_context(app):
+        t2 = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.get("/openapi.json")).raise_for_status()
+        t3 = time.perf_counter()
+    return t2, t3
+
+t2, t3 = asyncio.run(_run())
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "lifespan_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    **app.state.startup,
+}))
+"""
+
+
+def _measure(data_dir: str) -> dict:
+    env = {**os.environ, "DATA_DIR": data_dir, "METRICS_ENABLED": "false"}
+    env.pop("DATABASE_URL", None)
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        cwd=PROJECT_ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _summary(samples: list[dict]) -> dict:
+    keys = ("import_ms", "lifespan_ms", "migrations_ms", "warm_up_ms", "first_request_ms")
+    return {k: round(statistics.median(s[k] for s in samples), 1) for k in keys}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    fresh, current = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="offcom-startup-") as work:
+            data_dir = os.path.join(work, "data")  # n'existe pas encore
+            fresh.append(_measure(data_dir))
+            current.append(_measure(data_dir))
+    report = {"fresh_db": _summary(fresh), "current_db": _summary(current)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
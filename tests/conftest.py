@@ -0,0 +1,83 @@
+"""Configuration commune des tests.
+
+La configuration (app/config.py) est lue à l'import : les variables d'environnement sont donc
+posées ici, avant tout import de `app`. Base, clés, archive et pièces jointes vivent dans un
+répertoire temporaire propre à la session ; data/ n'est jamais touché. Les tests in-process
+tournent sur la base unique (MESSAGE_SHARDS=0), recherche activée.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import uuid
+from typing import Callable, Optional
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# Chemins dérivés de DATA_DIR : aucune valeur héritée du shell ne doit pointer ailleurs
+for _name in (
+    "DATABASE_URL",
+    "MESSAGE_KEY_FILE",
+    "SEARCH_KEY_FILE",
+    "BACKUP_DIR",
+    "ATTACHMENTS_DIR",
+    "SHARDS_DIR",
+    "ARCHIVE_DIR",
+    "LEADER_LOCK_FILE",
+):
+    os.environ.pop(_name, None)
+os.environ.update(
+    DATA_DIR=tempfile.mkdtemp(prefix="offcom-tests-"),
+    MESSAGE_SHARDS="0",
+    MESSAGE_SEARCH_ENABLED="true",
+)
+
+PASSWORD = "secret123"
+
+Register = Callable[..., tuple[int, dict[str, str]]]
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as c:  # lifespan : migrations, clés, tâches de fond
+        yield c
+
+
+@pytest.fixture
+def register(client) -> Register:
+    """Crée un compte (nom unique par défaut) ; renvoie (id, en-têtes d'authentification)."""
+
+    def _register(name: Optional[str] = None) -> tuple[int, dict[str, str]]:
+        name = name or f"u{uuid.uuid4().hex[:12]}"
+        resp = client.post("/auth/register", json={"username": name, "password": PASSWORD})
+        assert resp.status_code == 201, resp.text
+        token = client.post("/auth/login", json={"username": name, "password": PASSWORD}).json()
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+        return client.get("/auth/me", headers=headers).json()["id"], headers
+
+    return _register
+
+
+@pytest.fixture
+def admin(register: Register) -> dict[str, str]:
+    """En-têtes d'un nouveau compte administrateur."""
+    from sqlalchemy import update
+
+    from app.database import SessionLocal
+    from app.models import User
+
+    user_id, headers = register()
+    with SessionLocal() as db:
+        db.execute(update(User).where(User.id == user_id).values(is_admin=True))
+        db.commit()
+    return headers
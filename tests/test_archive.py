@@ -0,0 +1,110 @@
+"""Archive froide (app/archive.py) : historique inchangé, identifiants jamais réattribués, TTL
+respecté."""
+
+from __future__ import annotations
+
+import json
+import uuid
+
+from sqlalchemy import func, select, text
+
+from app.config import GLOBAL_MESSAGE_TTL_MIN
+from app.database import SessionLocal
+from app.main import _archive_old_messages, _purge_expired_messages
+from app.models import ArchiveSegment, Message
+
+
+def _age_room(room_id: str, days: int = 2) -> None:
+    """Antidate les messages de la room (au-delà de ARCHIVE_HOT_MIN)."""
+    with SessionLocal() as db:
+        db.execute(
+            text("UPDATE messages SET created_at = datetime('now', :shift) WHERE room_id = :room"),
+            {"shift": f"-{days} days", "room": room_id},
+        )
+        db.commit()
+
+
+def _post(client, headers, room_id: str, content: str) -> dict:
+    resp = client.post(f"/rooms/{room_id}/messages", json={"content": content}, headers=headers)
+    assert resp.status_code == 201, resp.text
+    return resp.json()
+
+
+def test_history_reads_archive_then_hot(client, register):
+    _, alice = register()
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    old = [_post(client, alice, room, f"ancien {i}")["id"] for i in range(5)]
+    _age_room(room)
+    assert _archive_old_messages() >= 5
+    new = _post(client, alice, room, "récent")["id"]
+
+    history = client.get(f"/rooms/{room}/messages?limit=100", headers=alice).json()
+    assert [m["id"] for m in history] == old + [new]
+    assert history[0]["content"] == "ancien 0"
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).where(Message.room_id == room)) == 1
+        assert db.scalar(select(ArchiveSegment.last_id).where(ArchiveSegment.room_id == room)) == (
+            old[-1]
+        )
+
+
+def test_archived_ids_are_never_reused(client, register, admin):
+    """Régression : messages vidé par l'archive puis par la suppression de l'auteur du plus
+    récent message chaud ; SQLite ne doit pas réattribuer les identifiants archivés (sinon
+    doublons dans l'historique, et 500 sur message_tokens avec la recherche activée)."""
+    _, alice = register()
+    bob_id, bob = register()
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    archived = [_post(client, alice, room, f"pomme {i}")["id"] for i in range(3)]
+    _age_room(room)
+    assert _archive_old_messages() >= 3
+    # Le plus grand identifiant de la base appartient à bob, puis disparaît avec lui
+    newest = _post(client, bob, f"room-{uuid.uuid4().hex[:8]}", "dernier")["id"]
+    assert client.delete(f"/admin/users/{bob_id}", headers=admin).status_code == 202
+    with SessionLocal() as db:
+        assert db.get(Message, newest) is None
+
+    fresh = _post(client, alice, room, "pomme fraîche")
+    assert fresh["id"] > newest > max(archived)
+    history = client.get(f"/rooms/{room}/messages?limit=100", headers=alice).json()
+    ids = [m["id"] for m in history]
+    assert ids == archived + [fresh["id"]]
+    found = client.get(f"/rooms/{room}/search?q=pomme", headers=alice).json()
+    assert sorted(m["id"] for m in found) == sorted(ids)
+
+
+def test_archived_messages_past_ttl_are_neither_served_nor_exported(client, register, admin):
+    """Régression : messages de 12, 11 et 1 jour(s) archivés en une passe (TTL : 10 jours). Les
+    deux premiers ne doivent plus être servis ni exportés, et la purge doit les supprimer."""
+    assert GLOBAL_MESSAGE_TTL_MIN == 10 * 24 * 60
+    _, alice = register()
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    posted = {days: _post(client, alice, room, f"cerise {days}")["id"] for days in (12, 11, 1)}
+    with SessionLocal() as db:
+        for days, message_id in posted.items():
+            db.execute(
+                text("UPDATE messages SET created_at = datetime('now', :shift) WHERE id = :id"),
+                {"shift": f"-{days} days", "id": message_id},
+            )
+        db.commit()
+    assert _archive_old_messages() >= 3
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).where(ArchiveSegment.room_id == room)) == 3
+
+    live = [posted[1]]
+    history = client.get(f"/rooms/{room}/messages?limit=100", headers=alice).json()
+    assert [m["id"] for m in history] == live
+    found = client.get(f"/rooms/{room}/search?q=cerise", headers=alice).json()
+    assert [m["id"] for m in found] == live
+    lines = client.get(f"/rooms/{room}/export", headers=alice).text.splitlines()
+    assert [json.loads(line)["id"] for line in lines if line] == live
+    lines = client.get("/admin/export/messages", headers=admin).text.splitlines()
+    exported = {json.loads(line)["id"] for line in lines if line}
+    assert posted[1] in exported and not exported & {posted[12], posted[11]}
+
+    assert _purge_expired_messages() >= 2
+    with SessionLocal() as db:
+        assert (
+            db.scalars(select(ArchiveSegment.last_id).where(ArchiveSegment.room_id == room)).all()
+            == live
+        )
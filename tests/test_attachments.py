@@ -0,0 +1,64 @@
+"""Pièces jointes : envoi par blocs et ramasse-miettes (app/attachments.py)."""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.attachments import gc_attachments
+from app.database import SessionLocal
+from app.main import _archive_old_messages
+
+
+def _upload(client, headers, data: bytes) -> int:
+    up = client.post(
+        "/attachments/uploads",
+        json={"size": len(data), "filename": "note.txt", "content_type": "text/plain"},
+        headers=headers,
+    ).json()
+    resp = client.put(
+        f"/attachments/uploads/{up['upload_id']}/chunks/0", content=data, headers=headers
+    )
+    assert resp.status_code == 204
+    resp = client.post(f"/attachments/uploads/{up['upload_id']}/complete", headers=headers)
+    assert resp.status_code == 201, resp.text
+    return resp.json()["id"]
+
+
+def test_oversized_chunk_is_rejected_without_content_length(client, register):
+    _, alice = register()
+    up = client.post(
+        "/attachments/uploads", json={"size": 10, "filename": "a.bin"}, headers=alice
+    ).json()
+    url = f"/attachments/uploads/{up['upload_id']}/chunks/0"
+    # Générateur : corps envoyé en Transfer-Encoding: chunked, sans Content-Length
+    resp = client.put(url, content=(b"x" * 1000 for _ in range(50)), headers=alice)
+    assert resp.status_code == 413
+    assert client.put(url, content=iter([b"0123456789"]), headers=alice).status_code == 204
+
+
+def test_gc_keeps_attachments_referenced_from_archive(client, register):
+    _, alice = register()
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    archived = _upload(client, alice, b"archive")
+    orphan = _upload(client, alice, b"orpheline")
+    resp = client.post(
+        f"/rooms/{room}/messages", json={"content": "pj", "attachment_id": archived}, headers=alice
+    )
+    assert resp.status_code == 201
+    with SessionLocal() as db:
+        db.execute(
+            text("UPDATE messages SET created_at = datetime('now', '-2 days') WHERE room_id = :r"),
+            {"r": room},
+        )
+        db.commit()
+    assert _archive_old_messages() >= 1
+
+    with SessionLocal() as db:  # délai de grâce écoulé pour toutes les pièces jointes
+        report = gc_attachments(db, datetime.now(timezone.utc) + timedelta(days=1))
+    assert report["attachments"] >= 1
+    resp = client.get(f"/attachments/{archived}", headers=alice)
+    assert resp.status_code == 200 and resp.content == b"archive"
+    assert client.get(f"/attachments/{orphan}", headers=alice).status_code == 404
@@ -0,0 +1,42 @@
+"""Rooms de groupe (app/groups.py) : membres en cache, diffusion des événements éphémères."""
+
+from __future__ import annotations
+
+import asyncio
+
+from app.events import EphemeralHub
+from app.groups import room_members
+from app.schemas import EphemeralEventIn
+
+
+def test_ephemeral_events_reach_current_members_only(client, register):
+    alice_id, alice = register()
+    bob_id, bob = register()
+    group = client.post("/groups", json={"name": "Équipe", "private": False}, headers=alice).json()
+    room = group["room_id"]
+    assert client.post(f"/groups/{group['id']}/join", headers=bob).status_code == 200
+    assert room_members(room) == {alice_id, bob_id}
+
+    async def scenario() -> tuple[list, list]:
+        hub = EphemeralHub()
+        # bob écoute, alice écrit : bob, membre, reçoit le signal
+        listening = asyncio.create_task(hub.poll(room, bob_id, 0, 2))
+        await asyncio.sleep(0.05)
+        assert hub.publish(room, alice_id, EphemeralEventIn(type="typing")) == "delivered"
+        received, cursor = await listening
+        # bob quitte le groupe pendant un long-polling : le signal suivant ne lui parvient pas
+        listening = asyncio.create_task(hub.poll(room, bob_id, cursor, 2))
+        await asyncio.sleep(0.05)
+        assert client.post(f"/groups/{group['id']}/leave", headers=bob).status_code == 204
+        assert hub.publish(room, alice_id, EphemeralEventIn(type="seen", message_id=1)) == (
+            "delivered"
+        )
+        after_leaving, _ = await asyncio.wait_for(listening, 1)
+        return received, after_leaving
+
+    received, after_leaving = asyncio.run(scenario())
+    assert [(e.type, e.sender_id) for e in received] == [("typing", alice_id)]
+    assert after_leaving == []
+    assert room_members(room) == {alice_id}
+    # Côté routes, l'accès est refusé dès le départ
+    assert client.get(f"/rooms/{room}/events?timeout_s=0", headers=bob).status_code == 403
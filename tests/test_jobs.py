@@ -0,0 +1,55 @@
+"""Suppression d'un utilisateur en tâche de fond (app/jobs.py, DELETE /admin/users/{id})."""
+
+from __future__ import annotations
+
+import uuid
+
+from sqlalchemy import func, select, text
+
+from app.database import SessionLocal
+from app.main import _archive_old_messages
+from app.models import ArchiveSender, Connection, Message, MessageToken, User
+
+
+def _post(client, headers, room_id: str, content: str) -> int:
+    resp = client.post(f"/rooms/{room_id}/messages", json={"content": content}, headers=headers)
+    assert resp.status_code == 201, resp.text
+    return resp.json()["id"]
+
+
+def test_user_deletion_job_removes_hot_and_archived_messages(client, register, admin):
+    victim_id, victim = register()
+    _, other = register()
+    cold = f"room-{uuid.uuid4().hex[:8]}"
+    hot = f"room-{uuid.uuid4().hex[:8]}"
+    for i in range(4):  # segment partagé : il sera réécrit sans les messages de la victime
+        _post(client, victim if i % 2 else other, cold, f"mangue {i}")
+    with SessionLocal() as db:
+        db.execute(
+            text("UPDATE messages SET created_at = datetime('now', '-2 days') WHERE room_id = :r"),
+            {"r": cold},
+        )
+        db.commit()
+    assert _archive_old_messages() >= 4
+    victim_ids = [_post(client, victim, hot, "mangue chaude")]
+    kept = _post(client, other, hot, "mangue restante")
+
+    resp = client.delete(f"/admin/users/{victim_id}", headers=admin)
+    assert resp.status_code == 202
+    job = client.get(f"/admin/jobs/{resp.json()['id']}", headers=admin).json()
+    assert job["status"] == "done"
+    assert job["progress"]["messages"] == 1 and job["progress"]["archive_segments"] == 1
+
+    assert client.get("/auth/me", headers=victim).status_code == 401
+    assert client.delete(f"/admin/users/{victim_id}", headers=admin).status_code == 404
+    assert [m["id"] for m in client.get(f"/rooms/{hot}/messages", headers=other).json()] == [kept]
+    archived = client.get(f"/rooms/{cold}/messages", headers=other).json()
+    assert [m["content"] for m in archived] == ["mangue 0", "mangue 2"]
+    found = client.get(f"/rooms/{hot}/search?q=mangue", headers=other).json()
+    assert [m["id"] for m in found] == [kept]
+    with SessionLocal() as db:
+        assert db.get(User, victim_id) is None
+        assert db.scalar(select(func.count()).where(Message.sender_id == victim_id)) == 0
+        assert db.scalar(select(func.count()).where(MessageToken.message_id.in_(victim_ids))) == 0
+        assert db.scalar(select(func.count()).where(ArchiveSender.sender_id == victim_id)) == 0
+        assert db.scalar(select(func.count()).where(Connection.owner_id == victim_id)) == 0
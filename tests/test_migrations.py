@@ -0,0 +1,80 @@
+"""Migrations (app/migrations.py) : une base d'avant le versionnage est mise à niveau sans perte."""
+
+from __future__ import annotations
+
+import sqlite3
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app.migrations import LATEST_VERSION, run_migrations
+from app.models import Message, User
+
+# Schéma d'origine (sans PRAGMA user_version), tel que le créait create_all
+_BASELINE = """
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    username VARCHAR(64) NOT NULL,
+    password_hash VARCHAR(256) NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    token_version INTEGER NOT NULL,
+    public_key VARCHAR(2048),
+    is_admin BOOLEAN NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE TABLE messages (
+    id INTEGER NOT NULL,
+    room_id VARCHAR(128) NOT NULL,
+    sender_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(sender_id) REFERENCES users (id) ON DELETE CASCADE
+);
+CREATE INDEX ix_messages_room_id ON messages (room_id);
+CREATE INDEX ix_messages_sender_id ON messages (sender_id);
+CREATE INDEX idx_messages_room_ts ON messages (room_id, created_at);
+CREATE INDEX ix_messages_created_at ON messages (created_at);
+CREATE TABLE connections (
+    id INTEGER NOT NULL,
+    owner_id INTEGER NOT NULL,
+    peer_id INTEGER,
+    transport VARCHAR(32) NOT NULL,
+    address VARCHAR(128) NOT NULL,
+    last_seen DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(owner_id) REFERENCES users (id)
+);
+CREATE INDEX ix_connections_owner_id ON connections (owner_id);
+INSERT INTO users (id, username, password_hash, token_version, public_key, is_admin)
+VALUES (1, 'alice', 'x', 0, 'clé-publique', 0);
+INSERT INTO messages (id, room_id, sender_id, content, created_at)
+VALUES (7, 'local', 1, 'chiffré', '2024-01-01 00:00:00');
+"""
+
+
+def test_baseline_database_is_upgraded(tmp_path):
+    path = tmp_path / "offcom.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(_BASELINE)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        assert run_migrations(engine) == LATEST_VERSION
+        # Colonnes ajoutées par ALTER TABLE (users.public_key_version…) : le modèle se charge
+        with Session(engine) as db:
+            alice = db.get(User, 1)
+            assert (alice.public_key, alice.public_key_version) == ("clé-publique", 0)
+            assert [m.id for m in db.scalars(select(Message))] == [7]
+            db.add(Message(room_id="local", sender_id=1, content="nouveau"))
+            db.commit()
+            assert db.scalar(select(Message.id).where(Message.content == "nouveau")) == 8
+        # Rejouer les migrations sur une base à jour ne change rien
+        assert run_migrations(engine) == LATEST_VERSION
+    finally:
+        engine.dispose()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == LATEST_VERSION
+        ddl = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages'").fetchone()[0]
+        assert "AUTOINCREMENT" in ddl
@@ -0,0 +1,37 @@
+"""Budget de requêtes SQL (app/profiler.py) sur l'historique d'une room."""
+
+from __future__ import annotations
+
+import uuid
+
+import pytest
+
+from app.profiler import QueryBudgetExceeded, assert_query_budget
+
+SENDERS = 6
+# Utilisateur courant, last_seen (connections), index de l'archive, messages
+_BASE_QUERIES = 4
+
+
+def test_room_history_query_budget(client, register):
+    users = [register() for _ in range(SENDERS)]
+    reader = users[0][1]
+    room = f"room-{uuid.uuid4().hex[:8]}"
+    for _, headers in users:
+        resp = client.post(f"/rooms/{room}/messages", json={"content": "salut"}, headers=headers)
+        assert resp.status_code == 201, resp.text
+    url = f"/rooms/{room}/messages"
+    assert len(client.get(url, headers=reader).json()) == SENDERS  # marque de la room en cache
+
+    # _to_detailed lit chaque autre expéditeur par db.get(User, …) : le N+1 de list_messages
+    budget = _BASE_QUERIES + SENDERS - 1
+    with pytest.raises(QueryBudgetExceeded) as exc:
+        with assert_query_budget(budget - 1):
+            client.get(url, headers=reader)
+    report = str(exc.value)
+    assert report.startswith(f"{budget} requêtes SQL (budget {budget - 1})")
+    assert f"{SENDERS - 1}× SELECT users." in report  # forme répétée : la boucle est nommée
+
+    with assert_query_budget(budget) as statements:
+        assert client.get(url, headers=reader).status_code == 200
+    assert len(statements) == budget
@@ -0,0 +1,268 @@
+"""Messages répartis sur plusieurs fichiers SQLite (app/shards.py, MESSAGE_SHARDS).
+
+La configuration est lue à l'import : chaque phase tourne dans un interpréteur neuf (ce même
+fichier lancé en script), sur un DATA_DIR commun. Phase 1 sans shards (messages, archive et
+pièce jointe dans la base principale), phase 2 avec MESSAGE_SHARDS=4 : déplacement au
+démarrage, puis routage, lectures fusionnées, ramasse-miettes et suppression d'un utilisateur.
+Chaque phase écrit un rapport JSON que les tests vérifient.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+SHARDS = 4
+# Créés dans cet ordre par la phase 1 : alice = 1, bob = 2, carol = 3
+ROOMS = {"dmid:1:2": "alice", "dmid:1:3": "alice", "dmid:2:3": "bob", "local": "carol"}
+ARCHIVED_ROOM = "dmid:1:3"  # antidatée puis archivée avant le passage aux shards
+PASSWORD = "secret123"
+
+
+def _run_phase(data_dir: str, phase: str, shards: int, previous: dict | None = None) -> dict:
+    env = {k: v for k, v in os.environ.items() if not k.endswith(("_DIR", "_FILE", "_URL"))}
+    env.update(DATA_DIR=data_dir, MESSAGE_SHARDS=str(shards), MESSAGE_SEARCH_ENABLED="true")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), phase, json.dumps(previous or {})],
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert proc.returncode == 0, proc.stderr[-4000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+@pytest.fixture(scope="module")
+def phases(tmp_path_factory) -> tuple[dict, dict]:
+    data_dir = str(tmp_path_factory.mktemp("sharded"))
+    legacy = _run_phase(data_dir, "legacy", 0)
+    sharded = _run_phase(data_dir, "sharded", SHARDS, legacy)
+    return legacy, sharded
+
+
+def test_legacy_messages_move_to_their_shard_on_startup(phases):
+    legacy, sharded = phases
+    assert sharded["main_left"] == {"messages": 0, "message_tokens": 0, "archive_segments": 0}
+    for room, ids in legacy["ids"].items():
+        assert sharded["history_before_posts"][room] == ids  # identifiants conservés
+        home = sharded["shard_of"][room]
+        assert sharded["rows_per_shard"][room][home] == len(ids)
+        assert sum(sharded["rows_per_shard"][room]) == len(ids)
+    assert sharded["segments_per_shard"][sharded["shard_of"][ARCHIVED_ROOM]] == 1
+    assert sharded["search_legacy"] == legacy["ids"]["dmid:1:2"]
+    assert sharded["search_archived"] == legacy["ids"][ARCHIVED_ROOM][:-1]  # jetons déplacés
+
+
+def test_new_messages_are_routed_by_room(phases):
+    legacy, sharded = phases
+    assert len(set(sharded["shard_of"].values())) > 1  # le jeu couvre plusieurs shards
+    floor = max(max(ids) for ids in legacy["ids"].values())
+    for room, posted in sharded["posted"].items():
+        home = sharded["shard_of"][room]
+        assert posted["found_in"] == [home]
+        assert posted["id"] > floor and posted["id"] >> 40 == home  # plage du shard
+
+
+def test_my_rooms_and_exports_merge_all_shards(phases):
+    legacy, sharded = phases
+    assert sharded["my_rooms"] == {
+        "alice": ["dmid:1:2", "dmid:1:3"],
+        "bob": ["dmid:1:2", "dmid:2:3"],
+        "carol": ["dmid:1:3", "dmid:2:3", "local"],  # dmid:1:3 : seulement dans l'archive
+    }
+    everything = [i for ids in legacy["ids"].values() for i in ids]
+    everything += [p["id"] for p in sharded["posted"].values()]
+    # Archive d'abord (plus ancienne), puis les messages chauds fusionnés par id
+    archived = legacy["ids"][ARCHIVED_ROOM]
+    hot = sorted(set(everything) - set(archived))
+    assert sharded["global_export"] == archived + hot
+    assert sharded["room_export"] == legacy["ids"][ARCHIVED_ROOM] + [
+        sharded["posted"][ARCHIVED_ROOM]["id"]
+    ]
+
+
+def test_attachment_gc_checks_every_shard_and_the_archive(phases):
+    _, sharded = phases
+    gc = sharded["gc"]
+    assert gc["archived"] == 200  # référencée seulement par un segment d'archive
+    assert gc["other_shard"] == 200  # référencée par un message d'un autre shard que le 0
+    assert gc["orphan"] == 404
+    assert gc["deleted"] == 1
+
+
+def test_user_deletion_reaches_every_shard(phases):
+    _, sharded = phases
+    deletion = sharded["delete_bob"]
+    assert deletion["status"] == "done"
+    assert deletion["left_per_shard"] == [0] * SHARDS
+    assert deletion["dm_2_3"] == [] and deletion["bob_in_dm_1_2"] == 0
+
+
+# ─────────────────────────── Phases (interpréteur séparé) ───────────────────────────
+def _login(client, name: str) -> dict[str, str]:
+    client.post("/auth/register", json={"username": name, "password": PASSWORD})
+    token = client.post("/auth/login", json={"username": name, "password": PASSWORD}).json()
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+def _post(client, headers, room: str, content: str, attachment_id=None) -> int:
+    payload = {"content": content, "attachment_id": attachment_id}
+    resp = client.post(f"/rooms/{room}/messages", json=payload, headers=headers)
+    assert resp.status_code == 201, resp.text
+    return resp.json()["id"]
+
+
+def _upload(client, headers, data: bytes) -> int:
+    up = client.post(
+        "/attachments/uploads", json={"size": len(data), "filename": "f.bin"}, headers=headers
+    ).json()
+    url = f"/attachments/uploads/{up['upload_id']}"
+    client.put(f"{url}/chunks/0", content=data, headers=headers)
+    return client.post(f"{url}/complete", headers=headers).json()["id"]
+
+
+def _phase_legacy(client, users, previous: dict) -> dict:
+    from sqlalchemy import text
+
+    from app.database import SessionLocal
+    from app.main import _archive_old_messages
+
+    ids: dict[str, list[int]] = {}
+    attachment = _upload(client, users["alice"], b"archive")
+    for room, sender in ROOMS.items():
+        ids[room] = [_post(client, users[sender], room, f"ancien bonjour {i}") for i in range(3)]
+    ids[ARCHIVED_ROOM].append(_post(client, users["alice"], ARCHIVED_ROOM, "pj", attachment))
+    with SessionLocal() as db:
+        db.execute(
+            text("UPDATE messages SET created_at = datetime('now', '-2 days') WHERE room_id = :r"),
+            {"r": ARCHIVED_ROOM},
+        )
+        db.commit()
+    assert _archive_old_messages() == len(ids[ARCHIVED_ROOM])
+    return {"ids": ids, "attachment": attachment}
+
+
+def _count_in_shards(sql: str, *params) -> list[int]:
+    import sqlite3
+
+    from app.shards import shard_paths
+
+    counts = []
+    for path in shard_paths():
+        with sqlite3.connect(path) as conn:
+            counts.append(conn.execute(sql, params).fetchone()[0])
+    return counts
+
+
+def _phase_sharded(client, users, legacy: dict) -> dict:
+    import sqlite3
+    from datetime import datetime, timedelta, timezone
+
+    from sqlalchemy import update
+
+    from app.attachments import gc_attachments
+    from app.backup import sqlite_db_path
+    from app.database import SessionLocal
+    from app.models import User
+    from app.shards import SHARDED, shard_index
+
+    assert SHARDED
+    alice, bob = users["alice"], users["bob"]
+    report: dict = {"shard_of": {room: shard_index(room) for room in ROOMS}}
+    with sqlite3.connect(sqlite_db_path()) as conn:
+        report["main_left"] = {
+            table: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+            for table in ("messages", "message_tokens", "archive_segments")
+        }
+    report["history_before_posts"] = {
+        room: [m["id"] for m in client.get(f"/rooms/{room}/messages", headers=users[s]).json()]
+        for room, s in ROOMS.items()
+    }
+    report["rows_per_shard"] = {
+        room: [
+            m + a
+            for m, a in zip(
+                _count_in_shards("SELECT count(*) FROM messages WHERE room_id = ?", room),
+                _count_in_shards(
+                    "SELECT coalesce(sum(count), 0) FROM archive_segments WHERE room_id = ?", room
+                ),
+            )
+        ]
+        for room in ROOMS
+    }
+    report["segments_per_shard"] = _count_in_shards("SELECT count(*) FROM archive_segments")
+    found = client.get("/rooms/dmid:1:2/search?q=bonjour", headers=alice).json()
+    report["search_legacy"] = [m["id"] for m in found]
+    found = client.get(f"/rooms/{ARCHIVED_ROOM}/search?q=bonjour", headers=alice).json()
+    report["search_archived"] = [m["id"] for m in found]
+
+    # Routage : un nouveau message par room, dans le seul shard de la room
+    report["posted"] = {}
+    for room, sender in ROOMS.items():
+        new_id = _post(client, users[sender], room, "nouveau")
+        present = _count_in_shards("SELECT count(*) FROM messages WHERE id = ?", new_id)
+        report["posted"][room] = {"id": new_id, "found_in": [i for i, n in enumerate(present) if n]}
+
+    report["my_rooms"] = {
+        name: client.get("/rooms/my-rooms", headers=headers).json()
+        for name, headers in users.items()
+    }
+    with SessionLocal() as db:
+        db.execute(update(User).where(User.username == "alice").values(is_admin=True))
+        db.commit()
+    lines = client.get("/admin/export/messages", headers=alice).text.splitlines()
+    report["global_export"] = [json.loads(line)["id"] for line in lines if line]
+    lines = client.get(f"/rooms/{ARCHIVED_ROOM}/export", headers=alice).text.splitlines()
+    report["room_export"] = [json.loads(line)["id"] for line in lines if line]
+
+    # Ramasse-miettes : références dans un shard quelconque et dans l'archive
+    other_shard = next(r for r, s in ROOMS.items() if s == "bob" and shard_index(r) != 0)
+    in_use = _upload(client, bob, b"shard")
+    _post(client, bob, other_shard, "pj", in_use)
+    orphan = _upload(client, bob, b"orpheline")
+    with SessionLocal() as db:
+        deleted = gc_attachments(db, datetime.now(timezone.utc) + timedelta(days=1))
+    report["gc"] = {
+        "deleted": deleted["attachments"],
+        "archived": client.get(f"/attachments/{legacy['attachment']}", headers=alice).status_code,
+        "other_shard": client.get(f"/attachments/{in_use}", headers=bob).status_code,
+        "orphan": client.get(f"/attachments/{orphan}", headers=bob).status_code,
+    }
+
+    # Suppression de bob : ses messages disparaissent de chaque shard
+    bob_id = client.get("/auth/me", headers=bob).json()["id"]
+    job = client.delete(f"/admin/users/{bob_id}", headers=alice).json()
+    report["delete_bob"] = {
+        "status": client.get(f"/admin/jobs/{job['id']}", headers=alice).json()["status"],
+        "left_per_shard": _count_in_shards(
+            "SELECT count(*) FROM messages WHERE sender_id = ?", bob_id
+        ),
+        "dm_2_3": client.get("/rooms/dmid:2:3/messages", headers=users["carol"]).json(),
+        "bob_in_dm_1_2": sum(
+            m["sender_id"] == bob_id
+            for m in client.get("/rooms/dmid:1:2/messages", headers=alice).json()
+        ),
+    }
+    return report
+
+
+def main(phase: str, previous: dict) -> None:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        users = {name: _login(client, name) for name in ("alice", "bob", "carol")}
+        run = _phase_legacy if phase == "legacy" else _phase_sharded
+        report = run(client, users, previous)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], json.loads(sys.argv[2]))